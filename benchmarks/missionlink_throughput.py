@@ -0,0 +1,124 @@
+"""Débito do servidor MissionLink em datagramas por segundo.
+
+Arranca o servidor no próprio processo (modo 'thread' ou 'asyncio') e
+inunda-o com ML_UPDATE vindos de processos emissores durante alguns
+segundos. Conta quantos datagramas o servidor chegou a processar, quantas
+escritas no estado resultaram (em asyncio os updates são coalescidos) e o
+CPU gasto pelo servidor por datagrama.
+
+    python benchmarks/missionlink_throughput.py --mode thread
+    python benchmarks/missionlink_throughput.py --mode asyncio
+"""
+import sys, os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "navemae"))
+
+import argparse
+import contextlib
+import multiprocessing
+import socket
+import tempfile
+import threading
+import time
+
+# O estado da Nave-Mãe é gravado no diretório atual: usar um temporário
+os.chdir(tempfile.mkdtemp(prefix="ml_bench_"))
+
+from common.codec import encode_msg
+from common.protocol_constants import PROTOCOL_VERSION, ML_UPDATE
+import missionlink_server
+
+
+def _sender(port, seconds, index, rovers, sent):
+    """Processo emissor: manda ML_UPDATE o mais depressa possível, em nome
+    de 'rovers' rovers diferentes."""
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    rids = [f"B{index:03d}-{i:04d}" for i in range(rovers)]
+    n = 0
+    end = time.time() + seconds
+
+    while time.time() < end:
+        pkt = encode_msg(PROTOCOL_VERSION, 1, ML_UPDATE, n % 65536, {
+            "rover_id": rids[n % rovers], "mission_id": "M-001", "progress": 50.0,
+            "status": "in_progress", "position": [1.0, 2.0, 0.0],
+            "extra": {"display": "bench"},
+        })
+        sock.sendto(pkt, ("127.0.0.1", port))
+        n += 1
+
+    with sent.get_lock():
+        sent.value += n
+
+
+def run(mode, senders, seconds, port, rovers):
+    processed = 0
+    applied = 0
+    count_lock = threading.Lock()
+    original_handle = missionlink_server.handle_request
+    original_update = missionlink_server.update_mission
+    original_updates = missionlink_server.update_missions
+
+    def counting_handle(*args, **kwargs):
+        nonlocal processed
+        original_handle(*args, **kwargs)
+        with count_lock:
+            processed += 1
+
+    def counting_update(*args, **kwargs):
+        nonlocal applied
+        original_update(*args, **kwargs)
+        with count_lock:
+            applied += 1
+
+    def counting_updates(batch):
+        nonlocal applied
+        original_updates(batch)
+        with count_lock:
+            applied += len(batch)
+
+    missionlink_server.handle_request = counting_handle
+    missionlink_server.update_mission = counting_update
+    missionlink_server.update_missions = counting_updates
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        threading.Thread(target=missionlink_server.start_missionlink,
+                         args=(mode, ("127.0.0.1", port)), daemon=True).start()
+        time.sleep(0.5)
+
+        sent = multiprocessing.Value("q", 0)
+        procs = [multiprocessing.Process(target=_sender, args=(port, seconds, i, rovers, sent))
+                 for i in range(senders)]
+        cpu = time.process_time()   # Os emissores são outros processos: isto é o servidor
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        time.sleep(1.0)  # Deixar o servidor esvaziar o que ficou em fila
+        cpu = time.process_time() - cpu
+
+    print(f"modo={mode} emissores={senders} rovers={senders * rovers} duração={seconds}s")
+    print(f"  enviados:    {sent.value} ({sent.value / seconds:.0f}/s)")
+    print(f"  processados: {processed} ({processed / seconds:.0f}/s)")
+    print(f"  escritas no estado: {applied} ({applied / max(processed, 1):.1%} dos processados)")
+    print(f"  CPU do servidor: {cpu:.2f}s ({cpu / max(processed, 1) * 1e6:.1f} µs por datagrama)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=[missionlink_server.MODE_ASYNCIO, missionlink_server.MODE_THREAD],
+                        default=missionlink_server.DEFAULT_MODE)
+    parser.add_argument("--senders", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=15000)
+    parser.add_argument("--rovers", type=int, default=50, help="rovers simulados por emissor")
+    args = parser.parse_args()
+
+    run(args.mode, args.senders, args.seconds, args.port, args.rovers)
+
+
+if __name__ == "__main__":
+    main()
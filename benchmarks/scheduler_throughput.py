@@ -0,0 +1,186 @@
+"""Missões concluídas por rover-hora: escalonador da frota vs. atribuição manual.
+
+Simula a frota em tempo discreto (1 s por passo, sem rede): os rovers
+andam a ROVER_SPEED, gastam bateria com as taxas de common/energy.py, vão
+carregar abaixo dos limiares do rover e de vez em quando ficam offline. As
+missões chegam ao acaso por todo o mapa.
+
+Uma missão falha se o rover não chegar ao local antes de acabar o tempo da
+missão, se a bateria cair abaixo do limiar de abortar, ou se o rover ficar
+offline a meio.
+
+  - manual:     cada missão vai para o rover seguinte (round-robin), como
+                quando o operador escolhe o rover_id à mão;
+  - scheduler:  as missões são submetidas sem rover e o FleetScheduler
+                escolhe (navemae/scheduler.py).
+
+    python benchmarks/scheduler_throughput.py --rovers 20 --hours 4
+"""
+import sys, os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "navemae"))
+
+import argparse
+import contextlib
+import io
+import math
+import random
+
+from common.energy import compute_battery, CHARGE_START_IDLE, CHARGE_START_MISSION
+from mission_queue import MissionQueue, QueuedMission
+from scheduler import FleetScheduler, mission_sites, ROVER_SPEED, SCHEDULE_INTERVAL
+
+TASKS = ("scan_area", "collect_sample", "analyze_environment")
+MAP_SIZE = 300.0
+OFFLINE_TIME = 600      # segundos que um rover fica offline quando falha
+
+
+class SimRover:
+    def __init__(self, rid, rng):
+        self.rid = rid
+        self.pos = (rng.uniform(0, MAP_SIZE), rng.uniform(0, MAP_SIZE))
+        self.battery = rng.uniform(30, 100)
+        self.status = "idle"
+        self.queue = MissionQueue()
+        self.mission = None          # (data, fim, chega a tempo?)
+        self.offline_until = 0
+
+    def state(self):
+        return {"position": [self.pos[0], self.pos[1], 0.0],
+                "battery": self.battery, "status": self.status}
+
+
+def random_mission(rng, t):
+    task = rng.choice(TASKS)
+    x, y = rng.uniform(0, MAP_SIZE), rng.uniform(0, MAP_SIZE)
+    data = {"task": task, "duration": rng.randint(60, 180), "submitted": t}
+
+    if task == "scan_area":
+        data["area"] = [[x, y], [min(MAP_SIZE, x + 10), min(MAP_SIZE, y + 10)]]
+    elif task == "collect_sample":
+        data["points"] = [[x, y], [min(MAP_SIZE, x + 5), y]]
+    return data
+
+
+def simulate(policy, n_rovers, hours, load, fail_rate, seed):
+    rng = random.Random(seed)
+    rovers = {f"R-{i:03d}": SimRover(f"R-{i:03d}", rng) for i in range(n_rovers)}
+    order = list(rovers)
+    t = 0
+
+    # Chegadas: 'load' = fração da frota que as missões ocupariam sem viagens
+    rate = load * n_rovers / 120.0
+    next_arrival = rng.expovariate(rate)
+
+    stats = {"submitted": 0, "ok": 0, "late": 0, "aborted": 0, "offline": 0, "wait": 0.0}
+
+    scheduler = None
+    if policy == "scheduler":
+        scheduler = FleetScheduler(
+            get_rovers=lambda: {rid: r.state() for rid, r in rovers.items()},
+            enqueue=lambda rid, data: rovers[rid].queue.push(QueuedMission.from_request(data)),
+            take_back=lambda rid, predicate: rovers[rid].queue.remove_if(predicate),
+            clock=lambda: t,
+        )
+
+    end = int(hours * 3600)
+    for t in range(end):
+        # 1. Missões novas
+        while next_arrival <= t:
+            data = random_mission(rng, t)
+            stats["submitted"] += 1
+            if scheduler is not None:
+                scheduler.submit(data)
+            else:
+                rid = order[stats["submitted"] % n_rovers]
+                rovers[rid].queue.push(QueuedMission.from_request(data))
+            next_arrival += rng.expovariate(rate)
+
+        # 2. Escalonador
+        if scheduler is not None and t % SCHEDULE_INTERVAL == 0:
+            scheduler.schedule_once()
+
+        # 3. Rovers
+        for r in rovers.values():
+            if r.status == "offline":
+                if t >= r.offline_until:
+                    r.status = "idle"
+                continue
+
+            if rng.random() < fail_rate / 3600.0:
+                if r.mission is not None:
+                    stats["offline"] += 1
+                    r.mission = None
+                r.status = "offline"
+                r.offline_until = t + OFFLINE_TIME
+                continue
+
+            if r.status == "charging":
+                r.battery = compute_battery(r.battery, "charging", None, 1)
+                if r.battery >= 100:
+                    r.status = "idle"
+                continue
+
+            if r.status == "in_mission":
+                data, finish, reaches = r.mission
+                r.battery = compute_battery(r.battery, "in_mission", data["task"], 1)
+                if r.battery < CHARGE_START_MISSION:
+                    stats["aborted"] += 1
+                    r.mission = None
+                    r.status = "charging"
+                elif t >= finish:
+                    stats["ok" if reaches else "late"] += 1
+                    r.pos = mission_sites(data, r.pos)[1]
+                    r.mission = None
+                    r.status = "idle"
+                continue
+
+            # idle
+            r.battery = compute_battery(r.battery, "idle", None, 1)
+            if r.battery < CHARGE_START_IDLE:
+                r.status = "charging"
+                continue
+
+            queued = r.queue.pop(now=t)
+            if queued is not None:
+                data = queued.data
+                start_site = mission_sites(data, r.pos)[0]
+                travel = math.hypot(r.pos[0] - start_site[0], r.pos[1] - start_site[1]) / ROVER_SPEED
+                r.mission = (data, t + data["duration"], travel < data["duration"])
+                r.status = "in_mission"
+                stats["wait"] += t - data["submitted"]
+
+    started = stats["ok"] + stats["late"] + stats["aborted"] + stats["offline"]
+    stats["per_rover_hour"] = stats["ok"] / (n_rovers * hours)
+    stats["mean_wait"] = stats["wait"] / started if started else 0.0
+    stats["left"] = stats["submitted"] - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rovers", type=int, default=20)
+    parser.add_argument("--hours", type=float, default=4)
+    parser.add_argument("--load", type=float, default=0.8,
+                        help="carga oferecida (fração da frota ocupada em missões)")
+    parser.add_argument("--fail-rate", type=float, default=0.5,
+                        help="quedas por rover e por hora")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.rovers} rovers, {args.hours} h simuladas, carga {args.load}, "
+          f"{args.fail_rate} quedas/rover/h\n")
+    print(f"{'política':>10} {'submetidas':>10} {'ok':>6} {'tarde':>6} {'abort':>6} "
+          f"{'offline':>7} {'por fazer':>9} {'espera':>8} {'ok/rover-h':>10}")
+
+    for policy in ("manual", "scheduler"):
+        with contextlib.redirect_stdout(io.StringIO()):   # O escalonador faz log de cada decisão
+            s = simulate(policy, args.rovers, args.hours, args.load, args.fail_rate, args.seed)
+        print(f"{policy:>10} {s['submitted']:>10} {s['ok']:>6} {s['late']:>6} {s['aborted']:>6} "
+              f"{s['offline']:>7} {s['left']:>9} {s['mean_wait']:>7.0f}s {s['per_rover_hour']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
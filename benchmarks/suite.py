@@ -0,0 +1,694 @@
+"""Bateria de benchmarks de ponta a ponta, com resultados em JSON.
+
+Cada caso corre num processo próprio, com o estado da Nave-Mãe num
+diretório temporário:
+
+  - codec:        encode_msg/decode_msg (ops/s) e bytes por mensagem, por ação;
+  - telemetry:    frames/s e latência de ingestão p50/p99 com N rovers em TCP;
+  - missionlink:  datagramas/s com perdas injetadas (ML_UPDATE e ML_COMPLETE
+                  fiável, com retransmissões);
+  - api_state:    latência de GET /api/state para vários tamanhos de frota;
+  - rover_state:  updates/s no estado, com o journal e os snapshots ativos.
+
+Os resultados vão para um JSON (--output) e são comparados com o baseline
+guardado (--baseline): uma métrica que piore mais do que --tolerance conta
+como regressão e o processo termina com código 1. Cada caso corre --repeat
+vezes e fica a mediana de cada métrica.
+
+A velocidade da máquina muda de uma corrida para outra (e de máquina para
+máquina), por isso cada caso mede também um ciclo de referência fixo, em
+Python puro, antes e depois de correr. As métricas que dependem do CPU
+(unidades "/s" e "ms") são comparadas depois de divididas por essa
+referência: o que conta é o código ficar mais lento em relação à máquina.
+As medições curtas do codec alternam com a referência em fatias.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --only codec api_state
+    python benchmarks/suite.py --save-baseline
+"""
+import sys, os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "navemae"))
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import platform
+import random
+import select
+import socket
+import statistics
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+from common.codec import encode_msg, decode_msg
+from common.protocol_constants import (
+    PROTOCOL_VERSION, MSG_TYPE_MISSIONLINK, MSG_TYPE_TELEMETRY,
+    TS_CONNECT, TS_UPDATE, TS_HEARTBEAT, TS_DELTA,
+    ML_REQUEST, ML_ACK, ML_UPDATE, ML_COMPLETE, ML_NEW_MISSION, ML_BATCH,
+)
+from common.reliability import ReliableSender
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+HIGHER = "higher"   # mais é melhor (débitos)
+LOWER = "lower"     # menos é melhor (latências, bytes)
+
+
+class Metrics:
+    """Métricas de um caso: nome -> valor, unidade e sentido do 'melhor'.
+
+    better=None marca uma métrica só informativa (não entra na comparação).
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def add(self, name, value, unit, better=HIGHER, reference=None):
+        self.values[name] = {"value": round(float(value), 3), "unit": unit, "better": better}
+        if reference is not None:
+            self.values[name]["reference"] = round(float(reference), 1)
+
+
+def _percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def _ops_per_sec(fn, seconds):
+    """Chama fn() repetidamente durante 'seconds'; devolve chamadas por segundo."""
+
+    n = 0
+    batch = 16
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            fn()
+        n += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return n / elapsed
+        batch = min(batch * 2, 4096)
+
+
+# Ciclo de referência: só interpretador e bibliotecas padrão, nunca código do projeto
+REFERENCE_SECONDS = 0.3
+_REF_STRUCT = struct.Struct("!BBHH")
+
+def _reference_work():
+    d = {"rover_id": "R-001", "position": [12.5, 40.25, 0.0], "battery": 87.3}
+    x, y, _ = d["position"]
+    _REF_STRUCT.pack(1, 2, int(x), int(y))
+    return sorted(str(v) for v in d.values())
+
+def _reference_ops(seconds=REFERENCE_SECONDS):
+    """Velocidade da máquina agora (chamadas/s do ciclo de referência)."""
+
+    return _ops_per_sec(_reference_work, seconds)
+
+
+def _relative_ops(fn, seconds, slices=6):
+    """Como _ops_per_sec, mas em fatias alternadas com o ciclo de referência
+    (para medições curtas, em que a máquina muda de velocidade a meio).
+    Devolve (chamadas/s, referência) com a razão mediana das fatias."""
+
+    rates, ratios = [], []
+    for _ in range(slices):
+        rate = _ops_per_sec(fn, seconds / slices)
+        rates.append(rate)
+        ratios.append(rate / _reference_ops(seconds / slices))
+    rate = statistics.median(rates)
+    return rate, rate / statistics.median(ratios)
+
+
+def _normalized(metric):
+    """Valor da métrica descontada a velocidade da máquina (se depender dela)."""
+
+    ref = metric.get("reference")
+    if not ref:
+        return metric["value"]
+    if metric["unit"].endswith("/s"):
+        return metric["value"] / ref
+    if metric["unit"] == "ms":
+        return metric["value"] * ref
+    return metric["value"]
+
+
+def _wait_for(predicate, timeout):
+    end = time.time() + timeout
+    while not predicate():
+        if time.time() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+# =========================================================
+# codec
+# =========================================================
+
+def _ml_update(rid, mid, n):
+    return {"rover_id": rid, "mission_id": mid, "progress": n % 100 * 1.0,
+            "status": "in_progress", "position": [12.5, 40.25, 0.0],
+            "extra": {"display": "scan 12/40"}}
+
+def _codec_samples():
+    now = time.time()
+    update = _ml_update("R-001", "M-042", 37)
+    return {
+        "ts_connect": (MSG_TYPE_TELEMETRY, TS_CONNECT, {"rover_id": "R-001", "timestamp": now}),
+        "ts_update": (MSG_TYPE_TELEMETRY, TS_UPDATE, {
+            "rover_id": "R-001", "position": [12.5, 40.25, 0.0], "battery": 87.3,
+            "speed": 1.0, "status": "in_mission", "timestamp": now}),
+        "ts_heartbeat": (MSG_TYPE_TELEMETRY, TS_HEARTBEAT, {"rover_id": "R-001", "timestamp": now}),
+        "ts_delta": (MSG_TYPE_TELEMETRY, TS_DELTA, {
+            "rover_id": "R-001", "timestamp": now, "position": [12.5, 41.25, 0.0]}),
+        "ml_request": (MSG_TYPE_MISSIONLINK, ML_REQUEST, {"rover_id": "R-001"}),
+        "ml_ack": (MSG_TYPE_MISSIONLINK, ML_ACK, {"rover_id": "R-001", "mission_id": "M-042"}),
+        "ml_update": (MSG_TYPE_MISSIONLINK, ML_UPDATE, update),
+        "ml_complete": (MSG_TYPE_MISSIONLINK, ML_COMPLETE, {
+            "rover_id": "R-001", "mission_id": "M-042", "progress": 100.0,
+            "status": "completed", "position": [12.5, 40.25, 0.0]}),
+        "ml_new_mission": (MSG_TYPE_MISSIONLINK, ML_NEW_MISSION, {
+            "mission_id": "M-042", "rover_id": "R-001", "task": "scan_area",
+            "area": [[0, 0], [20, 20]], "resolution": 2, "duration": 120, "update_interval": 5}),
+        "ml_batch": (MSG_TYPE_MISSIONLINK, ML_BATCH, {
+            "records": [_ml_update("R-001", "M-042", n) for n in range(20)]}),
+    }
+
+def bench_codec(args, m):
+    for name, (msg_type, action, payload) in _codec_samples().items():
+        pkt = encode_msg(PROTOCOL_VERSION, msg_type, action, 1, payload)
+        m.add(f"codec.{name}.bytes", len(pkt), "B", LOWER)
+        ops, ref = _relative_ops(lambda: encode_msg(PROTOCOL_VERSION, msg_type, action, 1, payload),
+                                 args.codec_seconds)
+        m.add(f"codec.{name}.encode", ops, "ops/s", reference=ref)
+        ops, ref = _relative_ops(lambda: decode_msg(pkt), args.codec_seconds)
+        m.add(f"codec.{name}.decode", ops, "ops/s", reference=ref)
+
+
+# =========================================================
+# telemetry (TelemetryStream, TCP)
+# =========================================================
+
+def _ts_sender(port, index, rovers, rounds, rate, barrier):
+    """Processo emissor: 'rovers' ligações TCP. Fase 1: 'rounds' updates por
+    rover o mais depressa possível; fase 2: ao ritmo de 'rate' frames/s."""
+
+    socks = []
+    for i in range(rovers):
+        rid = f"T{index:02d}{i:05d}"
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(encode_msg(PROTOCOL_VERSION, MSG_TYPE_TELEMETRY, TS_CONNECT, 0,
+                             {"rover_id": rid, "timestamp": time.time()}))
+        socks.append((rid, s))
+
+    def round_(n):
+        for rid, s in socks:
+            s.sendall(encode_msg(PROTOCOL_VERSION, MSG_TYPE_TELEMETRY, TS_UPDATE, n % 65536, {
+                "rover_id": rid, "position": [float(n), 0.0, 0.0], "battery": 80.0,
+                "speed": 1.0, "status": "in_mission", "timestamp": time.time()}))
+
+    barrier.wait()               # Todos ligados
+    for n in range(rounds):
+        round_(n)
+
+    barrier.wait()               # Servidor já processou a fase 1
+    interval = rovers / rate
+    next_round = time.perf_counter()
+    for n in range(rounds):
+        round_(rounds + n)
+        next_round += interval
+        time.sleep(max(0.0, next_round - time.perf_counter()))
+
+    barrier.wait()               # Servidor já processou a fase 2
+    for _, s in socks:
+        s.close()
+
+def bench_telemetry(args, m):
+    import telemetry_server
+
+    latencies = []
+    original = telemetry_server._handle_message
+
+    def timed(session, msg):
+        result = original(session, msg)
+        if msg["action"] == TS_UPDATE:
+            latencies.append(time.time() - msg["payload"]["timestamp"])
+        return result
+
+    telemetry_server._handle_message = timed
+    threading.Thread(target=telemetry_server.start_telemetry_server,
+                     args=(args.ts_mode, "127.0.0.1", args.ts_port), daemon=True).start()
+    time.sleep(0.5)
+
+    per_sender = max(1, args.ts_rovers // args.ts_senders)
+    rovers = per_sender * args.ts_senders
+    frames = rovers * args.ts_rounds
+    barrier = multiprocessing.Barrier(args.ts_senders + 1)
+    procs = [multiprocessing.Process(target=_ts_sender, args=(
+        args.ts_port, i, per_sender, args.ts_rounds, args.ts_rate / args.ts_senders, barrier))
+        for i in range(args.ts_senders)]
+    for p in procs:
+        p.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    _wait_for(lambda: len(latencies) >= frames, 120)
+    elapsed = time.perf_counter() - start
+    m.add("telemetry.burst.frames_per_s", len(latencies) / elapsed, "frames/s")
+    m.add("telemetry.burst.latency_p99_ms", _percentile(latencies, 99) * 1000, "ms", None)
+
+    del latencies[:]
+    barrier.wait()
+    _wait_for(lambda: len(latencies) >= frames, 120)
+    m.add("telemetry.paced.latency_p50_ms", _percentile(latencies, 50) * 1000, "ms", LOWER)
+    m.add("telemetry.paced.latency_p99_ms", _percentile(latencies, 99) * 1000, "ms", LOWER)
+    m.add("telemetry.paced.offered_frames_per_s", args.ts_rate, "frames/s", None)
+    m.add("telemetry.rovers", rovers, "rovers", None)
+
+    barrier.wait()
+    for p in procs:
+        p.join()
+
+
+# =========================================================
+# missionlink (UDP, com perdas)
+# =========================================================
+
+def _ml_sender(port, index, rovers, seconds, rate, loss, complete_every, results):
+    """Processo emissor: 'rovers' sockets UDP a mandar ML_UPDATE ao ritmo
+    'rate' e, de 'complete_every' em 'complete_every', um ML_COMPLETE fiável.
+    Perde-se 'loss' dos datagramas, nos dois sentidos."""
+
+    rng = random.Random(index)
+    addr = ("127.0.0.1", port)
+    rids = [f"B{index:02d}{i:05d}" for i in range(rovers)]
+    socks = {}
+    for rid in rids:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setblocking(False)
+        socks[rid] = s
+    by_sock = {s: rid for rid, s in socks.items()}
+
+    sent = dropped = 0
+
+    def send(rid, pkt):
+        nonlocal sent, dropped
+        if rng.random() < loss:
+            dropped += 1
+            return
+        try:
+            socks[rid].sendto(pkt, addr)
+            sent += 1
+        except BlockingIOError:
+            dropped += 1
+
+    reliable = ReliableSender(send)
+    started = {}
+    latencies = []
+
+    def receive(timeout):
+        readable, _, _ = select.select(list(by_sock), [], [], timeout)
+        now = time.monotonic()
+        for s in readable:
+            while True:
+                try:
+                    data, _ = s.recvfrom(2048)
+                except BlockingIOError:
+                    break
+                if rng.random() < loss:
+                    continue
+                msg = decode_msg(data)
+                rid = by_sock[s]
+                if msg and msg["action"] == ML_ACK and reliable.ack(rid, msg["seq"], now):
+                    latencies.append(now - started.pop((rid, msg["seq"])))
+        reliable.poll()
+
+    n = completes = 0
+    interval = 1.0 / rate
+    next_send = time.perf_counter()
+    end = next_send + seconds
+    while time.perf_counter() < end:
+        rid = rids[n % rovers]
+        send(rid, encode_msg(PROTOCOL_VERSION, MSG_TYPE_MISSIONLINK, ML_UPDATE, 0,
+                             _ml_update(rid, "M-BENCH", n)))
+        n += 1
+        if n % complete_every == 0 and not reliable.pending(rid):
+            seq = reliable.next_seq(rid)
+            completes += 1
+            started[(rid, seq)] = time.monotonic()
+            reliable.send(rid, seq, encode_msg(PROTOCOL_VERSION, MSG_TYPE_MISSIONLINK, ML_COMPLETE, seq, {
+                "rover_id": rid, "mission_id": f"C{completes % 10**7:07d}", "progress": 100.0,
+                "status": "completed", "position": [1.0, 2.0, 0.0]}))
+
+        next_send += interval
+        wait = next_send - time.perf_counter()
+        if wait > 0 or n % 64 == 0:
+            receive(max(0.0, wait))
+
+    # Esperar pelos ML_COMPLETE ainda em voo (ou pela desistência)
+    tail_end = time.perf_counter() + 30
+    while reliable.pending() and time.perf_counter() < tail_end:
+        receive(0.05)
+
+    results.put({"updates": n, "completes": completes, "acked": len(latencies),
+                 "sent": sent, "dropped": dropped, "latencies": latencies,
+                 "retransmissions": reliable.retransmissions, "give_ups": reliable.give_ups})
+
+def bench_missionlink(args, m):
+    import missionlink_server
+
+    processed = 0
+    original = missionlink_server.handle_request
+
+    def counting_handle(*a, **kw):
+        nonlocal processed
+        original(*a, **kw)
+        processed += 1
+
+    missionlink_server.handle_request = counting_handle
+    threading.Thread(target=missionlink_server.start_missionlink,
+                     args=(args.ml_mode, ("127.0.0.1", args.ml_port)), daemon=True).start()
+    time.sleep(0.5)
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_ml_sender, args=(
+        args.ml_port, i, args.ml_rovers, args.seconds, args.ml_rate / args.ml_senders,
+        args.ml_loss, args.ml_complete_every, results)) for i in range(args.ml_senders)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    totals = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - start
+    for p in procs:
+        p.join()
+
+    def total(key):
+        return sum(t[key] for t in totals)
+
+    latencies = [x for t in totals for x in t["latencies"]]
+    m.add("missionlink.datagrams_per_s", processed / elapsed, "datagrams/s")
+    m.add("missionlink.received_ratio", processed / max(total("sent"), 1), "ratio", None)
+    m.add("missionlink.loss", args.ml_loss, "ratio", None)
+    m.add("missionlink.reliable.delivered_ratio", total("acked") / max(total("completes"), 1), "ratio")
+    m.add("missionlink.reliable.retransmissions_per_msg",
+          total("retransmissions") / max(total("completes"), 1), "retx/msg", LOWER)
+    m.add("missionlink.reliable.latency_p50_ms", _percentile(latencies, 50) * 1000, "ms", LOWER)
+    m.add("missionlink.reliable.latency_p99_ms", _percentile(latencies, 99) * 1000, "ms", LOWER)
+    m.add("missionlink.reliable.give_ups", total("give_ups"), "msgs", None)
+
+
+# =========================================================
+# api_state (GET /api/state)
+# =========================================================
+
+def bench_api_state(args, m):
+    from state.rover_state import update_telemetry
+    import api_server
+
+    client = api_server.app.test_client()
+    fleet = 0
+    for size in args.fleet_sizes:
+        while fleet < size:
+            update_telemetry(f"A{fleet:06d}", [float(fleet), 0.0, 0.0], 80.0, "idle", 0.0)
+            fleet += 1
+
+        changed, unchanged = [], []
+        body = b""
+        for i in range(args.api_requests):
+            # Um rover muda entre pedidos: a vista tem de ser refeita
+            update_telemetry(f"A{i % size:06d}", [float(i), 1.0, 0.0], 79.0, "in_mission", 1.0)
+            t = time.perf_counter()
+            body = client.get("/api/state").get_data()
+            changed.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            client.get("/api/state").get_data()
+            unchanged.append(time.perf_counter() - t)
+
+        m.add(f"api_state.n{size}.changed_p50_ms", _percentile(changed, 50) * 1000, "ms", LOWER)
+        m.add(f"api_state.n{size}.changed_p99_ms", _percentile(changed, 99) * 1000, "ms", LOWER)
+        m.add(f"api_state.n{size}.unchanged_p50_ms", _percentile(unchanged, 50) * 1000, "ms", LOWER)
+        m.add(f"api_state.n{size}.body_bytes", len(body), "B", None)
+
+
+# =========================================================
+# rover_state (com persistência)
+# =========================================================
+
+def bench_rover_state(args, m):
+    from state import rover_state
+
+    def hammer(offset, count, stop, out):
+        n = 0
+        while not stop.is_set():
+            rid = f"S{offset + n % count:06d}"
+            rover_state.update_telemetry(rid, [float(n), 0.0, 0.0], 80.0, "in_mission", 1.0)
+            n += 1
+        out.append(n)
+
+    for threads in args.state_threads:
+        stop = threading.Event()
+        counts = []
+        workers = [threading.Thread(target=hammer, args=(i * args.state_rovers, args.state_rovers, stop, counts))
+                   for i in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        m.add(f"rover_state.telemetry.t{threads}.updates_per_s", sum(counts) / elapsed, "updates/s")
+
+    batch = [(f"S{i % args.state_rovers:06d}", "M-BENCH", 50.0, "in_progress", [1.0, 2.0, 0.0], None)
+             for i in range(256)]
+    m.add("rover_state.missions.batch256.updates_per_s",
+          256 * _ops_per_sec(lambda: rover_state.update_missions(batch), args.seconds), "updates/s")
+
+    # Gravação completa (journal + snapshot) com todos os rovers alterados
+    for i in range(args.state_rovers):
+        rover_state.update_telemetry(f"S{i:06d}", [float(i), 1.0, 0.0], 70.0, "idle", 0.0)
+    t = time.perf_counter()
+    rover_state.flush_state()
+    m.add("rover_state.flush_ms", (time.perf_counter() - t) * 1000, "ms", LOWER)
+    m.add("rover_state.fleet", len(rover_state.get_snapshot()), "rovers", None)
+
+
+CASES = {
+    "codec": bench_codec,
+    "telemetry": bench_telemetry,
+    "missionlink": bench_missionlink,
+    "api_state": bench_api_state,
+    "rover_state": bench_rover_state,
+}
+
+
+# =========================================================
+# Execução, resultados e comparação
+# =========================================================
+
+def _run_case(name, args, result_file):
+    """Processo filho: corre um caso e grava as métricas em result_file."""
+
+    os.chdir(tempfile.mkdtemp(prefix=f"bench_{name}_"))
+    metrics = Metrics()
+    before = _reference_ops()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        CASES[name](args, metrics)
+    reference = round((before + _reference_ops()) / 2, 1)
+    for metric in metrics.values.values():
+        metric.setdefault("reference", reference)   # Os casos curtos medem a sua
+
+    with open(result_file, "w") as f:
+        json.dump(metrics.values, f)
+    sys.stdout.flush()
+    os._exit(0)   # Os servidores ficam em threads que nunca acabam
+
+
+def _median(runs):
+    """A medição mediana (já descontada a máquina) de várias corridas da mesma métrica."""
+
+    ordered = sorted(runs, key=_normalized)
+    return ordered[(len(ordered) - 1) // 2]
+
+
+def run_suite(args):
+    metrics = {}
+    # Só o que muda as medições: os caminhos de saída não vão para o JSON
+    config = {k: v for k, v in vars(args).items()
+              if k not in ("case", "case_args", "result_file", "output", "baseline", "save_baseline")}
+
+    for name in [n for n in args.only or CASES for _ in range(args.repeat)]:
+        fd, result_file = tempfile.mkstemp(suffix=".json", prefix=f"bench_{name}_")
+        os.close(fd)
+        print(f"[BENCH] {name}...", flush=True)
+        t = time.perf_counter()
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", name,
+                               "--case-args", json.dumps(config), "--result-file", result_file])
+        try:
+            with open(result_file) as f:
+                case_metrics = json.load(f)
+        except (OSError, ValueError):
+            case_metrics = {}
+        finally:
+            os.remove(result_file)
+
+        if proc.returncode != 0 or not case_metrics:
+            print(f"[BENCH] {name} falhou (código {proc.returncode})")
+            continue
+        print(f"[BENCH] {name}: {len(case_metrics)} métricas em {time.perf_counter() - t:.1f}s")
+        for key, value in case_metrics.items():
+            metrics.setdefault(key, []).append(value)
+
+    metrics = {key: _median(runs) for key, runs in metrics.items()}
+    references = [m["reference"] for m in metrics.values() if m.get("reference")]
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(),
+                 "machine": platform.machine(), "cpus": os.cpu_count(),
+                 "reference_ops": statistics.median(references) if references else None},
+        "config": config,
+        "metrics": metrics,
+    }
+
+
+def compare(current, baseline, tolerance, min_ms=0.0):
+    """Linhas (nome, valor, unidade, baseline, variação, regressão?) e lista de regressões.
+
+    A variação é relativa ao baseline, positiva quando a métrica melhorou e
+    calculada sobre os valores descontada a velocidade da máquina (só se as
+    duas medições tiverem a referência). Latências que piorem menos de
+    'min_ms' em valor absoluto não contam.
+    """
+
+    rows, regressions = [], []
+    for name, cur in sorted(current.items()):
+        base = baseline.get(name)
+        change = None
+        if base is not None and cur["better"] is not None and base["value"]:
+            if cur.get("reference") and base.get("reference"):
+                now, before = _normalized(cur), _normalized(base)
+            else:
+                now, before = cur["value"], base["value"]
+            change = (now - before) / abs(before)
+            if cur["better"] == LOWER:
+                change = -change
+        regressed = change is not None and change < -tolerance
+        if regressed and cur["unit"] == "ms":
+            regressed = abs(cur["value"] - base["value"]) >= min_ms
+        if regressed:
+            regressions.append(name)
+        rows.append((name, cur["value"], cur["unit"], base["value"] if base else None, change, regressed))
+    return rows, regressions
+
+
+def print_report(rows):
+    width = max((len(r[0]) for r in rows), default=10)
+    for name, value, unit, base, change, regressed in rows:
+        line = f"  {name:<{width}}  {value:>12.3f} {unit:<12}"
+        if base is not None:
+            line += f" baseline {base:>12.3f}"
+        if change is not None:
+            line += f"  {change:+7.1%}"
+        if regressed:
+            line += "  << REGRESSÃO"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(CASES), help="casos a correr (por omissão, todos)")
+    parser.add_argument("--output", help="JSON com os resultados (por omissão, benchmarks/results/<data>.json)")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="grava os resultados como novo baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="piora relativa tolerada antes de contar como regressão")
+    parser.add_argument("--min-ms", type=float, default=1.0,
+                        help="piora absoluta mínima de uma latência para contar como regressão")
+    parser.add_argument("--repeat", type=int, default=3, help="vezes que cada caso corre (fica a mediana)")
+
+    parser.add_argument("--seconds", type=float, default=2.0, help="duração dos casos com tempo fixo")
+    parser.add_argument("--codec-seconds", type=float, default=0.2, help="duração de cada medição do codec")
+    parser.add_argument("--ts-mode", default="asyncio", choices=["asyncio", "thread"])
+    parser.add_argument("--ts-port", type=int, default=16100)
+    parser.add_argument("--ts-rovers", type=int, default=500)
+    parser.add_argument("--ts-senders", type=int, default=4)
+    parser.add_argument("--ts-rounds", type=int, default=10, help="updates por rover em cada fase")
+    parser.add_argument("--ts-rate", type=float, default=2000.0, help="frames/s na fase com ritmo")
+    parser.add_argument("--ml-mode", default="asyncio", choices=["asyncio", "thread"])
+    parser.add_argument("--ml-port", type=int, default=15100)
+    parser.add_argument("--ml-senders", type=int, default=2)
+    parser.add_argument("--ml-rovers", type=int, default=50, help="rovers por emissor")
+    parser.add_argument("--ml-rate", type=float, default=5000.0, help="datagramas/s oferecidos (total)")
+    parser.add_argument("--ml-loss", type=float, default=0.05)
+    parser.add_argument("--ml-complete-every", type=int, default=20)
+    parser.add_argument("--fleet-sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--api-requests", type=int, default=100)
+    parser.add_argument("--state-rovers", type=int, default=1000)
+    parser.add_argument("--state-threads", type=int, nargs="+", default=[1, 4])
+
+    # Uso interno: o processo filho que corre um caso
+    parser.add_argument("--case", choices=list(CASES), help=argparse.SUPPRESS)
+    parser.add_argument("--case-args", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    if args.case:
+        _run_case(args.case, argparse.Namespace(**json.loads(args.case_args)), args.result_file)
+        return
+
+    results = run_suite(args)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"[BENCH] Resultados em {output}")
+
+    baseline, base_host = {}, {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline, base_host = saved.get("metrics", {}), saved.get("host", {})
+
+    if results["host"]["reference_ops"] and base_host.get("reference_ops"):
+        print(f"[BENCH] Referência da máquina: {results['host']['reference_ops']:.0f} ops/s "
+              f"(baseline: {base_host['reference_ops']:.0f} ops/s)")
+
+    rows, regressions = compare(results["metrics"], baseline, args.tolerance, args.min_ms)
+    print_report(rows)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"[BENCH] Baseline gravado em {args.baseline}")
+        return
+
+    if not baseline:
+        print("[BENCH] Sem baseline para comparar (grave um com --save-baseline)")
+    elif regressions:
+        print(f"[BENCH] {len(regressions)} regressões acima de {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    else:
+        print(f"[BENCH] Sem regressões acima de {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
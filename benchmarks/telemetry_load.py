@@ -0,0 +1,106 @@
+"""Teste de carga do TelemetryStream: N rovers ligados em simultâneo.
+
+Arranca o servidor no próprio processo (modo 'thread' ou 'asyncio'), abre N
+ligações TCP, envia CONNECT + updates por cada uma e mostra quantas threads
+o processo precisou e quanto tempo demorou a ingestão.
+
+    python benchmarks/telemetry_load.py --mode asyncio --rovers 1000
+"""
+import sys, os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "navemae"))
+
+import argparse
+import contextlib
+import resource
+import socket
+import tempfile
+import threading
+import time
+
+# O estado da Nave-Mãe é gravado no diretório atual: usar um temporário
+os.chdir(tempfile.mkdtemp(prefix="ts_load_"))
+
+from common.codec import encode_msg
+from common.protocol_constants import PROTOCOL_VERSION, TS_CONNECT, TS_UPDATE
+import telemetry_server
+from state.rover_state import get_snapshot
+
+
+def _raise_fd_limit(needed):
+    """Sobe o limite de descritores abertos até onde o sistema deixar."""
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = min(hard, max(soft, needed))
+    if want > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+    return want
+
+
+def _update(rid, i, battery):
+    return encode_msg(PROTOCOL_VERSION, 2, TS_UPDATE, i, {
+        "rover_id": rid, "position": [float(i), 0.0, 0.0], "battery": battery,
+        "speed": 0.0, "status": "idle", "timestamp": time.time(),
+    })
+
+
+def run(mode, rovers, updates, port):
+    _raise_fd_limit(2 * rovers + 64)
+
+    threads_before = threading.active_count()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        threading.Thread(target=telemetry_server.start_telemetry_server,
+                         args=(mode, "127.0.0.1", port), daemon=True).start()
+        time.sleep(0.5)
+
+        start = time.perf_counter()
+        socks = []
+        for n in range(rovers):
+            rid = f"L{n:06d}"
+            s = socket.create_connection(("127.0.0.1", port))
+            s.sendall(encode_msg(PROTOCOL_VERSION, 2, TS_CONNECT, 0,
+                                 {"rover_id": rid, "timestamp": time.time()}))
+            socks.append((rid, s))
+
+        # Updates intercalados entre rovers; o último leva bateria 1.0 como marca
+        for i in range(updates):
+            batt = 1.0 if i == updates - 1 else 50.0
+            for rid, s in socks:
+                s.sendall(_update(rid, i, batt))
+
+        while True:
+            snap = get_snapshot()
+            done = sum(1 for r in snap.values() if r.get("battery") == 1.0)
+            if done >= rovers:
+                break
+            time.sleep(0.05)
+
+        elapsed = time.perf_counter() - start
+        threads_peak = threading.active_count()
+
+        for _, s in socks:
+            s.close()
+
+    frames = rovers * (updates + 1)
+    print(f"modo={mode} rovers={rovers} frames={frames}")
+    print(f"  threads: {threads_before} -> {threads_peak}")
+    print(f"  tempo: {elapsed:.2f}s ({frames / elapsed:.0f} frames/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=[telemetry_server.MODE_ASYNCIO, telemetry_server.MODE_THREAD],
+                        default=telemetry_server.DEFAULT_MODE)
+    parser.add_argument("--rovers", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5)
+    parser.add_argument("--port", type=int, default=16000)
+    args = parser.parse_args()
+
+    run(args.mode, args.rovers, args.updates, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,375 @@
 import struct
-import pickle  
+import pickle
+import json
+
+from common.protocol_constants import (
+    PROTOCOL_VERSION_PICKLE, PROTOCOL_VERSION_BINARY, STATUS_CODES,
+    MSG_TYPE_MISSIONLINK, MSG_TYPE_TELEMETRY,
+    ML_ACK, ML_UPDATE, ML_REQUEST, ML_COMPLETE, ML_BATCH,
+    TS_CONNECT, TS_UPDATE, TS_HEARTBEAT, TS_DELTA,
+)
 
 # Header: version (B), msg_type (B), action (B), seq (H), length (H), checksum (B)
 HEADER_FMT = "!BBBHHB"
 
 HEADER_SIZE = struct.calcsize(HEADER_FMT)
 
+
+class ChecksumError(ValueError):
+    """O checksum do header não bate com o corpo (mensagem corrompida)."""
+
+# =========================================================
+# Formato binário (versão 2)
+# =========================================================
+# O corpo começa com 1 byte de formato:
+#   BODY_SCHEMA  -> campos fixos com struct (ver SCHEMAS) + 'extra' opcional
+#   BODY_GENERIC -> dicionário livre em JSON compacto (fallback)
+#   BODY_BATCH   -> vários registos de outra ação, cada um com 2 bytes de
+#                   tamanho seguidos do seu corpo (ver BATCH_ACTIONS)
+
+BODY_GENERIC = 0
+BODY_SCHEMA  = 1
+BODY_BATCH   = 2
+
+ID_SIZE = 8   # rover_id / mission_id com largura fixa ("R-001", "M-042", ...)
+
+_STATUS_INDEX = {s: i for i, s in enumerate(STATUS_CODES)}
+
+# Tipos de campo -> formato struct
+#   id     : string ASCII com largura fixa
+#   pos    : tripla x, y, z em float32
+#   tenths : uint16 em décimas (bateria, progresso)
+#   float  : float32
+#   ts     : timestamp float64
+#   status : índice em STATUS_CODES
+_KIND_FMT = {
+    "id": f"{ID_SIZE}s",
+    "pos": "3f",
+    "tenths": "H",
+    "float": "f",
+    "ts": "d",
+    "status": "B",
+}
+
+# Layout por (msg_type, action). O último elemento indica se a mensagem
+# aceita um campo 'extra' livre, codificado no fim do corpo em JSON.
+SCHEMAS = {
+    (MSG_TYPE_TELEMETRY, TS_CONNECT): (
+        (("rover_id", "id"), ("timestamp", "ts")), False),
+    (MSG_TYPE_TELEMETRY, TS_UPDATE): (
+        (("rover_id", "id"), ("position", "pos"), ("battery", "tenths"),
+         ("speed", "float"), ("status", "status"), ("timestamp", "ts")), False),
+    (MSG_TYPE_TELEMETRY, TS_HEARTBEAT): (
+        (("rover_id", "id"), ("timestamp", "ts")), False),
+
+    (MSG_TYPE_MISSIONLINK, ML_REQUEST): (
+        (("rover_id", "id"),), False),
+    (MSG_TYPE_MISSIONLINK, ML_ACK): (
+        (("rover_id", "id"), ("mission_id", "id")), False),
+    (MSG_TYPE_MISSIONLINK, ML_UPDATE): (
+        (("rover_id", "id"), ("mission_id", "id"), ("progress", "tenths"),
+         ("status", "status"), ("position", "pos")), True),
+    (MSG_TYPE_MISSIONLINK, ML_COMPLETE): (
+        (("rover_id", "id"), ("mission_id", "id"), ("progress", "tenths"),
+         ("status", "status"), ("position", "pos")), False),
+}
+
+
+def _pack_fields(fields, payload, values):
+    """Acrescenta a 'values' os valores struct dos campos. Levanta
+    ValueError/TypeError se não couberem."""
+
+    for name, kind in fields:
+        v = payload[name]
+        if kind == "id":
+            b = v.encode("ascii")
+            if len(b) > ID_SIZE:
+                raise ValueError(f"{name} demasiado longo")
+            values.append(b)
+        elif kind == "pos":
+            if len(v) != 3:
+                raise ValueError("posição tem de ser x, y, z")
+            values.extend(v)
+        elif kind == "tenths":
+            values.append(int(round(v * 10)))
+        elif kind == "status":
+            values.append(_STATUS_INDEX[v])
+        else:
+            values.append(v)
+
+
+def _unpack_fields(fields, values, i, payload):
+    """Inverso de _pack_fields, a partir de values[i]. Devolve o índice seguinte."""
+
+    for name, kind in fields:
+        if kind == "id":
+            payload[name] = values[i].rstrip(b"\0").decode("ascii")
+        elif kind == "pos":
+            payload[name] = [values[i], values[i + 1], values[i + 2]]
+            i += 2
+        elif kind == "tenths":
+            payload[name] = values[i] / 10
+        elif kind == "status":
+            payload[name] = STATUS_CODES[values[i]]
+        else:
+            payload[name] = values[i]
+        i += 1
+    return i
+
+
+class _Schema:
+    """Layout struct pré-compilado de uma ação."""
+
+    __slots__ = ("fields", "names", "has_extra", "struct")
+
+    def __init__(self, fields, has_extra):
+        self.fields = fields
+        self.names = frozenset(name for name, _ in fields)
+        self.has_extra = has_extra
+        fmt = "!B" + "".join(_KIND_FMT[kind] for _, kind in fields)
+        self.struct = struct.Struct(fmt)
+
+    def matches(self, payload):
+        """Indica se o payload tem exatamente os campos deste layout."""
+
+        keys = payload.keys()
+        if self.has_extra and "extra" in keys:
+            return len(keys) == len(self.fields) + 1 and self.names <= keys
+        return len(keys) == len(self.fields) and self.names <= keys
+
+    def pack(self, payload):
+        """Empacota os campos fixos. Levanta ValueError/TypeError se não couberem."""
+
+        values = [BODY_SCHEMA]
+        _pack_fields(self.fields, payload, values)
+        body = self.struct.pack(*values)
+
+        if self.has_extra and payload.get("extra") is not None:
+            body += _dump_generic(payload["extra"])
+        return body
+
+    def unpack(self, body):
+        """Desempacota um corpo BODY_SCHEMA para dicionário."""
+
+        values = self.struct.unpack_from(body, 0)
+        payload = {}
+        _unpack_fields(self.fields, values, 1, payload)  # salta o byte de formato
+
+        if self.has_extra and len(body) > self.struct.size:
+            payload["extra"] = _load_generic(body[self.struct.size:])
+        return payload
+
+
+# Layouts com campos opcionais: os 'required' vão sempre, seguidos de um byte
+# de máscara que diz quais dos 'optional' (no máximo 8) vêm a seguir.
+OPTIONAL_SCHEMAS = {
+    (MSG_TYPE_TELEMETRY, TS_DELTA): (
+        (("rover_id", "id"), ("timestamp", "ts")),
+        (("position", "pos"), ("battery", "tenths"), ("speed", "float"), ("status", "status"))),
+}
+
+
+class _OptionalSchema:
+    """Layout com campos fixos obrigatórios e campos opcionais por máscara."""
+
+    __slots__ = ("required", "optional", "names", "all_names", "struct", "parts")
+
+    def __init__(self, required, optional):
+        if len(optional) > 8:
+            raise ValueError("No máximo 8 campos opcionais")
+
+        self.required = required
+        self.optional = optional
+        self.names = frozenset(name for name, _ in required)
+        self.all_names = self.names | {name for name, _ in optional}
+        self.struct = struct.Struct("!B" + "".join(_KIND_FMT[kind] for _, kind in required) + "B")
+        self.parts = tuple(struct.Struct("!" + _KIND_FMT[kind]) for _, kind in optional)
+
+    def matches(self, payload):
+        keys = payload.keys()
+        return self.names <= keys and keys <= self.all_names
+
+    def pack(self, payload):
+        values = [BODY_SCHEMA]
+        _pack_fields(self.required, payload, values)
+
+        mask = 0
+        tail = []
+        for bit, (field, part) in enumerate(zip(self.optional, self.parts)):
+            if field[0] in payload:
+                mask |= 1 << bit
+                part_values = []
+                _pack_fields((field,), payload, part_values)
+                tail.append(part.pack(*part_values))
+
+        values.append(mask)
+        return self.struct.pack(*values) + b"".join(tail)
+
+    def unpack(self, body):
+        values = self.struct.unpack_from(body, 0)
+        payload = {}
+        _unpack_fields(self.required, values, 1, payload)
+
+        mask = values[-1]
+        offset = self.struct.size
+        for bit, (field, part) in enumerate(zip(self.optional, self.parts)):
+            if mask & (1 << bit):
+                _unpack_fields((field,), part.unpack_from(body, offset), 0, payload)
+                offset += part.size
+        return payload
+
+
+_COMPILED = {key: _Schema(fields, extra) for key, (fields, extra) in SCHEMAS.items()}
+_COMPILED.update((key, _OptionalSchema(required, optional))
+                 for key, (required, optional) in OPTIONAL_SCHEMAS.items())
+
+
+def register_schema(msg_type, action, fields, has_extra=False):
+    """Regista o layout binário de uma ação (ex.: registos do journal)."""
+
+    SCHEMAS[(msg_type, action)] = (tuple(fields), has_extra)
+    _COMPILED[(msg_type, action)] = _Schema(tuple(fields), has_extra)
+
+
+def _dump_generic(obj):
+    """Serializa um valor livre em JSON compacto."""
+
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _load_generic(data):
+    """Inverso de _dump_generic."""
+
+    return json.loads(bytes(data))
+
+
+# Ações que levam vários registos de outra ação: payload {"records": [...]}
+BATCH_ACTIONS = {
+    (MSG_TYPE_MISSIONLINK, ML_BATCH): ML_UPDATE,
+}
+
+_RECORD_LENGTH = struct.Struct("!H")
+
+
+def encode_batch_record(msg_type, action, payload):
+    """Um registo de lote (tamanho + corpo), para juntar com encode_batch().
+
+    'action' é a ação do lote; o registo é codificado como a ação que o
+    lote transporta.
+    """
+
+    body = _encode_body(PROTOCOL_VERSION_BINARY, msg_type, BATCH_ACTIONS[(msg_type, action)], payload)
+    return _RECORD_LENGTH.pack(len(body)) + body
+
+
+def encode_batch(msg_type, action, seq, records):
+    """Mensagem de lote (versão binária) com registos já codificados."""
+
+    body = bytes((BODY_BATCH,)) + b"".join(records)
+    if len(body) > 0xFFFF:
+        raise ValueError("Lote demasiado grande")
+
+    header = struct.pack(HEADER_FMT, PROTOCOL_VERSION_BINARY, msg_type, action, seq,
+                         len(body), sum(body) % 256)
+    return header + body
+
+
+def _decode_batch(version, msg_type, action, body):
+    inner = BATCH_ACTIONS.get((msg_type, action))
+    if inner is None:
+        raise ValueError(f"Ação {msg_type}/{action} não é um lote")
+
+    records = []
+    offset = 1
+    while offset < len(body):
+        (length,) = _RECORD_LENGTH.unpack_from(body, offset)
+        offset += _RECORD_LENGTH.size
+        if offset + length > len(body):
+            raise ValueError("Registo de lote truncado")
+        records.append(_decode_body(version, msg_type, inner, body[offset:offset + length]))
+        offset += length
+    return {"records": records}
+
+
+def _encode_body(version, msg_type, action, payload):
+    """Serializa o payload de acordo com a versão do protocolo."""
+
+    if version == PROTOCOL_VERSION_PICKLE:
+        return pickle.dumps(payload)
+
+    if version != PROTOCOL_VERSION_BINARY:
+        raise ValueError(f"Versão de protocolo desconhecida: {version}")
+
+    if (msg_type, action) in BATCH_ACTIONS and isinstance(payload, dict) and payload.keys() == {"records"}:
+        return bytes((BODY_BATCH,)) + b"".join(
+            encode_batch_record(msg_type, action, record) for record in payload["records"])
+
+    schema = _COMPILED.get((msg_type, action))
+    if schema is not None and isinstance(payload, dict) and schema.matches(payload):
+        try:
+            return schema.pack(payload)
+        except (KeyError, ValueError, TypeError, AttributeError, struct.error):
+            pass  # Não cabe no layout fixo, segue pelo formato genérico
+
+    return bytes((BODY_GENERIC,)) + _dump_generic(payload)
+
+
+def _decode_body(version, msg_type, action, body):
+    """Deserializa o payload de acordo com a versão do protocolo."""
+
+    if version == PROTOCOL_VERSION_PICKLE:
+        return pickle.loads(body)
+
+    if version != PROTOCOL_VERSION_BINARY:
+        raise ValueError(f"Versão de protocolo desconhecida: {version}")
+
+    if not body:
+        raise ValueError("Corpo vazio")
+
+    fmt = body[0]
+    if fmt == BODY_GENERIC:
+        return _load_generic(body[1:])
+
+    if fmt == BODY_SCHEMA:
+        schema = _COMPILED.get((msg_type, action))
+        if schema is None:
+            raise ValueError(f"Sem layout binário para ação {msg_type}/{action}")
+        return schema.unpack(body)
+
+    if fmt == BODY_BATCH:
+        return _decode_batch(version, msg_type, action, body)
+
+    raise ValueError(f"Formato de corpo desconhecido: {fmt}")
+
+
 def encode_msg(version, msg_type, action, seq, payload):
-    """Codifica uma mensagem com header e payload."""
-    
-    # 1. Serializar o dicionário diretamente para bytes binários
-    body = pickle.dumps(payload)
-    
-    
+    """Codifica uma mensagem com header e payload.
+
+    A versão escolhe o formato do corpo: 1 = pickle (legado), 2 = binário.
+    Quem responde deve usar a versão da mensagem recebida.
+    """
+
+    body = _encode_body(version, msg_type, action, payload)
+
     length = len(body)
     checksum = sum(body) % 256
 
     header = struct.pack(HEADER_FMT, version, msg_type, action, seq, length, checksum)
-    
+
     # Retorna: Bytes do Header + Bytes do Payload (Binário)
     return header + body
 
 
 def decode_msg(packet):
     """Decodifica uma mensagem recebida em bytes."""
-    
+
     if len(packet) < HEADER_SIZE:
         # Se não tiver dados suficientes, retorna None ou levanta erro
         # (Ajustado para ser mais seguro em streams TCP)
         return None
 
-    header = packet[:HEADER_SIZE]
-    # Nota: No TCP, o resto pode não ter chegado ainda, mas 
-    # a lógica de leitura no server já trata disso usando o 'length'
-    
-    version, msg_type, action, seq, length, checksum = struct.unpack(HEADER_FMT, header)
-    
+    version, msg_type, action, seq, length, checksum = struct.unpack_from(HEADER_FMT, packet, 0)
+
     # Verificar se temos o pacote completo
     if len(packet) < HEADER_SIZE + length:
         return None # Pacote incompleto
@@ -43,14 +377,13 @@ def decode_msg(packet):
     payload_data = packet[HEADER_SIZE : HEADER_SIZE + length]
 
     if sum(payload_data) % 256 != checksum:
-        raise ValueError("Checksum inválido")
-    
+        raise ChecksumError("Checksum inválido")
 
-    # 2. Deserializar os bytes binários de volta para dicionário
     try:
-        data = pickle.loads(payload_data)
+        data = _decode_body(version, msg_type, action, payload_data)
+    except ValueError:
+        raise
     except Exception as e:
-        
         raise ValueError(f"Erro ao descodificar payload binário: {e}")
 
     return {
@@ -60,4 +393,141 @@ def decode_msg(packet):
         "seq": seq,
         "payload": data,
         "bytes_consumed": HEADER_SIZE + length # Ajuda no TCP stream
-    }
\ No newline at end of file
+    }
+
+
+# =========================================================
+# Leitura incremental de streams TCP
+# =========================================================
+
+MAX_FRAME_SIZE = HEADER_SIZE + 0xFFFF   # 'length' é um uint16
+FRAMER_CAPACITY = 4096                  # buffer inicial de cada ligação
+MAX_BAD_FRAMES = 8                      # mensagens inválidas seguidas até desistir do stream
+
+_LENGTH_OFFSET = 5                      # posição do 'length' no header
+_LENGTH_FMT = struct.Struct("!H")
+
+
+class StreamFramer:
+    """Reconstrói mensagens de um stream TCP, qualquer que seja a segmentação.
+
+    Usa um bytearray onde o socket escreve diretamente (recv_into); as
+    mensagens são descodificadas a partir de fatias memoryview, sem cópias
+    intermédias. O buffer começa com 'capacity' bytes (uma ligação parada
+    gasta pouco) e só cresce quando um header anuncia uma mensagem maior;
+    volta ao tamanho inicial quando essa mensagem é consumida.
+
+    Uma mensagem que não se descodifica (checksum, payload) é saltada: o
+    header diz o seu tamanho, por isso o stream continua alinhado. Com
+    MAX_BAD_FRAMES seguidas, o stream está desalinhado e o erro é levantado.
+    """
+
+    def __init__(self, capacity=FRAMER_CAPACITY):
+        if capacity < HEADER_SIZE:
+            raise ValueError("Capacidade inferior ao tamanho do header")
+
+        self._capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0   # Primeiro byte ainda não consumido
+        self._end = 0     # Fim dos dados recebidos
+        self._bad = 0     # Mensagens inválidas seguidas
+
+    def pending(self):
+        """Número de bytes recebidos que ainda não formam uma mensagem."""
+
+        return self._end - self._start
+
+    def _next_size(self):
+        """Tamanho da próxima mensagem (só o header, se ainda não chegou)."""
+
+        if self._end - self._start < HEADER_SIZE:
+            return HEADER_SIZE
+        return HEADER_SIZE + _LENGTH_FMT.unpack_from(self._buf, self._start + _LENGTH_OFFSET)[0]
+
+    def _resize(self, size):
+        """Passa os bytes pendentes para o início de um buffer novo de 'size' bytes."""
+
+        remaining = self._end - self._start
+        buf = bytearray(size)
+        buf[:remaining] = self._view[self._start:self._end]
+        self._buf, self._view = buf, memoryview(buf)
+        self._start, self._end = 0, remaining
+
+    def _reserve(self, extra):
+        """Garante pelo menos 'extra' bytes livres no fim do buffer."""
+
+        if len(self._buf) - self._end >= extra:
+            return
+
+        remaining = self._end - self._start
+        if remaining + extra <= len(self._buf):
+            self._view[:remaining] = self._view[self._start:self._end]
+            self._start, self._end = 0, remaining
+        else:
+            self._resize(remaining + extra)
+
+    def _shrink(self):
+        """Volta ao tamanho inicial quando o que está pendente já cabe nele."""
+
+        if len(self._buf) > self._capacity and self._end - self._start <= self._capacity \
+                and self._next_size() <= self._capacity:
+            self._resize(self._capacity)
+
+    def recv_into(self, sock):
+        """Lê do socket diretamente para o buffer. Devolve 0 se a ligação fechou."""
+
+        remaining = self._end - self._start
+        self._reserve(max(self._next_size(), self._capacity) - remaining)
+        n = sock.recv_into(self._view[self._end:])
+        self._end += n
+        return n
+
+    def feed(self, data, on_error=None):
+        """Acrescenta bytes já lidos por outra via (ex.: asyncio) e gera as
+        mensagens que ficarem completas (ver frames())."""
+
+        # Tudo para o buffer antes de descodificar: um erro a meio não perde o resto
+        self._reserve(len(data))
+        self._view[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+        yield from self.frames(on_error)
+
+    def frames(self, on_error=None):
+        """Gera todas as mensagens completas que estão no buffer.
+
+        Cada mensagem é retirada do buffer antes de ser descodificada, por isso
+        um ValueError (checksum, payload) não deixa o stream dessincronizado.
+        Com 'on_error', a mensagem inválida é passada a on_error(exc) e
+        saltada; sem ele, o erro é levantado.
+        """
+
+        while True:
+            available = self._end - self._start
+            if available < HEADER_SIZE:
+                break
+
+            length = _LENGTH_FMT.unpack_from(self._buf, self._start + _LENGTH_OFFSET)[0]
+            size = HEADER_SIZE + length
+            if available < size:
+                break
+
+            frame = self._view[self._start:self._start + size]
+            self._start += size
+
+            try:
+                msg = decode_msg(frame)
+            except ValueError as e:
+                self._bad += 1
+                if on_error is None or self._bad >= MAX_BAD_FRAMES:
+                    raise
+                on_error(e)
+                continue
+
+            self._bad = 0
+            yield msg
+
+        if self._start == self._end:
+            self._start = self._end = 0
+        self._shrink()
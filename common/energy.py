@@ -0,0 +1,52 @@
+# common/energy.py
+"""Modelo de bateria dos rovers (partilhado pelo rover e pela Nave-Mãe).
+
+O rover usa compute_battery() para simular a bateria; a Nave-Mãe usa as
+mesmas taxas para estimar quanto custa uma missão antes de a atribuir.
+"""
+
+#bateria consumo por segundo
+CONSUMPTION = {
+    "idle": 0.10,
+    "in_mission": 0.10,
+    "scan_area": 0.15,
+    "collect_sample": 0.20,
+    "analyze_environment": 0.12,
+}
+
+CHARGE_RATE = 1.0          # %/s enquanto está a carregar
+CHARGE_START_IDLE = 20.0   # abaixo disto, parado, vai carregar
+CHARGE_START_MISSION = 5.0 # abaixo disto, em missão, aborta e vai carregar
+
+def drain_rate(status, task=None):
+    """Consumo (%/s) num dado estado e tarefa."""
+
+    return CONSUMPTION.get(status, 0.10) + CONSUMPTION.get(task, 0.0)
+
+def compute_battery(batt, status, task, dt):
+    """Calcula o novo nível de bateria com base no estado e tarefa atuais."""
+
+    # Regra 1: Se o estado for "charging", carrega
+    if status == "charging":
+
+        return min(100.0, batt + (CHARGE_RATE * dt))  # carrega 1%/s
+
+    if batt <= 0:
+
+        return 0.0
+
+    # Regra 2: Se não estiver a carregar, consome
+    drain = drain_rate(status, task) * dt
+    batt = max(0.0, batt - drain)
+
+    return batt
+
+def mission_energy(task, duration):
+    """Bateria (%) gasta por uma missão que dura 'duration' segundos."""
+
+    return drain_rate("in_mission", task) * duration
+
+def charge_time(batt, target=100.0):
+    """Segundos a carregar de 'batt' até 'target'."""
+
+    return max(0.0, target - batt) / CHARGE_RATE
@@ -0,0 +1,226 @@
+# common/log.py
+"""Logging da Nave-Mãe e dos rovers: assíncrono, com limite de ritmo e amostragem.
+
+    from common.log import get_logger
+    log = get_logger("TS")
+    log.debug("%s → pos=%s", rid, pos, extra={"event": "ts.update", "rover_id": rid})
+
+setup_logging() (chamado pelos main) liga ao logger raiz um handler que só
+mete o registo numa fila, sem nunca bloquear: com a fila cheia o registo
+perde-se (e é contado). Uma thread à parte formata e escreve no terminal,
+em texto ("[TS] ...") ou em JSON, uma linha por registo.
+
+Antes da fila, cada registo passa pelo limite de ritmo da sua chave
+(componente, evento, rover_id): acima do limite é descartado e o registo
+seguinte dessa chave diz quantos foram suprimidos. Sem 'event', o evento é
+o próprio formato da mensagem. Eventos muito frequentes podem ainda ser
+amostrados (só 1 em cada N chega ao limite de ritmo).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from common.metrics import counter
+
+QUEUE_SIZE = 10000       # registos à espera da thread de escrita
+DEFAULT_RATE = 10.0      # registos/s por chave
+DEFAULT_BURST = 20       # registos seguidos antes de o limite atuar
+MAX_KEYS = 50000         # chaves lembradas (depois recomeça do zero)
+
+DROPPED = counter("log_records_dropped_total", "Registos de log descartados", ("reason",))
+
+
+def get_logger(component):
+    """Logger de um componente ("TS", "ML", "SCHED", ...)."""
+
+    return logging.getLogger(component)
+
+
+# =========================================================
+# Limite de ritmo e amostragem
+# =========================================================
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket por chave (componente, evento, rover_id), com limites e
+    amostragem configuráveis por evento."""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._limits = {}     # evento -> (rate, burst)
+        self._sampling = {}   # evento -> N (1 em cada N)
+        self._buckets = {}    # chave -> [tokens, último instante, suprimidos, vistos]
+        self._lock = threading.Lock()
+
+    def set_limit(self, event, rate, burst=None):
+        self._limits[event] = (float(rate), burst if burst is not None else max(1, int(rate)))
+
+    def set_sampling(self, event, every):
+        if every <= 1:
+            self._sampling.pop(event, None)
+        else:
+            self._sampling[event] = int(every)
+
+    def filter(self, record):
+        event = getattr(record, "event", None) or str(record.msg)
+        key = (record.name, event, getattr(record, "rover_id", None))
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_KEYS:
+                    self._buckets.clear()
+                rate, burst = self._limits.get(event, (self.rate, self.burst))
+                bucket = self._buckets[key] = [burst, now, 0, 0]
+
+            bucket[3] += 1
+            every = self._sampling.get(event)
+            if every and bucket[3] % every:
+                DROPPED.labels("sampled").inc()
+                return False
+
+            rate, burst = self._limits.get(event, (self.rate, self.burst))
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                DROPPED.labels("rate_limit").inc()
+                return False
+
+            bucket[0] -= 1
+            record.suppressed = bucket[2]
+            record.sampled = every or 1
+            bucket[2] = 0
+        return True
+
+
+LIMITS = RateLimitFilter()
+
+def set_rate_limit(event, rate, burst=None):
+    """Registos/s permitidos por rover (ou por componente) para um evento."""
+
+    LIMITS.set_limit(event, rate, burst)
+
+def set_sampling(event, every):
+    """Deixa passar só 1 em cada 'every' registos do evento (por chave)."""
+
+    LIMITS.set_sampling(event, every)
+
+
+# =========================================================
+# Fila e escrita
+# =========================================================
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Põe o registo na fila sem bloquear; com a fila cheia descarta-o."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.labels("queue_full").inc()
+
+
+class TextFormatter(logging.Formatter):
+    """'[TS] mensagem', com o nível se for aviso ou erro."""
+
+    def format(self, record):
+        level = f"{record.levelname} " if record.levelno >= logging.WARNING else ""
+        line = f"[{record.name}] {level}{record.getMessage()}"
+        if getattr(record, "suppressed", 0):
+            line += f" (+{record.suppressed} suprimidas)"
+        if getattr(record, "sampled", 1) > 1:
+            line += f" (1 em {record.sampled})"
+        return line
+
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "suppressed", "sampled"}
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha, com os campos de 'extra' ao nível de topo."""
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "component": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                data[key] = value
+        if getattr(record, "suppressed", 0):
+            data["suppressed"] = record.suppressed
+        if getattr(record, "sampled", 1) > 1:
+            data["sampled"] = record.sampled
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_listener = None
+_handler = None
+_options = None
+
+def setup_logging(level="INFO", json_format=False, stream=None, queue_size=QUEUE_SIZE,
+                  rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+    """Liga o logging assíncrono ao logger raiz (pode ser chamado outra vez
+    para mudar as opções)."""
+
+    global _listener, _handler, _options
+    _options = dict(level=level, json_format=json_format, stream=stream, queue_size=queue_size,
+                    rate=rate, burst=burst)
+    root = logging.getLogger()
+    if _listener is not None:
+        _listener.stop()
+    if _handler is not None:
+        root.removeHandler(_handler)
+
+    LIMITS.rate, LIMITS.burst = float(rate), burst
+
+    out = logging.StreamHandler(stream or sys.stdout)
+    out.setFormatter(JsonFormatter() if json_format else TextFormatter())
+
+    _handler = _QueueHandler(queue.Queue(queue_size))
+    _handler.addFilter(LIMITS)
+    _listener = logging.handlers.QueueListener(_handler.queue, out)
+    _listener.start()
+
+    root.addHandler(_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+def restart_logging():
+    """Num processo criado por fork (workers do gunicorn) a thread de escrita
+    não existe: volta a ligar o logging com as mesmas opções."""
+
+    global _listener
+    if _options is not None:
+        _listener = None
+        setup_logging(**_options)
+
+def shutdown_logging():
+    """Escreve o que ainda está na fila e para a thread de escrita."""
+
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown_logging)
+
+
+def add_logging_args(parser):
+    """Opções --log-level, --log-json e --log-rate de um argparse."""
+
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="nível mínimo dos registos (default: %(default)s)")
+    parser.add_argument("--log-json", action="store_true",
+                        help="um objeto JSON por linha em vez de texto")
+    parser.add_argument("--log-rate", type=float, default=DEFAULT_RATE,
+                        help="registos/s por rover e evento antes de suprimir (default: %(default)s)")
@@ -0,0 +1,366 @@
+# common/metrics.py
+"""Métricas internas: contadores, gauges e histogramas de latência, com
+saída no formato de texto do Prometheus (GET /metrics na API).
+
+    FRAMES = counter("navemae_frames_total", "Frames descodificados", ("link", "action"))
+    FRAMES.labels("ts", "update").inc()
+
+    SAVE = histogram("navemae_state_save_seconds", "Duração de _save_state")
+    with SAVE.time():
+        ...
+
+Cada série (combinação de etiquetas) tem o seu lock, por isso atualizar
+custa uma aquisição sem contenção. Os histogramas guardam contagens em
+baldes logarítmicos (à maneira do HdrHistogram): SUB_BUCKETS por potência
+de 2, com erro relativo abaixo de 1/SUB_BUCKETS em qualquer escala, sem
+fixar limites de antemão; os limites 'le' do Prometheus são só a forma de
+exportar.
+"""
+import math
+import threading
+import time
+
+SUB_BUCKETS = 16   # baldes por potência de 2 (erro relativo < 6.25%)
+
+# Limites exportados por omissão (segundos): 1-2.5-5 de 1 µs a 60 s
+DEFAULT_BUCKETS = tuple(float(f"{m}e{e}") for e in range(-6, 2) for m in (1, 2.5, 5)) + (60.0,)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(v):
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(v)
+
+
+# =========================================================
+# Séries
+# =========================================================
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock", "_fn")
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+        self._fn = None
+
+    def inc(self, n=1):
+        with self._lock:
+            self._value += n
+
+    def set_function(self, fn):
+        """O valor passa a ser lido de fn() quando as métricas são exportadas
+        (para contadores que já existem noutro objeto)."""
+
+        self._fn = fn
+
+    def get(self):
+        return self._fn() if self._fn is not None else self._value
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self._value = value
+
+    def dec(self, n=1):
+        self.inc(-n)
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class _HistogramChild:
+    __slots__ = ("_counts", "_zero", "_count", "_sum", "_max", "_lock")
+
+    def __init__(self):
+        self._counts = {}     # índice do balde -> contagem
+        self._zero = 0        # observações <= 0
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        if value > 0:
+            m, e = math.frexp(value)   # value = m * 2**e, 0.5 <= m < 1
+            index = e * SUB_BUCKETS + int((m - 0.5) * 2 * SUB_BUCKETS)
+        else:
+            index = None
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            if value > self._max:
+                self._max = value
+            if index is None:
+                self._zero += 1
+            else:
+                self._counts[index] = self._counts.get(index, 0) + 1
+
+    def time(self):
+        """Context manager que regista a duração do bloco."""
+
+        return _Timer(self)
+
+    @staticmethod
+    def _bounds(index):
+        e, sub = divmod(index, SUB_BUCKETS)
+        low = math.ldexp(0.5 + sub / (2 * SUB_BUCKETS), e)
+        high = math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), e)
+        return low, high
+
+    def _state(self):
+        with self._lock:
+            return sorted(self._counts.items()), self._zero, self._count, self._sum, self._max
+
+    def quantile(self, q):
+        """Valor abaixo do qual fica a fração q das observações (0 se vazio)."""
+
+        counts, zero, count, _, top = self._state()
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = zero
+        if seen >= rank:
+            return 0.0
+        for index, n in counts:
+            seen += n
+            if seen >= rank:
+                return min(self._bounds(index)[1], top)
+        return top
+
+    def buckets(self, bounds):
+        """Contagens cumulativas por limite 'le' (cada balde conta pelo seu meio)."""
+
+        counts, zero, count, _, _ = self._state()
+        result = []
+        seen = zero
+        i = 0
+        for le in bounds:
+            while i < len(counts) and sum(self._bounds(counts[i][0])) / 2 <= le:
+                seen += counts[i][1]
+                i += 1
+            result.append((le, seen))
+        result.append((math.inf, count))
+        return result
+
+    def get(self):
+        _, _, count, total, _ = self._state()
+        return count, total
+
+
+# =========================================================
+# Métricas (uma série por combinação de etiquetas)
+# =========================================================
+
+class _Metric:
+    kind = None
+    _child_class = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            self.labels()   # Sem etiquetas: a série existe (a 0) desde o início
+
+    def labels(self, *values):
+        """Série para os valores de etiqueta indicados (criada na primeira vez)."""
+
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name}: esperava etiquetas {self.label_names}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._child_class()
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(values, None)
+
+    def _series(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            try:
+                lines.extend(self._render_child(values, child))
+            except Exception:
+                pass   # Uma função de set_function que falha não estraga o resto
+        return lines
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.label_names, values)} {_format_value(child.get())}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _child_class = _CounterChild
+
+    def inc(self, n=1):
+        self.labels().inc(n)
+
+    def set_function(self, fn):
+        self.labels().set_function(fn)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _child_class = _GaugeChild
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, n=1):
+        self.labels().inc(n)
+
+    def dec(self, n=1):
+        self.labels().dec(n)
+
+    def set_function(self, fn):
+        self.labels().set_function(fn)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    _child_class = _HistogramChild
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.bucket_bounds = tuple(sorted(buckets))
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def quantile(self, q):
+        return self.labels().quantile(q)
+
+    def _render_child(self, values, child):
+        for le, n in child.buckets(self.bucket_bounds):
+            labels = _format_labels(self.label_names, values, ("le", _format_value(float(le))))
+            yield f"{self.name}_bucket{labels} {n}"
+        count, total = child.get()
+        labels = _format_labels(self.label_names, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {count}"
+
+
+# =========================================================
+# Registo
+# =========================================================
+
+class Registry:
+    """Conjunto de métricas de um processo. Registar duas vezes o mesmo nome
+    devolve a métrica já existente (os módulos podem ser recarregados)."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Métrica {name} já existe com outro tipo")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self):
+        """Todas as métricas no formato de texto do Prometheus (0.0.4)."""
+
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+render = REGISTRY.render
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class TimedLock:
+    """Lock que regista num histograma o tempo de espera quando está ocupado.
+
+    A aquisição sem contenção não mede nada (só uma tentativa sem bloquear),
+    por isso o _count do histograma é o número de esperas.
+    """
+
+    __slots__ = ("_lock", "_wait")
+
+    def __init__(self, wait_histogram, lock=None):
+        self._lock = lock if lock is not None else threading.Lock()
+        self._wait = wait_histogram
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        self._wait.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
@@ -1,3 +1,8 @@
+# Versões do protocolo (byte 'version' do header)
+PROTOCOL_VERSION_PICKLE = 1   # Payload serializado com pickle (rovers antigos)
+PROTOCOL_VERSION_BINARY = 2   # Payload com layout binário fixo por ação
+PROTOCOL_VERSION        = PROTOCOL_VERSION_BINARY
+
 # Message Types
 MSG_TYPE_MISSIONLINK = 1
 MSG_TYPE_TELEMETRY   = 2
@@ -10,6 +15,7 @@ ML_CANCEL            = 4
 ML_ERROR             = 5
 ML_REQUEST           = 6
 ML_COMPLETE          = 7
+ML_BATCH             = 8    # Vários ML_UPDATE num só datagrama
 
 # TelemetryStream Actions
 TS_CONNECT           = 1
@@ -18,3 +24,30 @@ TS_ACK               = 3
 TS_HEARTBEAT         = 4
 TS_DISCONNECT        = 5
 TS_ERROR             = 6
+TS_DELTA             = 7    # Só os campos que mudaram (ver codec.OPTIONAL_SCHEMAS)
+
+# Estados conhecidos (rover e missão), codificados como índice de 1 byte.
+# ATENÇÃO: só acrescentar no fim, a ordem faz parte do formato binário.
+STATUS_CODES = (
+    "idle",
+    "in_mission",
+    "charging",
+    "offline",
+    "assigned",
+    "in_progress",
+    "moving",
+    "collecting",
+    "completed",
+    "incomplete",
+    "aborted",
+)
+
+# Nomes das ações (etiquetas das métricas)
+ML_ACTION_NAMES = {
+    ML_NEW_MISSION: "new_mission", ML_ACK: "ack", ML_UPDATE: "update", ML_CANCEL: "cancel",
+    ML_ERROR: "error", ML_REQUEST: "request", ML_COMPLETE: "complete", ML_BATCH: "batch",
+}
+TS_ACTION_NAMES = {
+    TS_CONNECT: "connect", TS_UPDATE: "update", TS_ACK: "ack", TS_HEARTBEAT: "heartbeat",
+    TS_DISCONNECT: "disconnect", TS_ERROR: "error", TS_DELTA: "delta",
+}
@@ -0,0 +1,282 @@
+# common/reliability.py
+"""Entrega fiável de datagramas MissionLink (usado pela Nave-Mãe e pelos rovers).
+
+Cada mensagem fiável leva um número de sequência no campo 'seq' do header;
+o ACK correspondente devolve esse mesmo 'seq'. O emissor retransmite com um
+RTO calculado por par (Jacobson/Karels, com backoff exponencial e o algoritmo
+de Karn) e o recetor descarta duplicados pelo 'seq'.
+
+seq = 0 fica reservado para mensagens sem entrega garantida (e para
+emissores antigos, que enviam sempre 0).
+
+Os pares são identificados pelo que vem nos datagramas (ex.: rover_id), por
+isso o estado de cada par é esquecido quando fica parado: ao fim de DEDUP_TTL
+no filtro de duplicados e de PEER_TTL no emissor (se não tiver nada em voo).
+"""
+import threading
+import time
+from collections import deque
+
+INITIAL_RTO = 1.0      # segundos, antes da primeira amostra de RTT (RFC 6298)
+MIN_RTO = 0.2
+MAX_RTO = 10.0
+CLOCK_GRANULARITY = 0.01
+ALPHA = 1 / 8          # peso de cada amostra no SRTT
+BETA = 1 / 4           # peso de cada amostra no RTTVAR
+K = 4
+
+MAX_RETRIES = 8        # retransmissões antes de desistir
+WINDOW = 4             # mensagens fiáveis em voo por par
+
+DEDUP_TTL = 60.0       # segundos durante os quais um seq é lembrado
+DEDUP_SIZE = 256       # seqs lembrados por par
+
+PEER_TTL = 120.0       # segundos sem mensagens até o emissor esquecer um par (muito acima de MAX_RTO)
+PRUNE_INTERVAL = 10.0  # segundos entre limpezas dos pares parados
+
+
+class RttEstimator:
+    """SRTT/RTTVAR/RTO de um par (Jacobson/Karels)."""
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = INITIAL_RTO
+
+    def sample(self, rtt):
+        """Nova medição de RTT (nunca de uma mensagem retransmitida)."""
+
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + max(CLOCK_GRANULARITY, K * self.rttvar)))
+
+    def backoff(self):
+        """Duplica o RTO depois de um timeout."""
+
+        self.rto = min(MAX_RTO, self.rto * 2)
+
+
+class DuplicateFilter:
+    """Lembra os últimos valores vistos por par (ex.: seq), durante algum tempo."""
+
+    def __init__(self, ttl=DEDUP_TTL, size=DEDUP_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._seen = {}   # par -> (deque de (instante, valor), set de valores)
+        self._lock = threading.Lock()
+        self._pruned = 0.0
+
+    def seen(self, key, value, now=None):
+        """Regista o valor; devolve True se já tinha sido visto (duplicado)."""
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self._pruned >= self.ttl:
+                self._prune(now)
+
+            entry = self._seen.get(key)
+            if entry is None:
+                entry = self._seen[key] = (deque(), set())
+            order, values = entry
+
+            while order and (len(order) >= self.size or now - order[0][0] > self.ttl):
+                values.discard(order.popleft()[1])
+
+            if value in values:
+                return True
+            order.append((now, value))
+            values.add(value)
+            return False
+
+    def _prune(self, now):
+        # Pares cujo valor mais recente já expirou (com a lock adquirida)
+        self._pruned = now
+        stale = [key for key, (order, _) in self._seen.items() if not order or now - order[-1][0] > self.ttl]
+        for key in stale:
+            del self._seen[key]
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class _Outstanding:
+    __slots__ = ("seq", "pkt", "sent_at", "deadline", "retries")
+
+    def __init__(self, seq, pkt):
+        self.seq = seq
+        self.pkt = pkt
+        self.sent_at = None
+        self.deadline = None
+        self.retries = 0
+
+
+class _Peer:
+    def __init__(self):
+        self.rtt = RttEstimator()
+        self.seq = 0
+        self.in_flight = {}      # seq -> _Outstanding
+        self.queued = deque()    # à espera de lugar na janela
+        self.used = time.monotonic()   # última mensagem enviada ou confirmada
+
+
+class ReliableSender:
+    """Mensagens fiáveis em voo, por par, com retransmissão por RTO.
+
+    send_fn(key, pkt) envia o pacote para o par 'key' (o endereço é resolvido
+    por quem usa, para acompanhar mudanças de porta do par). poll() tem de ser
+    chamado periodicamente para retransmitir o que expirou.
+    """
+
+    def __init__(self, send_fn, window=WINDOW, max_retries=MAX_RETRIES, on_give_up=None):
+        self._send_fn = send_fn
+        self.window = window
+        self.max_retries = max_retries
+        self.on_give_up = on_give_up
+        self._peers = {}
+        self._active = set()     # pares com mensagens em voo (poll() só vê estes)
+        self._lock = threading.Lock()
+        self._pruned = time.monotonic()
+
+        self.sent = 0
+        self.retransmissions = 0
+        self.give_ups = 0
+
+    def _peer(self, key):
+        peer = self._peers.get(key)
+        if peer is None:
+            peer = self._peers[key] = _Peer()
+        return peer
+
+    def next_seq(self, key):
+        """Próximo número de sequência para o par (1..65535, nunca 0)."""
+
+        with self._lock:
+            peer = self._peer(key)
+            peer.seq = peer.seq % 65535 + 1
+            peer.used = time.monotonic()
+            return peer.seq
+
+    def _transmit(self, key, peer, out, now):
+        out.sent_at = now
+        out.deadline = now + peer.rtt.rto
+        peer.in_flight[out.seq] = out
+        self._active.add(key)
+        self._send_fn(key, out.pkt)
+
+    def send(self, key, seq, pkt, now=None):
+        """Envia (ou põe em fila, se a janela estiver cheia) uma mensagem fiável."""
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            peer = self._peer(key)
+            peer.used = now
+            out = _Outstanding(seq, pkt)
+            self.sent += 1
+            if len(peer.in_flight) < self.window:
+                self._transmit(key, peer, out, now)
+            else:
+                peer.queued.append(out)
+
+    def ack(self, key, seq, now=None):
+        """Confirmação do par; devolve True se correspondia a uma mensagem em voo."""
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            peer = self._peers.get(key)
+            if peer is None:
+                return False
+            out = peer.in_flight.pop(seq, None)
+            if out is None:
+                return False
+
+            peer.used = now
+            if out.retries == 0:
+                peer.rtt.sample(now - out.sent_at)   # Karn: só sem retransmissões
+
+            while peer.queued and len(peer.in_flight) < self.window:
+                self._transmit(key, peer, peer.queued.popleft(), now)
+            if not peer.in_flight:
+                self._active.discard(key)
+            return True
+
+    def cancel(self, key):
+        """Esquece tudo o que está em voo ou em fila para o par."""
+
+        with self._lock:
+            peer = self._peers.get(key)
+            if peer is not None:
+                peer.in_flight.clear()
+                peer.queued.clear()
+            self._active.discard(key)
+
+    def pending(self, key=None):
+        """Número de mensagens em voo ou em fila (de um par ou no total)."""
+
+        with self._lock:
+            peers = self._peers.values() if key is None else [self._peers.get(key)]
+            return sum(len(p.in_flight) + len(p.queued) for p in peers if p is not None)
+
+    def rto(self, key):
+        with self._lock:
+            peer = self._peers.get(key)
+            return peer.rtt.rto if peer is not None else INITIAL_RTO
+
+    def peers(self):
+        """Número de pares lembrados."""
+
+        return len(self._peers)
+
+    def _prune(self, now):
+        # Pares sem nada em voo nem em fila e parados há PEER_TTL (com a lock adquirida)
+        self._pruned = now
+        stale = [key for key, peer in self._peers.items()
+                 if key not in self._active and not peer.queued and now - peer.used > PEER_TTL]
+        for key in stale:
+            del self._peers[key]
+
+    def poll(self, now=None):
+        """Retransmite as mensagens cujo RTO expirou; devolve o próximo prazo (ou None)."""
+
+        now = time.monotonic() if now is None else now
+        given_up = []
+        next_deadline = None
+
+        with self._lock:
+            if now - self._pruned >= PRUNE_INTERVAL:
+                self._prune(now)
+
+            for key in list(self._active):
+                peer = self._peers[key]
+                expired = [out for out in peer.in_flight.values() if out.deadline <= now]
+                if expired:
+                    peer.rtt.backoff()   # Um timeout por par e por volta
+
+                for out in expired:
+                    if out.retries >= self.max_retries:
+                        del peer.in_flight[out.seq]
+                        given_up.append((key, out.seq))
+                        continue
+                    out.retries += 1
+                    out.deadline = now + peer.rtt.rto
+                    self.retransmissions += 1
+                    self._send_fn(key, out.pkt)
+
+                while peer.queued and len(peer.in_flight) < self.window:
+                    self._transmit(key, peer, peer.queued.popleft(), now)
+
+                if not peer.in_flight:
+                    self._active.discard(key)
+                for out in peer.in_flight.values():
+                    if next_deadline is None or out.deadline < next_deadline:
+                        next_deadline = out.deadline
+
+        self.give_ups += len(given_up)
+        if self.on_give_up is not None:
+            for key, seq in given_up:
+                self.on_give_up(key, seq)
+        return next_deadline
@@ -2,10 +2,172 @@ import sys, os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from flask import Flask, jsonify, request
+import argparse
+import json
+import threading
+import time
+
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from state.rover_state import get_snapshot, get_history_snapshot
-from missionlink_server import add_pending_mission
+from common import metrics
+from common.log import get_logger, setup_logging, restart_logging, add_logging_args
+from state.subscriptions import SubscriptionHub
+from mission_queue import validate_mission
+
+STREAM_WINDOW = 0.2        # Janela de coalescência por cliente (segundos)
+STREAM_MAX_WINDOW = 5.0
+STREAM_KEEPALIVE = 15.0    # Comentário SSE para detetar clientes que saíram
+
+API_HOST = "0.0.0.0"
+API_PORT = 8000
+
+log = get_logger("API")
+
+# =========================================================
+# Origem do estado
+# =========================================================
+
+class _LocalBackend:
+    """API no mesmo processo que a ingestão (servidor de desenvolvimento)."""
+
+    def __init__(self):
+        # Import tardio: quem usa o backend partilhado não carrega o estado
+        from state import rover_state
+        import missionlink_server
+        import scheduler
+        import profiler
+
+        self._state = rover_state
+        self.submit_mission = scheduler.submit_mission
+        self.add_mission_batch = scheduler.add_mission_batch
+        self.scheduler_state = scheduler.get_scheduler_state
+        self.add_pending_mission = missionlink_server.add_pending_mission
+        self.mission_queues = missionlink_server.get_mission_queues
+        self.profiler = profiler.control
+        self.subscribe = rover_state.subscribe
+        self.unsubscribe = rover_state.unsubscribe
+
+    def state(self):
+        """(etag, corpo JSON) do estado atual."""
+        view = self._state.get_state_view()
+        return view.etag, view.json_body()
+
+    def history_json(self):
+        return json.dumps(self._state.get_history_snapshot()).encode("utf-8")
+
+    def telemetry(self, rover_id, t0, t1, step):
+        return self._state.get_telemetry_history(rover_id, t0, t1, step)
+
+    def metrics(self):
+        return metrics.render()
+
+
+class _SharedBackend:
+    """API num processo à parte: lê a memória partilhada e envia comandos."""
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self):
+        from state.shared_state import SharedStateReader, CommandClient
+
+        self._reader = SharedStateReader()
+        self._commands = CommandClient()
+        self._hub = SubscriptionHub()
+        self._poller = None
+        self._poller_lock = threading.Lock()
+
+    def _read(self):
+        try:
+            data = self._reader.read()
+        except FileNotFoundError:
+            data = None      # Ingestão ainda não arrancou
+        return data or ("0-0", b"{}", b"[]")
+
+    def state(self):
+        etag, body, _ = self._read()
+        return etag, body
+
+    def history_json(self):
+        return self._read()[2]
+
+    def add_pending_mission(self, rover_id, data):
+        return self._commands.call("add_pending_mission", rover_id, data)
+
+    def add_mission_batch(self, missions):
+        # Um só comando: o lote não fica a meio se a ligação falhar
+        return self._commands.call("add_mission_batch", missions)
+
+    def mission_queues(self):
+        return self._commands.call("get_mission_queues")
+
+    def submit_mission(self, data):
+        return self._commands.call("submit_mission", data)
+
+    def scheduler_state(self):
+        return self._commands.call("get_scheduler_state")
+
+    def telemetry(self, rover_id, t0, t1, step):
+        # O histórico recente só existe na memória do processo de ingestão
+        return self._commands.call("get_telemetry_history", rover_id, t0, t1, step)
+
+    def metrics(self):
+        # As métricas da ingestão estão no registo do outro processo
+        return self._commands.call("render_metrics")
+
+    def profiler(self, action, **options):
+        # O que interessa perfilar é a ingestão, não o worker da API
+        return self._commands.call("profiler", action, **options)
+
+    # Os deltas do SSE saem da comparação de snapshots sucessivos, feita
+    # por uma só thread por worker e partilhada por todos os clientes
+
+    def subscribe(self):
+        with self._poller_lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="shared-poller", daemon=True)
+                self._poller.start()
+        return self._hub.subscribe()
+
+    def unsubscribe(self, sub):
+        self._hub.unsubscribe(sub)
+
+    def _poll_loop(self):
+        last_etag, last_rovers, last_history = None, {}, None
+
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+            if not self._hub:
+                continue
+
+            etag, body, history = self._read()
+            if etag != last_etag:
+                rovers = json.loads(body)
+                for rid, r in rovers.items():
+                    old = last_rovers.get(rid, {})
+                    delta = {k: v for k, v in r.items() if old.get(k) != v}
+                    if delta:
+                        self._hub.publish(rid, delta)
+                last_etag, last_rovers = etag, rovers
+
+            if history != last_history:
+                if last_history is not None:
+                    self._hub.publish_history()
+                last_history = history
+
+
+_backend = None
+
+def configure_backend(kind="local"):
+    """Escolhe de onde a API lê o estado: 'local' (mesmo processo) ou 'shared'."""
+
+    global _backend
+    _backend = _SharedBackend() if kind == "shared" else _LocalBackend()
+    return _backend
+
+def _get_backend():
+    if _backend is None:
+        configure_backend()
+    return _backend
 
 
 app = Flask(__name__)
@@ -13,39 +175,274 @@ CORS(app)
 
 @app.route("/api/state")
 def get_state():
-    """Retorna o estado atual dos rovers."""
-    return jsonify(get_snapshot())
+    """Retorna o estado atual dos rovers.
+
+    O corpo JSON vem já serializado da vista imutável; se o cliente enviar
+    If-None-Match com a ETag atual, responde 304 sem corpo.
+    """
+    etag, body = _get_backend().state()
+
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype="application/json")
+
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # Revalidar sempre com a ETag
+    return resp
+
+@app.route("/metrics")
+def get_metrics():
+    """Métricas da Nave-Mãe no formato de texto do Prometheus."""
+
+    return Response(_get_backend().metrics(), content_type=metrics.CONTENT_TYPE)
+
+@app.route("/api/profiler")
+def get_profiler():
+    """Estado do profiler por amostragem e resultado do último perfil."""
+
+    return jsonify(_get_backend().profiler("status"))
+
+@app.route("/api/profiler/<action>", methods=["POST"])
+def control_profiler(action):
+    """Liga (start, com "hz" e "seconds" opcionais) ou desliga (stop) o
+    profiler da Nave-Mãe. Os ficheiros ficam em profiles/ no processo de ingestão."""
+
+    if action not in ("start", "stop"):
+        return jsonify({"error": f"Ação desconhecida: {action}"}), 404
+
+    data = request.get_json(silent=True) or {}
+    options = {k: data[k] for k in ("hz", "seconds") if data.get(k) is not None} if action == "start" else {}
+    try:
+        return jsonify(_get_backend().profiler(action, **options))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route("/api/history")
 def get_history():
     """Retorna o histórico de estados dos rovers."""
-    
-    return jsonify(get_history_snapshot())
+
+    return Response(_get_backend().history_json(), mimetype="application/json")
+
+@app.route("/api/rovers/<rover_id>/telemetry")
+def get_rover_telemetry(rover_id):
+    """Histórico de telemetria de um rover.
+
+    Parâmetros: from/to em segundos epoch (por omissão, a última hora) e
+    step em segundos (médias por intervalo; sem step, amostras em bruto).
+    As colunas vêm como listas paralelas (timestamp, x, y, z, battery, speed).
+    """
+    try:
+        t1 = float(request.args["to"]) if "to" in request.args else time.time()
+        t0 = float(request.args["from"]) if "from" in request.args else t1 - 3600
+        step = float(request.args["step"]) if "step" in request.args else None
+    except ValueError:
+        return jsonify({"error": "from, to e step têm de ser números"}), 400
+
+    if t0 > t1 or (step is not None and step <= 0):
+        return jsonify({"error": "Intervalo inválido"}), 400
+
+    data = _get_backend().telemetry(rover_id, t0, t1, step)
+    if data is None:
+        return jsonify({"error": "Rover sem histórico"}), 404
+    return jsonify(data)
+
+def _sse(event, data):
+    """Formata um evento Server-Sent Events."""
+
+    return f"event: {event}\ndata: {data}\n\n"
+
+@app.route("/api/stream")
+def stream_state():
+    """Stream SSE do estado: snapshot completo ao ligar e depois só deltas.
+
+    As alterações que chegam durante a janela (?window=, em segundos) são
+    juntas num só evento por cliente.
+    """
+    try:
+        window = float(request.args.get("window", STREAM_WINDOW))
+    except ValueError:
+        window = STREAM_WINDOW
+    window = min(max(window, 0.0), STREAM_MAX_WINDOW)
+
+    backend = _get_backend()
+
+    def events():
+        # Subscrever antes do snapshot para não perder nada pelo meio
+        sub = backend.subscribe()
+        try:
+            yield _sse("snapshot", backend.state()[1].decode("utf-8"))
+            yield _sse("history", backend.history_json().decode("utf-8"))
+
+            while True:
+                if not sub.wait(STREAM_KEEPALIVE):
+                    yield ": keepalive\n\n"
+                    continue
+
+                if window:
+                    time.sleep(window)
+
+                deltas, history_changed = sub.drain()
+                if deltas:
+                    yield _sse("delta", json.dumps(deltas, separators=(",", ":")))
+                if history_changed:
+                    yield _sse("history", backend.history_json().decode("utf-8"))
+        finally:
+            backend.unsubscribe(sub)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/missions", methods=["POST"])
 
 def create_mission():
-    """Endpoint para criar uma nova missão para um rover."""
-    
+    """Endpoint para criar uma nova missão para um rover.
+
+    Sem rover_id, a missão vai para o escalonador, que escolhe o rover.
+    """
+
+    data = request.get_json(silent=True)
+    try:
+        validate_mission(data)
+    except ValueError as e:
+        return jsonify({"error": f"Missão inválida: {e}"}), 400
+
     try:
-        data = request.json
-        
         rover_id = data.get("rover_id")
-        
+
         if not rover_id:
-            return jsonify({"error": "Rover ID em falta"}), 400
+            ticket = _get_backend().submit_mission(data)
+            return jsonify({"status": "ok", "msg": "Entregue ao escalonador", "ticket": ticket}), 200
 
         # Passar os dados da Web diretamente para a fila
         # O MissionLinkClient é que vai lidar com a lógica
-        
-        add_pending_mission(rover_id, data)
-        
-        return jsonify({"status": "ok", "msg": "Recebido"}), 200
+
+        queued = _get_backend().add_pending_mission(rover_id, data)
+
+        return jsonify({"status": "ok", "msg": "Recebido", "queued": queued}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/missions/batch", methods=["POST"])
+def create_missions_batch():
+    """Agenda várias missões de uma vez.
+
+    Aceita uma lista de missões (ou {"missions": [...]}), cada uma com o seu
+    rover_id e, opcionalmente, priority, deadline e preempt. As que não têm
+    rover_id vão para o escalonador. Todas são validadas antes de alguma
+    entrar numa fila: com uma inválida (400) não entra nenhuma. O lote vai
+    para a ingestão numa só chamada (add_mission_batch).
+    """
+
+    data = request.get_json(silent=True)
+    missions = data.get("missions") if isinstance(data, dict) else data
+
+    if not isinstance(missions, list) or not missions:
+        return jsonify({"error": "Lista de missões em falta"}), 400
+
+    for i, mission in enumerate(missions):
+        try:
+            validate_mission(mission)
+        except ValueError as e:
+            return jsonify({"error": f"Missão {i}: {e}"}), 400
+
+    try:
+        result = _get_backend().add_mission_batch(missions)
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"error": f"Missão inválida: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"status": "ok", **result}), 200
+
+@app.route("/api/scheduler")
+def get_scheduler():
+    """Missões à espera do escalonador e a que rovers foram atribuídas."""
+
+    return jsonify(_get_backend().scheduler_state())
+
+@app.route("/api/missions/queue")
+def get_mission_queue():
+    """Missões à espera, por rover, pela ordem em que vão ser enviadas."""
+
+    return jsonify(_get_backend().mission_queues())
+
 def start_api_server():
-    """Inicia o servidor API."""
-    
-    app.run(host="0.0.0.0", port=8000, debug=False)
+    """Inicia o servidor API de desenvolvimento (mesmo processo que a ingestão)."""
+
+    configure_backend("local")
+    app.run(host=API_HOST, port=API_PORT, debug=False, threaded=True)
+
+# =========================================================
+# Servidores de produção
+# =========================================================
+
+def _serve_gunicorn(host, port, workers, threads, keepalive):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise RuntimeError("gunicorn não está instalado (pip install gunicorn)")
+
+    class _Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", "gthread")   # SSE ocupa uma thread por cliente
+            self.cfg.set("threads", threads)
+            self.cfg.set("keepalive", keepalive)
+            self.cfg.set("timeout", 0)                # Streams SSE não têm fim
+            self.cfg.set("post_fork", lambda server, worker: restart_logging())
+
+        def load(self):
+            return app
+
+    _Application().run()
+
+def _serve_waitress(host, port, threads, keepalive):
+    try:
+        from waitress import serve
+    except ImportError:
+        raise RuntimeError("waitress não está instalado (pip install waitress)")
+
+    serve(app, host=host, port=port, threads=threads, channel_timeout=max(keepalive, 60))
+
+def serve_production(server="gunicorn", host=API_HOST, port=API_PORT, workers=4, threads=32, keepalive=5):
+    """Serve a API com um servidor WSGI de produção, separado da ingestão.
+
+    Os workers leem o estado que a Nave-Mãe publica em memória partilhada
+    (main.py --api shared); nunca importam rover_state.
+    """
+
+    configure_backend("shared")
+    log.info("%s em %s:%s (workers=%s, threads=%s)", server, host, port, workers, threads)
+
+    if server == "gunicorn":
+        _serve_gunicorn(host, port, workers, threads, keepalive)
+    elif server == "waitress":
+        # waitress não faz fork: um processo com várias threads
+        _serve_waitress(host, port, threads, keepalive)
+    else:
+        raise ValueError(f"Servidor desconhecido: {server}")
+
+
+def parse_args():
+    """Opções do servidor API de produção."""
+
+    parser = argparse.ArgumentParser(description="API de Observação (processo separado)")
+    parser.add_argument("--server", choices=["gunicorn", "waitress"], default="gunicorn")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=4, help="processos (só gunicorn)")
+    parser.add_argument("--threads", type=int, default=32, help="threads por processo")
+    parser.add_argument("--keepalive", type=int, default=5, help="segundos de keep-alive HTTP")
+    add_logging_args(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging(args.log_level, args.log_json, rate=args.log_rate)
+    serve_production(args.server, args.host, args.port, args.workers, args.threads, args.keepalive)
@@ -0,0 +1,64 @@
+# navemae/instrumentation.py
+"""Métricas da ingestão comuns ao TelemetryStream e ao MissionLink.
+
+O resto das métricas é definido junto do código que mede (rover_state,
+missionlink_server); todas ficam no mesmo registo e saem em GET /metrics.
+
+Os rover_id vêm dos próprios rovers (qualquer um pode inventar ids), por
+isso só os primeiros MAX_ROVER_SERIES têm série própria em
+navemae_rover_messages_total; os seguintes contam todos em "other".
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+
+from common.codec import ChecksumError
+from common.metrics import counter
+from common.protocol_constants import TS_ACTION_NAMES, ML_ACTION_NAMES
+
+LINK_TS = "ts"
+LINK_ML = "ml"
+
+MAX_ROVER_SERIES = 1000
+OTHER_ROVERS = "other"
+
+FRAMES = counter("navemae_frames_total",
+                 "Mensagens descodificadas, por ligação e ação", ("link", "action"))
+DECODE_ERRORS = counter("navemae_decode_errors_total",
+                        "Mensagens rejeitadas pelo codec (checksum ou corpo inválido)", ("link", "kind"))
+ROVER_MESSAGES = counter("navemae_rover_messages_total",
+                         "Mensagens recebidas de cada rover", ("link", "rover_id"))
+
+_ACTION_NAMES = {LINK_TS: TS_ACTION_NAMES, LINK_ML: ML_ACTION_NAMES}
+
+_rover_labels = set()
+_rover_labels_lock = threading.Lock()
+
+
+def _rover_label(rover_id):
+    """O rover_id como label, ou OTHER_ROVERS depois de MAX_ROVER_SERIES rovers."""
+
+    if rover_id in _rover_labels:
+        return rover_id
+    with _rover_labels_lock:
+        if rover_id in _rover_labels:
+            return rover_id
+        if len(_rover_labels) >= MAX_ROVER_SERIES:
+            return OTHER_ROVERS
+        _rover_labels.add(rover_id)
+        return rover_id
+
+
+def count_frame(link, action, rover_id):
+    """Uma mensagem descodificada com sucesso."""
+
+    FRAMES.labels(link, _ACTION_NAMES[link].get(action, str(action))).inc()
+    if rover_id:
+        ROVER_MESSAGES.labels(link, _rover_label(rover_id)).inc()
+
+
+def count_decode_error(link, exc):
+    """Uma mensagem que o codec não conseguiu descodificar."""
+
+    DECODE_ERRORS.labels(link, "checksum" if isinstance(exc, ChecksumError) else "payload").inc()
@@ -1,28 +1,41 @@
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import argparse
 import threading
 import time
 
-from missionlink_server import start_missionlink
-from telemetry_server import start_telemetry_server
-from state.rover_state import get_snapshot, apply_timeouts
+import missionlink_server
+from missionlink_server import start_missionlink, add_pending_mission, get_mission_queues
+from telemetry_server import start_telemetry_server, MODE_THREAD, MODE_ASYNCIO, DEFAULT_MODE
+from state.rover_state import (
+    get_snapshot, get_state_view, get_history_snapshot, get_telemetry_history,
+    apply_timeouts, flush_state, on_liveness_change, configure_persistence,
+)
+from state.timeseries import RETENTION_HOURS, RAW_CAPACITY, MEMORY_SECONDS
+from state.shared_state import StatePublisher, CommandServer, register_command
 from api_server import start_api_server
+from scheduler import start_scheduler, submit_mission, add_mission_batch, get_scheduler_state
+import profiler
+from common.metrics import render as render_metrics
+from common.log import get_logger, setup_logging, add_logging_args
 
 RUNNING = True
 
+log = get_logger("NM")
+
 def printer_loop():
-    """Imprime o estado global de forma limpa e sem spam."""
+    """Imprime o estado global de forma limpa e sem spam (um só registo)."""
     
     while RUNNING:
         time.sleep(5)
 
         snapshot = get_snapshot()
-        print("\n===== ESTADO GLOBAL DOS ROVERS =====")
+        lines = ["", "===== ESTADO GLOBAL DOS ROVERS ====="]
 
         if not snapshot:
             
-            print("(sem rovers ainda)")
+            lines.append("(sem rovers ainda)")
         else:
             for rid, r in snapshot.items():
                 pos = r.get("position")
@@ -53,23 +66,83 @@ def printer_loop():
                 alive = r.get("alive", False) # 'alive' não está no state, usa-se status
                 flag = "🟢" if stat != "offline" else "🔴"
 
-                print(f"{flag} {rid}: pos={pos_s} | batt={batt_s} | status={stat} | missão={mid_s} ({prog_s})")
+                lines.append(f"{flag} {rid}: pos={pos_s} | batt={batt_s} | status={stat} | missão={mid_s} ({prog_s})")
+
+        lines.append("====================================")
+        log.info("\n".join(lines), extra={"event": "nm.dump"})
+
+
+def log_liveness(rover_id, online, ts):
+    """Transições de liveness (em vez de as descobrir no printer_loop)."""
+
+    when = time.strftime("%H:%M:%S", time.localtime(ts))
+    if online:
+        log.info("🟢 %s online (%s)", rover_id, when, extra={"event": "nm.online", "rover_id": rover_id})
+    else:
+        log.info("🔴 %s offline (%s)", rover_id, when, extra={"event": "nm.offline", "rover_id": rover_id})
+
+
+def parse_args():
+    """Opções de arranque da Nave-Mãe."""
 
-        print("====================================")
+    parser = argparse.ArgumentParser(description="Nave-Mãe (TelemetryStream + MissionLink + API)")
+    parser.add_argument("--ts-mode", choices=[MODE_ASYNCIO, MODE_THREAD], default=DEFAULT_MODE,
+                        help="modo do servidor TelemetryStream (default: %(default)s)")
+    parser.add_argument("--ml-mode", choices=[missionlink_server.MODE_ASYNCIO, missionlink_server.MODE_THREAD],
+                        default=missionlink_server.DEFAULT_MODE,
+                        help="modo do servidor MissionLink (default: %(default)s)")
+    parser.add_argument("--api", choices=["embedded", "shared"], default="embedded",
+                        help="embedded: Flask neste processo; shared: publicar o estado para "
+                             "um servidor API separado (python3 navemae/api_server.py)")
+    parser.add_argument("--telemetry-retention", type=float, default=RETENTION_HOURS, metavar="HORAS",
+                        help="idade máxima do histórico de telemetria em disco (default: %(default)s)")
+    parser.add_argument("--telemetry-raw", type=int, default=RAW_CAPACITY, metavar="AMOSTRAS",
+                        help="amostras em bruto em memória por rover (default: %(default)s)")
+    parser.add_argument("--telemetry-memory", type=float, default=MEMORY_SECONDS / 60, metavar="MINUTOS",
+                        help="janela das médias de 10 s / 1 min em memória; o resto vem do disco "
+                             "(default: %(default)s)")
+    add_logging_args(parser)
+    return parser.parse_args()
 
 
 def main():
     global RUNNING
-    print("[NM] A iniciar TelemetryStream e MissionLink...")
+    args = parse_args()
+    setup_logging(args.log_level, args.log_json, rate=args.log_rate)
+    configure_persistence(telemetry_retention=args.telemetry_retention, telemetry_raw=args.telemetry_raw,
+                          telemetry_memory=args.telemetry_memory)
+    log.info("A iniciar TelemetryStream (%s) e MissionLink (%s)...", args.ts_mode, args.ml_mode)
 
     # Servidor de telemetria TCP
-    threading.Thread(target=start_telemetry_server, daemon=True).start()
+    threading.Thread(target=start_telemetry_server, args=(args.ts_mode,), daemon=True).start()
 
     # Servidor ML UDP
-    threading.Thread(target=start_missionlink, daemon=True).start()
+    threading.Thread(target=start_missionlink, args=(args.ml_mode,), daemon=True).start()
     
     # API Web
-    threading.Thread(target=start_api_server, daemon=True).start()
+    if args.api == "shared":
+        # A API corre noutro processo (gunicorn/waitress) e lê da memória partilhada
+        StatePublisher(get_state_view, get_history_snapshot).start()
+        register_command("add_pending_mission", add_pending_mission)
+        register_command("add_mission_batch", add_mission_batch)
+        register_command("get_mission_queues", get_mission_queues)
+        register_command("submit_mission", submit_mission)
+        register_command("get_scheduler_state", get_scheduler_state)
+        register_command("get_telemetry_history", get_telemetry_history)
+        register_command("render_metrics", render_metrics)
+        register_command("profiler", profiler.control)
+        CommandServer().start()
+        log.info("Estado publicado para a API em processo separado.")
+    else:
+        threading.Thread(target=start_api_server, daemon=True).start()
+
+    on_liveness_change(log_liveness)
+
+    # kill -USR2 <pid> liga/desliga o profiler (também em /api/profiler)
+    profiler.install_signal_handler()
+
+    # Escalonador: atribui as missões que chegam sem rover_id
+    start_scheduler()
 
     # Thread de output organizado
     threading.Thread(target=printer_loop, daemon=True).start()
@@ -78,11 +151,12 @@ def main():
         while True:
             
             time.sleep(1)
-            apply_timeouts()   # marca rovers offline se deixarem de enviar TS/ML
+            apply_timeouts()   # marca offline só os rovers cujo prazo expirou
             
     except KeyboardInterrupt:
         RUNNING = False
-        print("\n[NM] Encerrado manualmente.")
+        flush_state()   # Garante que o último estado fica em disco
+        log.info("Encerrado manualmente.")
 
 
 if __name__ == "__main__":
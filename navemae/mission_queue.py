@@ -0,0 +1,142 @@
+# navemae/mission_queue.py
+"""Fila de missões por rover, ordenada por prioridade e prazo.
+
+Cada rover tem um heap de missões à espera: primeiro a maior prioridade,
+depois o prazo mais próximo, depois a ordem de chegada. Tirar a próxima
+missão custa O(log n); as missões cujo prazo passou são descartadas quando
+chegam ao topo.
+"""
+import heapq
+import itertools
+import math
+import time
+
+DEFAULT_PRIORITY = 0   # Maior número = mais urgente
+
+_order = itertools.count()
+
+
+def _point(value, what):
+    if (not isinstance(value, (list, tuple)) or len(value) < 2
+            or not all(isinstance(c, (int, float)) and not isinstance(c, bool) and math.isfinite(c)
+                       for c in value[:2])):
+        raise ValueError(f"{what} tem de ser [x, y] com números")
+
+def validate_mission(data):
+    """Verifica os parâmetros de uma missão vinda da API; levanta ValueError.
+
+    O rover e o escalonador usam 'duration', 'area' e 'points' sem mais
+    verificações, por isso uma missão mal formada tem de parar aqui.
+    """
+
+    if not isinstance(data, dict) or not data.get("task"):
+        raise ValueError("tarefa em falta")
+    try:
+        int(data.get("priority", DEFAULT_PRIORITY))
+        if data.get("deadline") is not None:
+            float(data["deadline"])
+    except (TypeError, ValueError):
+        raise ValueError("priority/deadline inválidos")
+
+    duration = data.get("duration", 60)
+    if isinstance(duration, bool) or not isinstance(duration, (int, float)) \
+            or not math.isfinite(duration) or duration <= 0:
+        raise ValueError("duration tem de ser um número positivo")
+
+    if "area" in data:
+        area = data["area"]
+        if not isinstance(area, (list, tuple)) or len(area) != 2:
+            raise ValueError("area tem de ser [[min_x, min_y], [max_x, max_y]]")
+        _point(area[0], "area[0]")
+        _point(area[1], "area[1]")
+
+    if "points" in data:
+        points = data["points"]
+        if not isinstance(points, (list, tuple)):
+            raise ValueError("points tem de ser uma lista de [x, y]")
+        for i, p in enumerate(points):
+            _point(p, f"points[{i}]")
+
+
+class QueuedMission:
+    """Missão à espera na fila de um rover."""
+
+    __slots__ = ("data", "priority", "deadline", "preempt", "queued_at", "order")
+
+    def __init__(self, data, priority=DEFAULT_PRIORITY, deadline=None, preempt=False):
+        self.data = data
+        self.priority = priority
+        self.deadline = deadline     # epoch (s); None = sem prazo
+        self.preempt = preempt       # pode interromper uma missão menos prioritária
+        self.queued_at = time.time()
+        self.order = next(_order)
+
+    def key(self):
+        deadline = float("inf") if self.deadline is None else self.deadline
+        return (-self.priority, deadline, self.order)
+
+    def expired(self, now):
+        return self.deadline is not None and now > self.deadline
+
+    def to_dict(self):
+        return {
+            "task": self.data.get("task"), "priority": self.priority,
+            "deadline": self.deadline, "preempt": self.preempt,
+            "queued_at": self.queued_at,
+        }
+
+    @classmethod
+    def from_request(cls, data):
+        """Cria a partir dos dados vindos da API (priority/deadline/preempt opcionais).
+        Levanta ValueError se a missão for inválida (ver validate_mission)."""
+
+        validate_mission(data)
+        priority = int(data.get("priority", DEFAULT_PRIORITY))
+        deadline = data.get("deadline")
+        if deadline is not None:
+            deadline = float(deadline)
+        return cls(data, priority, deadline, bool(data.get("preempt", False)))
+
+
+class MissionQueue:
+    """Missões à espera de um rover (não é thread-safe: usar com o lock do servidor)."""
+
+    def __init__(self):
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, mission):
+        heapq.heappush(self._heap, (mission.key(), mission))
+
+    def pop(self, now=None, expired=None):
+        """Tira a próxima missão válida (ou None); as expiradas vão para 'expired'."""
+
+        now = time.time() if now is None else now
+        heap = self._heap
+        while heap:
+            _, mission = heapq.heappop(heap)
+            if not mission.expired(now):
+                return mission
+            if expired is not None:
+                expired.append(mission)
+        return None
+
+    def remove_if(self, predicate):
+        """Tira da fila as missões para as quais predicate(mission) é verdadeiro."""
+
+        removed = [m for _, m in self._heap if predicate(m)]
+        if removed:
+            self._heap = [(k, m) for k, m in self._heap if not predicate(m)]
+            heapq.heapify(self._heap)
+        return removed
+
+    def peek(self):
+        return self._heap[0][1] if self._heap else None
+
+    def snapshot(self, now=None):
+        """Missões ainda no prazo, pela ordem em que vão sair."""
+
+        now = time.time() if now is None else now
+        return [mission.to_dict() for _, mission in sorted(self._heap) if not mission.expired(now)]
@@ -2,104 +2,408 @@ import sys, os
 # Garante que encontra os módulos common/state
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import asyncio
 import socket
 import threading
 import time
+from collections import deque
 from common.codec import decode_msg, encode_msg
-from common.protocol_constants import ML_REQUEST, ML_ACK, ML_UPDATE, ML_COMPLETE, ML_NEW_MISSION
-from state.rover_state import update_mission, get_last_known_state
+from common.reliability import ReliableSender, DuplicateFilter
+from common.protocol_constants import (
+    ML_REQUEST, ML_ACK, ML_UPDATE, ML_COMPLETE, ML_NEW_MISSION, ML_CANCEL, ML_BATCH, PROTOCOL_VERSION,
+)
+from state.rover_state import update_mission, update_missions, get_last_known_state
 from common.state import get_next_mission_id
+from common.metrics import counter, gauge
+from common.log import get_logger
+from instrumentation import LINK_ML, count_frame, count_decode_error
+from mission_queue import MissionQueue, QueuedMission, DEFAULT_PRIORITY
 
 ML_ADDR = ("0.0.0.0", 5000)
 
+log = get_logger("ML")
+
+# Modos de execução do servidor
+MODE_THREAD  = "thread"    # Uma thread por datagrama (antigo)
+MODE_ASYNCIO = "asyncio"   # Socket lido em rajadas no event loop, ML_UPDATE coalescidos
+DEFAULT_MODE = MODE_ASYNCIO
+
+RETRANSMIT_TICK = 0.02   # segundos entre verificações de RTO expirado
+
+INGEST_BURST = 256       # datagramas lidos de seguida antes de devolver o loop
+INGEST_TICK = 0.05       # segundos entre aplicações dos ML_UPDATE acumulados
+RECV_BUFFER = 1 << 22    # buffer de receção do socket (aguenta as rajadas)
+
+# Socket (ou transport asyncio) onde o servidor está à escuta; as respostas
+# saem por ele, em vez de um socket novo por mensagem
+_reply_sock = None
+_loop = None              # Event loop do servidor (modo asyncio)
+
+# Último endereço e versão de protocolo de cada rover (a porta pode mudar)
+_rover_peers = {}
+# Rovers que pediram missão e ainda não receberam nenhuma
+_idle_rovers = set()
+
 # GESTÃO DE MISSÕES 
-PENDING_MISSIONS = {}       # Fila de espera (Vindas da Web)
+PENDING_MISSIONS = {}       # Filas de espera por rover (Vindas da Web), ver mission_queue.py
 MISSIONS_IN_TRANSIT = {}    # Enviadas mas ainda não confirmadas (Para Retransmissão)
+ACTIVE_MISSIONS = {}        # Confirmadas pelo rover e ainda a decorrer
+
+# Uma missão interrompida por outra mais prioritária volta para a fila
+REQUEUE_PREEMPTED = True
+_cancelling = {}            # mission_id com ML_CANCEL enviado -> (rover_id, seq do ML_CANCEL)
 
 _pending_lock = threading.Lock()
 
+def _call_in_server(fn, *args):
+    """Corre fn no thread do servidor (o transport asyncio não é thread-safe)."""
+
+    if _loop is not None:
+        _loop.call_soon_threadsafe(fn, *args)
+    else:
+        fn(*args)
+
+def _enqueue(rover_id, mission):
+    # Chamado com _pending_lock; devolve o tamanho da fila
+    queue = PENDING_MISSIONS.get(rover_id)
+    if queue is None:
+        queue = PENDING_MISSIONS[rover_id] = MissionQueue()
+    queue.push(mission)
+    return len(queue)
+
+def _after_enqueue(rover_id):
+    # Se o rover já está à espera, segue já (sem esperar pelo próximo ML_REQUEST)
+    if _reply_sock is not None:
+        _call_in_server(_dispatch_pending, rover_id)
+        _call_in_server(_maybe_preempt, rover_id)
+
 def add_pending_mission(rover_id, mission_data):
-    """Função chamada pela API para agendar uma missão."""
+    """Função chamada pela API para agendar uma missão.
+
+    A missão entra na fila do rover; mission_data pode trazer 'priority'
+    (maior = mais urgente), 'deadline' (epoch, descartada se não sair até
+    lá) e 'preempt' (interrompe uma missão em curso menos prioritária).
+    Devolve o tamanho da fila.
+    """
     
+    mission = QueuedMission.from_request(mission_data)
+    with _pending_lock:
+        size = _enqueue(rover_id, mission)
+        log.info("Missão agendada para %s: %s (prioridade %s, %s na fila)", rover_id,
+                 mission_data["task"], mission.priority, size, extra={"rover_id": rover_id})
+
+    _after_enqueue(rover_id)
+    return size
+
+def add_pending_missions(missions):
+    """Agenda várias missões de uma vez (cada uma com o seu 'rover_id').
+
+    Valida tudo antes de pôr alguma na fila; devolve o número agendado.
+    """
+
+    parsed = [(data["rover_id"], QueuedMission.from_request(data)) for data in missions]
+    with _pending_lock:
+        for rover_id, mission in parsed:
+            _enqueue(rover_id, mission)
+    log.info("%s missões agendadas em lote.", len(parsed))
+
+    for rover_id in {rover_id for rover_id, _ in parsed}:
+        _after_enqueue(rover_id)
+    return len(parsed)
+
+def take_pending(rover_id, predicate):
+    """Retira da fila do rover as missões que ainda não saíram e cumprem predicate."""
+
     with _pending_lock:
-        PENDING_MISSIONS[rover_id] = mission_data
-        print(f"[ML] Missão agendada para {rover_id}: {mission_data['task']}")
+        queue = PENDING_MISSIONS.get(rover_id)
+        return queue.remove_if(predicate) if queue else []
 
-def send_message(addr, msg_type, payload, rover_id):
-    """Envia uma mensagem UDP para o rover."""
+def get_mission_queues():
+    """Missões à espera, por rover, pela ordem em que vão ser enviadas."""
+
+    with _pending_lock:
+        return {rid: queue.snapshot() for rid, queue in PENDING_MISSIONS.items() if len(queue)}
+
+def send_message(addr, msg_type, payload, rover_id, version=PROTOCOL_VERSION, seq=0):
+    """Envia uma mensagem UDP para o rover (na versão de protocolo que ele usa)."""
     
     try:
-        pkt = encode_msg(1, 1, msg_type, 0, payload)
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.sendto(pkt, addr)
-        sock.close()
+        pkt = encode_msg(version, 1, msg_type, seq, payload)
+        _reply_sock.sendto(pkt, addr)
         return True
     
     except Exception as e:
-        print(f"[ML] ERRO ao enviar para {addr}: {e}")
+        log.error("Falha ao enviar para %s: %s", addr, e)
         return False
 
-def handle_request(sock, data, addr):
-    """Processa uma mensagem recebida de um rover."""
-    
+# =========================================================
+# Entrega fiável (retransmissão por RTO, ver common/reliability.py)
+# =========================================================
+
+def _send_to_rover(rover_id, pkt):
+    peer = _rover_peers.get(rover_id)
+    if peer is None:
+        return
+    try:
+        _reply_sock.sendto(pkt, peer[0])
+    except Exception as e:
+        log.error("Falha ao enviar para %s: %s", rover_id, e, extra={"rover_id": rover_id})
+
+def _on_give_up(rover_id, seq):
+    # Um ML_CANCEL sem ACK: a missão deixa de estar a ser cancelada, para a
+    # preempção poder voltar a ser tentada
+    with _pending_lock:
+        mid = next((m for m, sent in _cancelling.items() if sent == (rover_id, seq)), None)
+        if mid is not None:
+            del _cancelling[mid]
+    if mid is not None:
+        log.warning("Sem ACK de %s ao ML_CANCEL de %s.", rover_id, mid,
+                    extra={"event": "ml.give_up", "rover_id": rover_id, "mission_id": mid})
+        return
+
+    # A missão continua em trânsito: volta a ser enviada no próximo ML_REQUEST
+    log.warning("Sem ACK de %s (seq=%s); a aguardar novo pedido.", rover_id, seq,
+                extra={"event": "ml.give_up", "rover_id": rover_id})
+
+_reliable = ReliableSender(_send_to_rover, on_give_up=_on_give_up)
+_dedup = DuplicateFilter()
+
+# Métricas (lidas do estado atual quando são exportadas)
+_RELIABLE = counter("navemae_ml_reliable_total",
+                    "Mensagens fiáveis para os rovers: enviadas, retransmissões e desistências", ("event",))
+_RELIABLE.labels("sent").set_function(lambda: _reliable.sent)
+_RELIABLE.labels("retransmission").set_function(lambda: _reliable.retransmissions)
+_RELIABLE.labels("give_up").set_function(lambda: _reliable.give_ups)
+gauge("navemae_ml_reliable_pending", "Mensagens fiáveis em voo ou em fila").set_function(_reliable.pending)
+
+_MISSIONS = gauge("navemae_ml_missions", "Missões por fase de entrega", ("phase",))
+_MISSIONS.labels("queued").set_function(lambda: sum(len(q) for q in list(PENDING_MISSIONS.values())))
+_MISSIONS.labels("in_transit").set_function(lambda: len(MISSIONS_IN_TRANSIT))
+_MISSIONS.labels("active").set_function(lambda: len(ACTIVE_MISSIONS))
+
+def _send_reliable(rover_id, msg_type, payload):
+    """Envia uma mensagem que o rover tem de confirmar com ML_ACK (mesmo seq).
+    Devolve o seq."""
+
+    _, version = _rover_peers[rover_id]
+    seq = _reliable.next_seq(rover_id)
+    _reliable.send(rover_id, seq, encode_msg(version, 1, msg_type, seq, payload))
+    return seq
+
+def _dispatch_pending(rover_id):
+    """Envia a próxima missão da fila se o rover estiver à espera de uma."""
+
+    if rover_id not in _idle_rovers or rover_id not in _rover_peers:
+        return
+
+    expired = []
+    with _pending_lock:
+        queue = PENDING_MISSIONS.get(rover_id)
+        if rover_id in MISSIONS_IN_TRANSIT or not queue:
+            return
+
+        # Retirar da fila de espera (a mais prioritária que ainda esteja no prazo)
+        queued = queue.pop(expired=expired)
+        if queued is None:
+            mission_to_send = None
+        else:
+            # Criar missão final
+            mid = get_next_mission_id()
+            mission_to_send = {
+                "mission_id": mid,
+                **queued.data,
+                "priority": queued.priority,
+            }
+
+            # GUARDAR NA LISTA DE TRÂNSITO (Até receber ACK)
+            MISSIONS_IN_TRANSIT[rover_id] = mission_to_send
+
+    for mission in expired:
+        log.info("Missão %s para %s descartada (prazo ultrapassado).", mission.data.get("task"), rover_id,
+                 extra={"rover_id": rover_id})
+    if mission_to_send is None:
+        return
+
+    _idle_rovers.discard(rover_id)
+    _send_reliable(rover_id, ML_NEW_MISSION, mission_to_send)
+    log.info(">>> Enviada nova missão %s para %s", mid, rover_id,
+             extra={"event": "ml.dispatch", "rover_id": rover_id, "mission_id": mid})
+
+    # Atualizar estado visual apenas na primeira vez
+    pos, _ = get_last_known_state(rover_id)
+    update_mission(rover_id, mid, 0.0, "assigned", pos)
+
+def _maybe_preempt(rover_id):
+    """Cancela a missão em curso se a próxima da fila a puder interromper."""
+
+    with _pending_lock:
+        queue = PENDING_MISSIONS.get(rover_id)
+        top = queue.peek() if queue else None
+        running = ACTIVE_MISSIONS.get(rover_id)
+
+        if top is None or running is None or not top.preempt:
+            return
+        if top.priority <= running.get("priority", DEFAULT_PRIORITY):
+            return
+        mid = running["mission_id"]
+        if mid in _cancelling or rover_id not in _rover_peers:
+            return
+        _cancelling[mid] = (rover_id, None)
+
+    log.info("✋ A cancelar %s de %s (missão mais prioritária na fila)", mid, rover_id,
+             extra={"event": "ml.preempt", "rover_id": rover_id})
+    seq = _send_reliable(rover_id, ML_CANCEL, {
+        "rover_id": rover_id, "mission_id": mid, "reason": "preempted",
+    })
+    with _pending_lock:
+        if mid in _cancelling:
+            _cancelling[mid] = (rover_id, seq)
+
+def _retransmit_tick():
+    # Modo asyncio: verificação periódica no próprio event loop
+    _reliable.poll()
+    _loop.call_later(RETRANSMIT_TICK, _retransmit_tick)
+
+def _retransmit_loop():
+    # Modo thread: verificação periódica num thread próprio
+    while True:
+        time.sleep(RETRANSMIT_TICK)
+        _reliable.poll()
+
+# =========================================================
+# Coalescência dos ML_UPDATE (modo asyncio)
+# =========================================================
+
+class UpdateCoalescer:
+    """ML_UPDATE à espera de serem aplicados: só o mais recente por (rover, missão).
+
+    Do progresso de uma missão só interessa o último valor, por isso um
+    update ainda não aplicado é substituído pelo seguinte. Os pendentes vão
+    para o estado todos juntos (update_missions) a cada INGEST_TICK. As
+    outras mensagens de um rover (ACK, COMPLETE, REQUEST) nunca são
+    coalescidas: antes de as tratar aplicam-se os updates pendentes desse
+    rover, para o estado as ver pela ordem em que chegaram.
+    """
+
+    def __init__(self, loop=None):
+        self._loop = loop
+        self._pending = {}        # rover_id -> {mission_id: (progress, status, position, extra)}
+        self._scheduled = False
+
+        self.received = 0
+        self.applied = 0
+
+    def __len__(self):
+        return sum(len(m) for m in self._pending.values())
+
+    def add(self, rover_id, mission_id, progress, status, position, extra):
+        missions = self._pending.get(rover_id)
+        if missions is None:
+            missions = self._pending[rover_id] = {}
+        missions[mission_id] = (progress, status, position, extra)
+        self.received += 1
+
+    def flush_rover(self, rover_id):
+        """Aplica já os updates pendentes de um rover."""
+
+        missions = self._pending.pop(rover_id, None)
+        if missions:
+            self._apply([(rover_id, mid) + u for mid, u in missions.items()])
+
+    def flush(self):
+        """Aplica todos os updates pendentes numa só transação."""
+
+        pending, self._pending = self._pending, {}
+        if pending:
+            self._apply([(rid, mid) + u for rid, missions in pending.items()
+                         for mid, u in missions.items()])
+
+    def flush_later(self):
+        """Agenda um flush() para daqui a INGEST_TICK (se ainda não houver um)."""
+
+        if self._pending and not self._scheduled:
+            self._scheduled = True
+            self._loop.call_later(INGEST_TICK, self._scheduled_flush)
+
+    def _scheduled_flush(self):
+        self._scheduled = False
+        self.flush()
+
+    def _apply(self, batch):
+        try:
+            update_missions(batch)
+            self.applied += len(batch)
+        except Exception as e:
+            log.error("Falha ao aplicar %s updates: %s", len(batch), e)
+
+
+def _apply_update(rover_id, payload, updates):
+    """Progresso de uma missão (ML_UPDATE ou registo de um ML_BATCH)."""
+
+    pos = payload.get("position")
+    if not pos:
+        return
+
+    mid = payload["mission_id"]
+    extra = payload.get("extra")
+    if updates is not None:
+        updates.add(rover_id, mid, payload["progress"], payload["status"], pos, extra)
+    else:
+        update_mission(rover_id, mid, payload["progress"], payload["status"], pos, extra)
+
+
+def handle_request(sock, data, addr, updates=None):
+    """Processa uma mensagem recebida de um rover.
+
+    Com 'updates' (um UpdateCoalescer), os ML_UPDATE ficam lá à espera em
+    vez de irem logo para o estado.
+    """
+
     try:
         msg = decode_msg(data)
         payload = msg["payload"]
         action = msg["action"]
+        version = msg["version"]
+        seq = msg["seq"]
         
     except Exception as e:
         
-        print(f"[ML] ERRO decode {addr}: {e}")
+        count_decode_error(LINK_ML, e)
+        log.warning("Datagrama inválido de %s: %s", addr, e, extra={"event": "ml.decode_error"})
         return
 
-    rover_id = payload.get("rover_id", "UNKNOWN")
+    rover_id = payload.get("rover_id")
+    if rover_id is None and payload.get("records"):
+        rover_id = payload["records"][0].get("rover_id")   # ML_BATCH
+    rover_id = rover_id or "UNKNOWN"
+    _rover_peers[rover_id] = (addr, version)
+    count_frame(LINK_ML, action, rover_id)
+
+    if updates is not None and action not in (ML_UPDATE, ML_BATCH):
+        updates.flush_rover(rover_id)   # Não passar à frente dos updates deste rover
     
     # 6 — PEDIDO DE MISSÃO (Lógica de Retransmissão)
     
     if action == ML_REQUEST:
-        # print(f"[ML] Pedido de {rover_id}") 
+        log.debug("Pedido de %s", rover_id, extra={"event": "ml.request", "rover_id": rover_id})
+
+        _idle_rovers.add(rover_id)
 
-        mission_to_send = None
-        is_retransmission = False
-        
         with _pending_lock:
-            # 1. PRIORIDADE: Verificar se há missão em trânsito (Retransmissão)
-            # Se o rover pede missão mas nós achamos que já enviámos, é porque ele não recebeu.
-            if rover_id in MISSIONS_IN_TRANSIT:
-                
-                mission_to_send = MISSIONS_IN_TRANSIT[rover_id]
-                is_retransmission = True
-            
-            # 2. Verificar se há nova missão na fila
-            elif rover_id in PENDING_MISSIONS:
-                
-                # Retirar da fila de espera
-                base_data = PENDING_MISSIONS.pop(rover_id)
-                
-                # Criar missão final
-                mid = get_next_mission_id()
-                mission_to_send = {
-                    "mission_id": mid,
-                    **base_data
-                }
-                
-                # GUARDAR NA LISTA DE TRÂNSITO (Até receber ACK)
-                MISSIONS_IN_TRANSIT[rover_id] = mission_to_send
+            in_transit = MISSIONS_IN_TRANSIT.get(rover_id)
+            ACTIVE_MISSIONS.pop(rover_id, None)   # Quem pede missão não está a fazer nenhuma
 
-        if mission_to_send:
-            
-            send_message(addr, ML_NEW_MISSION, mission_to_send, rover_id)
-            
-            if is_retransmission:
-                
-                print(f"[ML] ⚠️ RETRANSMISSÃO: {mission_to_send['mission_id']} para {rover_id}")
-                
-            else:
-                print(f"[ML] >>> Enviada nova missão {mission_to_send['mission_id']} para {rover_id}")
-                # Atualizar estado visual apenas na primeira vez
-                pos, _ = get_last_known_state(rover_id)
-                update_mission(rover_id, mission_to_send['mission_id'], 0.0, "assigned", pos)
-        
+        # 1. PRIORIDADE: missão em trânsito. Enquanto houver retransmissões em
+        # curso não há nada a fazer; se já desistimos, recomeça a entrega.
+        if in_transit is not None:
+            if not _reliable.pending(rover_id):
+                _send_reliable(rover_id, ML_NEW_MISSION, in_transit)
+                log.warning("⚠️ RETRANSMISSÃO: %s para %s", in_transit["mission_id"], rover_id,
+                            extra={"event": "ml.retransmit", "rover_id": rover_id})
+            return
+
+        # 2. Verificar se há nova missão na fila
+        _dispatch_pending(rover_id)
         return
 
     
@@ -108,34 +412,53 @@ def handle_request(sock, data, addr):
     elif action == ML_ACK:
         
         mid = payload.get("mission_id")
-        print(f"[ML] ACK confirmado de {rover_id} para {mid}")
+
+        # O seq do ACK é o da ML_NEW_MISSION confirmada (dá uma amostra de RTT)
+        acked = _reliable.ack(rover_id, seq)
         
         # SUCESSO: Remover da lista de trânsito (já não precisa de retransmitir)
+        confirmed = False
         with _pending_lock:
             
             if rover_id in MISSIONS_IN_TRANSIT:
                 
                 if MISSIONS_IN_TRANSIT[rover_id]["mission_id"] == mid:
-                    del MISSIONS_IN_TRANSIT[rover_id]
+                    ACTIVE_MISSIONS[rover_id] = MISSIONS_IN_TRANSIT.pop(rover_id)
+                    confirmed = True
 
-        pos, _ = get_last_known_state(rover_id)
-        
-        update_mission(rover_id, mid, 0.0, "in_progress", pos)
-        
-        send_message(addr, ML_ACK, {"ok": True}, rover_id)
+        if confirmed and not acked:
+            _reliable.cancel(rover_id)   # Rover antigo: o ACK não traz o seq
+
+        # ACKs repetidos (retransmissões que se cruzaram) não mexem no estado
+        if confirmed:
+            log.info("ACK confirmado de %s para %s", rover_id, mid,
+                     extra={"event": "ml.ack", "rover_id": rover_id, "mission_id": mid})
+            pos, _ = get_last_known_state(rover_id)
+            
+            update_mission(rover_id, mid, 0.0, "in_progress", pos)
+
+            # Pode ter chegado entretanto uma missão que a interrompe
+            _maybe_preempt(rover_id)
+
+        # Um ACK não se confirma: o rover trataria a resposta (com o seq da
+        # nossa ML_NEW_MISSION) como confirmação de uma mensagem sua
         return
 
     # 3 — UPDATE (Progresso)
     
     elif action == ML_UPDATE:
         
-        mid = payload["mission_id"]
-        pos = payload.get("position")
-        extra = payload.get("extra") 
-        
-        if pos:
-        
-            update_mission(rover_id, mid, payload["progress"], payload["status"], pos, extra)
+        _idle_rovers.discard(rover_id)
+        _apply_update(rover_id, payload, updates)
+        return
+
+    # 8 — BATCH (vários UPDATE num datagrama, pela ordem em que foram gerados)
+
+    elif action == ML_BATCH:
+
+        _idle_rovers.discard(rover_id)
+        for record in payload["records"]:
+            _apply_update(rover_id, record, updates)
         return
 
     # 7 — COMPLETE
@@ -144,27 +467,184 @@ def handle_request(sock, data, addr):
         
         mid = payload["mission_id"]
         pos = payload.get("position")
+
+        # Confirmar sempre (o ACK anterior pode ter-se perdido), aplicar só uma vez
+        send_message(addr, ML_ACK, {"ok": True}, rover_id, version, seq)
+        if _dedup.seen(rover_id, (seq, mid)):
+            return
         
-        print(f"[ML] MISSÃO CONCLUÍDA {mid} ({rover_id})")
+        log.info("MISSÃO CONCLUÍDA %s (%s)", mid, rover_id,
+                 extra={"event": "ml.complete", "rover_id": rover_id, "mission_id": mid})
         
         # Limpeza de segurança
         with _pending_lock:
             if rover_id in MISSIONS_IN_TRANSIT:
                 del MISSIONS_IN_TRANSIT[rover_id]
+                _reliable.cancel(rover_id)
+
+            finished = ACTIVE_MISSIONS.get(rover_id)
+            if finished is not None and finished["mission_id"] == mid:
+                del ACTIVE_MISSIONS[rover_id]
+
+            # Interrompida por preempção: volta para a fila, do início
+            if _cancelling.pop(mid, None) is not None:
+                if REQUEUE_PREEMPTED and finished is not None and finished["mission_id"] == mid:
+                    data = {k: v for k, v in finished.items() if k not in ("mission_id", "preempt")}
+                    _enqueue(rover_id, QueuedMission(data, finished.get("priority", DEFAULT_PRIORITY)))
 
         if pos:
-            update_mission(rover_id, mid, 100.0, "completed", pos)
+            update_mission(rover_id, mid, 100.0, payload.get("status", "completed"), pos)
         return
 
-def start_missionlink():
-    """Inicia o servidor MissionLink."""
-    
+def _serve_threads(addr):
+    """Servidor antigo: uma thread nova por cada datagrama recebido."""
+
+    global _reply_sock
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind(ML_ADDR)
-    
-    print(f"[ML] MissionLink ativo em {ML_ADDR}")
-    
+    sock.bind(addr)
+    _reply_sock = sock
+
+    threading.Thread(target=_retransmit_loop, name="ml-retransmit", daemon=True).start()
+
+    log.info("MissionLink ativo em %s (thread por datagrama)", addr)
+
     while True:
-        
-        data, addr = sock.recvfrom(4096)
-        threading.Thread(target=handle_request, args=(sock, data, addr), daemon=True).start()
+
+        data, peer = sock.recvfrom(4096)
+        threading.Thread(target=handle_request, args=(sock, data, peer), daemon=True).start()
+
+
+def _handle_safely(sock, data, addr, updates):
+    """handle_request para os servidores asyncio: um datagrama que rebente
+    fica registado e não interrompe os outros da mesma leva."""
+
+    try:
+        handle_request(sock, data, addr, updates)
+    except Exception as e:
+        log.exception("Erro ao tratar datagrama de %s: %s", addr, e, extra={"event": "ml.error"})
+
+
+class MissionLinkReader:
+    """Servidor MissionLink num event loop, a ler o socket diretamente.
+
+    Quando o socket tem dados, lê de seguida (sem bloquear) tudo o que lá
+    estiver, até INGEST_BURST datagramas. Os ML_UPDATE ficam no coalescer e
+    vão para o estado numa só transação por INGEST_TICK.
+    """
+
+    def __init__(self, sock, loop):
+        self.sock = sock
+        self.updates = UpdateCoalescer(loop)
+
+    def on_readable(self):
+        sock = self.sock
+        updates = self.updates
+
+        try:
+            for _ in range(INGEST_BURST):
+                try:
+                    data, addr = sock.recvfrom(4096)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except ConnectionResetError:
+                    continue   # ICMP de um envio anterior (Windows); não é deste datagrama
+                except OSError as e:
+                    log.error("Socket: %s", e)
+                    break
+                _handle_safely(sock, data, addr, updates)
+        finally:
+            updates.flush_later()
+
+
+class MissionLinkProtocol(asyncio.DatagramProtocol):
+    """Alternativa ao MissionLinkReader para loops sem add_reader (Proactor,
+    no Windows): os datagramas que chegam na mesma volta do loop são
+    acumulados e tratados de seguida num único callback.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.updates = None
+        self._queue = deque()
+        self._scheduled = False
+
+    def connection_made(self, transport):
+        global _reply_sock
+        self.transport = transport
+        self.updates = UpdateCoalescer(asyncio.get_running_loop())
+        _reply_sock = transport
+
+    def datagram_received(self, data, addr):
+        self._queue.append((data, addr))
+
+        if not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_soon(self._drain)
+
+    def _drain(self):
+        """Trata todos os datagramas pendentes."""
+
+        self._scheduled = False
+        queue = self._queue
+
+        try:
+            while queue:
+                data, addr = queue.popleft()
+                _handle_safely(self.transport, data, addr, self.updates)
+        finally:
+            self.updates.flush_later()
+
+    def error_received(self, exc):
+        log.error("Socket: %s", exc)
+
+
+async def _serve_asyncio(addr):
+    """Servidor asyncio: um só socket e um só thread para todos os rovers."""
+
+    global _loop, _reply_sock
+
+    loop = asyncio.get_running_loop()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+    except OSError:
+        pass   # Fica o tamanho por omissão do sistema
+    sock.bind(addr)
+    sock.setblocking(False)
+
+    try:
+        reader = MissionLinkReader(sock, loop)
+        loop.add_reader(sock.fileno(), reader.on_readable)
+        _reply_sock = sock
+
+        def close():
+            loop.remove_reader(sock.fileno())
+            sock.close()
+    except NotImplementedError:
+        transport, _ = await loop.create_datagram_endpoint(MissionLinkProtocol, sock=sock)
+        close = transport.close
+
+    _loop = loop
+    loop.call_later(RETRANSMIT_TICK, _retransmit_tick)
+
+    log.info("MissionLink ativo em %s (asyncio)", addr)
+
+    try:
+        await asyncio.Event().wait()  # Corre até o processo terminar
+    finally:
+        close()
+
+
+def start_missionlink(mode=DEFAULT_MODE, addr=ML_ADDR):
+    """Inicia o servidor MissionLink no modo indicado ('thread' ou 'asyncio')."""
+
+    if mode == MODE_ASYNCIO:
+        asyncio.run(_serve_asyncio(addr))
+
+    elif mode == MODE_THREAD:
+        _serve_threads(addr)
+
+    else:
+        raise ValueError(f"Modo MissionLink desconhecido: {mode}")
@@ -0,0 +1,276 @@
+# navemae/profiler.py
+"""Profiler por amostragem para a Nave-Mãe a correr, ligado só quando é preciso.
+
+    POST /api/profiler/start   {"hz": 200, "seconds": 30}   (ambos opcionais)
+    POST /api/profiler/stop
+    GET  /api/profiler
+    kill -USR2 <pid da Nave-Mãe>                            (liga / desliga)
+
+Enquanto está ligado, uma thread lê sys._current_frames() 'hz' vezes por
+segundo e conta a pilha de cada thread (TelemetryStream, MissionLink, API,
+escalonador, loop principal). Ao desligar escreve em PROFILE_DIR:
+
+  - profile-<instante>.collapsed: pilhas no formato "collapsed" (thread;
+    função;função N), para flamegraph.pl, speedscope ou inferno;
+  - profile-<instante>.txt: tempo cumulativo e próprio de cada função do
+    codec e do rover_state (FOCUS) e as funções com mais tempo próprio.
+
+Os tempos são de parede (amostras x intervalo), somados por todas as
+threads: uma função à espera de uma lock ou de um socket também conta, o
+que é o que se quer para ver onde a ingestão fica presa. Desligado, não há
+thread nem hook nenhum (custo zero). O custo de cada amostra cresce com o
+número de threads: com --ts-mode thread e muitos rovers, baixar 'hz'.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import signal
+import threading
+import time
+from collections import Counter
+
+from common.log import get_logger
+
+DEFAULT_HZ = 100
+MAX_HZ = 1000
+MAX_SECONDS = 3600
+PROFILE_DIR = "profiles"
+TOP_FUNCTIONS = 40
+NAMES_REFRESH = 1.0   # segundos entre atualizações dos nomes das threads
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Ficheiros cujas funções têm sempre a sua linha no relatório
+FOCUS = (
+    os.path.join(ROOT, "common", "codec.py"),
+    os.path.join(ROOT, "navemae", "state", "rover_state.py"),
+)
+
+log = get_logger("PROF")
+
+
+def _frame_name(code):
+    path = os.path.abspath(code.co_filename)
+    if path.startswith(ROOT + os.sep):
+        path = os.path.relpath(path, ROOT)
+    else:
+        path = os.path.basename(path)
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({path}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Amostragem das pilhas de todas as threads do processo."""
+
+    def __init__(self, out_dir=PROFILE_DIR, focus=FOCUS):
+        self.out_dir = out_dir
+        self.focus = tuple(os.path.abspath(f) for f in focus)
+        self.last = None          # resultado do último perfil
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._hz = DEFAULT_HZ
+        self._started = None
+        self._deadline = None
+        self._samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self):
+        if not self.running:
+            return {"running": False, "last": self.last}
+        return {
+            "running": True,
+            "hz": self._hz,
+            "elapsed": round(time.time() - self._started, 3),
+            "until": self._deadline,
+            "samples": self._samples,
+        }
+
+    def start(self, hz=None, seconds=None):
+        """Liga o profiler (se já estiver ligado, não faz nada). Com 'seconds',
+        desliga-se sozinho e escreve os ficheiros ao fim desse tempo."""
+
+        hz = float(hz) if hz is not None else DEFAULT_HZ
+        if not 0 < hz <= MAX_HZ:
+            raise ValueError(f"hz tem de estar entre 0 e {MAX_HZ}")
+        if seconds is not None and not 0 < float(seconds) <= MAX_SECONDS:
+            raise ValueError(f"seconds tem de estar entre 0 e {MAX_SECONDS}")
+
+        with self._lock:
+            if self.running:
+                return self.status()
+            self._hz = hz
+            self._started = time.time()
+            self._deadline = self._started + float(seconds) if seconds is not None else None
+            self._samples = 0
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+            log.info("Profiler ligado (%.0f Hz%s).", hz, f", {float(seconds):.0f} s" if seconds else "")
+            return self.status()
+
+    def stop(self):
+        """Desliga o profiler e devolve o resultado (com os ficheiros escritos)."""
+
+        with self._lock:
+            thread = self._thread
+            if thread is not None:
+                self._stop.set()
+                thread.join()
+                self._thread = None
+            return {"running": False, "last": self.last}
+
+    def toggle(self):
+        return self.stop() if self.running else self.start()
+
+    # -----------------------------------------------------
+    # Amostragem (thread do profiler)
+    # -----------------------------------------------------
+
+    def _run(self):
+        interval = 1.0 / self._hz
+        deadline = self._deadline
+        own = threading.get_ident()
+        stacks = Counter()   # (thread, (code da raiz, ..., code da folha)) -> amostras
+        names = {}
+        names_at = 0.0
+        ticks = 0
+        start = time.perf_counter()
+        next_tick = start
+
+        while True:
+            now = time.perf_counter()
+            if now - names_at >= NAMES_REFRESH:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                names_at = now
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[(names.get(ident, f"thread-{ident}"), tuple(stack))] += 1
+            ticks += 1
+            self._samples = ticks
+
+            if deadline is not None and time.time() >= deadline:
+                break
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay < 0:
+                next_tick = time.perf_counter()   # atrasado: não tentar recuperar
+                delay = 0
+            if self._stop.wait(delay):
+                break
+
+        elapsed = time.perf_counter() - start
+        try:
+            self.last = self._write(stacks, ticks, elapsed)
+            log.info("Perfil de %.1f s (%d amostras) em %s", elapsed, ticks, self.last["files"]["collapsed"])
+        except OSError as e:
+            self.last = {"error": str(e)}
+            log.error("Não foi possível escrever o perfil: %s", e)
+
+    # -----------------------------------------------------
+    # Resultado
+    # -----------------------------------------------------
+
+    def _functions(self, stacks, per_sample):
+        """{code: [cumulativo, próprio]} em segundos."""
+
+        times = {}
+        for (_, stack), n in stacks.items():
+            for code in set(stack):   # recursão conta uma vez
+                times.setdefault(code, [0.0, 0.0])[0] += n * per_sample
+            if stack:
+                times.setdefault(stack[-1], [0.0, 0.0])[1] += n * per_sample
+        return times
+
+    def _write(self, stacks, ticks, elapsed):
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.out_dir, f"profile-{stamp}")
+        per_sample = elapsed / ticks if ticks else 0.0
+
+        names = {}
+        def name(code):
+            n = names.get(code)
+            if n is None:
+                n = names[code] = _frame_name(code)
+            return n
+
+        collapsed = Counter()
+        for (thread, stack), n in stacks.items():
+            collapsed[";".join([thread.replace(";", ","), *map(name, stack)])] += n
+        with open(base + ".collapsed", "w") as f:
+            for line, n in sorted(collapsed.items()):
+                f.write(f"{line} {n}\n")
+
+        times = self._functions(stacks, per_sample)
+        total = sum(n for n in stacks.values()) * per_sample or 1.0
+        focus = sorted(((code, t) for code, t in times.items()
+                        if os.path.abspath(code.co_filename) in self.focus),
+                       key=lambda item: -item[1][0])
+        top = sorted(times.items(), key=lambda item: -item[1][1])[:TOP_FUNCTIONS]
+        threads = len({thread for thread, _ in stacks})
+
+        def table(rows):
+            lines = [f"{'cumul (s)':>10} {'próprio (s)':>12} {'cumul %':>8}  função"]
+            for code, (cum, own) in rows:
+                lines.append(f"{cum:10.3f} {own:12.3f} {100 * cum / total:7.1f}%  {name(code)}")
+            return lines
+
+        report = [
+            f"Perfil de {elapsed:.1f} s: {ticks} amostras a {self._hz:.0f} Hz, {threads} threads",
+            f"Tempo de parede = amostras x {per_sample * 1000:.2f} ms, somado por todas as threads "
+            f"({total:.1f} s no total)",
+            "",
+            "== " + ", ".join(os.path.relpath(f, ROOT) for f in self.focus) + " ==",
+            *table(focus),
+            "",
+            f"== {TOP_FUNCTIONS} funções com mais tempo próprio ==",
+            *table(top),
+        ]
+        with open(base + ".txt", "w") as f:
+            f.write("\n".join(report) + "\n")
+
+        return {
+            "seconds": round(elapsed, 3),
+            "samples": ticks,
+            "hz": self._hz,
+            "threads": threads,
+            "files": {"collapsed": base + ".collapsed", "functions": base + ".txt"},
+            "focus": [{"function": name(code), "cumulative_s": round(cum, 4), "self_s": round(own, 4)}
+                      for code, (cum, own) in focus],
+        }
+
+
+PROFILER = SamplingProfiler()
+
+
+def control(action="status", hz=None, seconds=None):
+    """Ponto de entrada da API (também como comando do backend partilhado)."""
+
+    if action == "start":
+        return PROFILER.start(hz, seconds)
+    if action == "stop":
+        return PROFILER.stop()
+    if action == "status":
+        return PROFILER.status()
+    raise ValueError(f"Ação desconhecida: {action}")
+
+
+def install_signal_handler(signum=getattr(signal, "SIGUSR2", None)):
+    """SIGUSR2 liga/desliga o profiler (só no thread principal; não existe no Windows)."""
+
+    if signum is None:
+        return False
+    # O stop() espera pela thread do profiler e escreve os ficheiros: fora do handler
+    signal.signal(signum, lambda *_: threading.Thread(target=PROFILER.toggle, daemon=True).start())
+    return True
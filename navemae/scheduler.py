@@ -0,0 +1,338 @@
+# navemae/scheduler.py
+"""Escalonador da frota: escolhe o rover para as missões sem rover_id.
+
+Para cada missão (por prioridade) estima, em cada rover disponível, quanto
+tempo falta até a missão começar: o que o rover ainda tem para fazer, o
+tempo a carregar se a bateria não chegar, e a viagem até ao local. Fica com
+o rover onde esse tempo é menor. A bateria gasta vem das mesmas taxas que o
+rover usa (common/energy.py); missões que deixariam o rover abaixo da
+reserva não lhe são atribuídas.
+
+Só se atribuem missões que começam dentro de HORIZON segundos; as outras
+esperam pela próxima volta, já com o estado atualizado. Quando um rover fica
+offline ou vai carregar, as missões que lhe estavam atribuídas e ainda não
+saíram voltam para o escalonador (rebalanceamento).
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from common.energy import mission_energy, charge_time, CHARGE_START_IDLE, CHARGE_START_MISSION
+from common.log import get_logger
+from mission_queue import QueuedMission
+
+ROVER_SPEED = 1.0          # m/s (o SPEED do rover)
+SCHEDULE_INTERVAL = 1.0    # segundos entre voltas do escalonador
+HORIZON = 120.0            # só atribui missões que comecem dentro deste tempo
+BATTERY_MARGIN = 5.0       # % acima do limiar de abortar que tem de sobrar
+BUSY_UNKNOWN = 30.0        # tempo assumido para missões que não foram atribuídas aqui
+BATTERY_WEIGHT = 10.0      # s de custo por cada 100% de bateria que fica a faltar
+
+UNAVAILABLE = ("offline", "charging")
+
+log = get_logger("SCHED")
+
+_tickets = itertools.count(1)
+
+
+def _xy(pos):
+    return (float(pos[0]), float(pos[1])) if pos and len(pos) >= 2 else (0.0, 0.0)
+
+def _distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+def mission_sites(data, here):
+    """(onde a missão começa, onde acaba), aproximados a partir dos parâmetros."""
+
+    task = data.get("task")
+    if task == "scan_area":
+        area = data.get("area", [[0, 0], [10, 10]])
+        return _xy(area[0]), _xy(area[1])
+    if task == "collect_sample" and data.get("points"):
+        points = data["points"]
+        return _xy(points[0]), _xy(points[-1])
+    return here, here   # analyze_environment: trabalha onde estiver
+
+
+class _Assignment:
+    __slots__ = ("ticket", "start", "end", "energy", "end_pos")
+
+    def __init__(self, ticket, start, end, energy, end_pos):
+        self.ticket = ticket
+        self.start = start
+        self.end = end
+        self.energy = energy
+        self.end_pos = end_pos
+
+
+class _Plan:
+    """Previsão do que um rover vai estar a fazer (para estimar custos)."""
+
+    def __init__(self, free_at, pos, battery):
+        self.free_at = free_at
+        self.pos = pos
+        self.battery = battery
+
+
+class FleetScheduler:
+    """Atribui missões a rovers com base no estado ao vivo da frota.
+
+    get_rovers() devolve {rover_id: estado} (position, battery, status);
+    enqueue(rover_id, data) põe a missão na fila do rover; take_back(rover_id,
+    predicate) retira da fila as missões ainda não enviadas.
+    """
+
+    def __init__(self, get_rovers, enqueue, take_back, clock=time.time):
+        self._get_rovers = get_rovers
+        self._enqueue = enqueue
+        self._take_back = take_back
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._unassigned = []      # heap de (key, QueuedMission)
+        self._assigned = {}        # rover_id -> [_Assignment]
+
+        self.submitted = 0
+        self.assigned = 0
+        self.rebalanced = 0
+        self.expired = 0
+        self.invalid = 0
+
+    def submit(self, data):
+        """Recebe uma missão sem rover; devolve o ticket para a acompanhar.
+        Levanta ValueError se a missão for inválida."""
+
+        return self.submit_many([data])[0]
+
+    def submit_many(self, missions):
+        """Como submit() para várias missões: ou entram todas ou nenhuma
+        (ValueError). Devolve os tickets, pela mesma ordem."""
+
+        parsed = []
+        for data in missions:
+            data = dict(data)
+            data.pop("rover_id", None)
+            data["ticket"] = f"S-{next(_tickets)}"
+            parsed.append(QueuedMission.from_request(data))
+
+        with self._lock:
+            for mission in parsed:
+                heapq.heappush(self._unassigned, (mission.key(), mission))
+            self.submitted += len(parsed)
+        self._wake.set()
+        return [mission.data["ticket"] for mission in parsed]
+
+    def wake(self, *_):
+        """Pede uma volta já (ex.: um rover mudou de estado)."""
+
+        self._wake.set()
+
+    # ---------------------------------------------------------
+    # Uma volta do escalonador
+    # ---------------------------------------------------------
+
+    def _plan(self, rid, r, now):
+        pos = _xy(r.get("position"))
+        battery = float(r.get("battery", 100.0))
+
+        entries = [a for a in self._assigned.get(rid, ()) if a.end > now]
+        self._assigned[rid] = entries
+
+        if entries:
+            free_at = max(a.end for a in entries)
+            pos = entries[-1].end_pos
+            for a in entries:   # O que falta gastar (a bateria ao vivo já tem o resto)
+                done = max(0.0, min(1.0, (now - a.start) / (a.end - a.start)))
+                battery -= a.energy * (1.0 - done)
+        elif r.get("status") != "idle":
+            free_at = now + BUSY_UNKNOWN   # Ocupado com algo que não saiu daqui
+        else:
+            free_at = now
+        return _Plan(free_at, pos, battery)
+
+    def _cost(self, plan, mission, now):
+        """(custo, início, energia, fim, onde acaba) da missão neste rover, ou None se não dá."""
+
+        data = mission.data
+        duration = float(data.get("duration", 60))
+        start_site, end_site = mission_sites(data, plan.pos)
+
+        travel = _distance(plan.pos, start_site) / ROVER_SPEED
+        if travel >= duration:
+            return None   # Acabava o tempo antes de lá chegar
+
+        wait = 0.0
+        battery = plan.battery
+        if battery < CHARGE_START_IDLE:
+            wait = charge_time(battery)   # Vai carregar antes de aceitar
+            battery = 100.0
+
+        energy = mission_energy(data.get("task"), duration)
+        left = battery - energy
+        if left < CHARGE_START_MISSION + BATTERY_MARGIN:
+            return None   # Abortava a meio por falta de bateria
+
+        start = max(plan.free_at, now) + wait
+        cost = (start - now) + travel + BATTERY_WEIGHT * (100.0 - left) / 100.0
+        return cost, start, energy, start + duration, end_site
+
+    def _rebalance(self, rovers, now):
+        # Rovers que ficaram indisponíveis devolvem o que ainda não saiu
+        returned = []
+        for rid, entries in self._assigned.items():
+            if not entries:
+                continue
+            r = rovers.get(rid)
+            if r is not None and r.get("status") not in UNAVAILABLE:
+                continue
+
+            tickets = {a.ticket for a in entries}
+            taken = self._take_back(rid, lambda m: m.data.get("ticket") in tickets)
+            if taken:
+                log.info("%s indisponível: %s missões voltam ao escalonador", rid, len(taken), extra={"rover_id": rid})
+            returned.extend(taken)
+            self._assigned[rid] = []
+
+        for mission in returned:
+            heapq.heappush(self._unassigned, (mission.key(), mission))
+        self.rebalanced += len(returned)
+
+    def schedule_once(self):
+        """Uma volta: rebalanceia e atribui o que for possível. Devolve as atribuições."""
+
+        now = self._clock()
+        rovers = dict(self._get_rovers())
+        decisions = []
+
+        try:
+            with self._lock:
+                self._rebalance(rovers, now)
+
+                plans = {rid: self._plan(rid, r, now) for rid, r in rovers.items()
+                         if r.get("status") not in UNAVAILABLE}
+
+                waiting = []
+                try:
+                    while self._unassigned and plans:
+                        key, mission = heapq.heappop(self._unassigned)
+                        if mission.expired(now):
+                            self.expired += 1
+                            continue
+
+                        try:
+                            best = None
+                            for rid, plan in plans.items():
+                                c = self._cost(plan, mission, now)
+                                if c is not None and (best is None or c[0] < best[1][0]):
+                                    best = (rid, c)
+                        except Exception as e:
+                            # Missão que não se consegue avaliar: descartada, as outras seguem
+                            self.invalid += 1
+                            log.exception("%s descartada: %s", mission.data.get("ticket"), e)
+                            continue
+
+                        if best is None or best[1][1] - now > HORIZON:
+                            waiting.append((key, mission))   # Fica para a próxima volta
+                            continue
+
+                        rid, (_, start, energy, end, end_pos) = best
+                        plan = plans[rid]
+                        plan.free_at, plan.pos, plan.battery = end, end_pos, plan.battery - energy
+                        self._assigned.setdefault(rid, []).append(
+                            _Assignment(mission.data["ticket"], start, end, energy, end_pos))
+                        decisions.append((rid, mission))
+                        self.assigned += 1
+                finally:
+                    for item in waiting:
+                        heapq.heappush(self._unassigned, item)
+        finally:
+            # Fora do lock: enqueue pode mandar já a missão ao rover. Mesmo que a
+            # volta tenha falhado, o que já ficou atribuído tem de sair
+            for rid, mission in decisions:
+                log.info("%s (%s) → %s", mission.data["ticket"], mission.data.get("task"), rid,
+                         extra={"event": "sched.assign", "rover_id": rid})
+                self._enqueue(rid, mission.data)
+        return decisions
+
+    def state(self):
+        """Missões por atribuir e atribuições ainda em curso (para a API)."""
+
+        with self._lock:
+            return {
+                "unassigned": [dict(m.to_dict(), ticket=m.data["ticket"])
+                               for _, m in sorted(self._unassigned)],
+                "assigned": {rid: [a.ticket for a in entries]
+                             for rid, entries in self._assigned.items() if entries},
+                "stats": {"submitted": self.submitted, "assigned": self.assigned,
+                          "rebalanced": self.rebalanced, "expired": self.expired,
+                          "invalid": self.invalid},
+            }
+
+    def _loop(self):
+        while True:
+            self._wake.wait(SCHEDULE_INTERVAL)
+            self._wake.clear()
+            try:
+                self.schedule_once()
+            except Exception as e:
+                log.exception("Falha no ciclo do escalonador: %s", e)
+
+    def start(self):
+        threading.Thread(target=self._loop, name="fleet-scheduler", daemon=True).start()
+        return self
+
+# =========================================================
+# Instância da Nave-Mãe (ligada ao rover_state e ao MissionLink)
+# =========================================================
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from state.rover_state import get_snapshot
+                from missionlink_server import add_pending_mission, take_pending
+                _scheduler = FleetScheduler(get_snapshot, add_pending_mission, take_pending)
+    return _scheduler
+
+def start_scheduler():
+    """Arranca o escalonador; volta a correr logo que um rover muda de liveness."""
+
+    from state.rover_state import on_liveness_change
+
+    scheduler = get_scheduler().start()
+    on_liveness_change(scheduler.wake)
+    return scheduler
+
+def submit_mission(data):
+    """Missão sem rover_id: o escalonador escolhe o rover. Devolve o ticket."""
+
+    return get_scheduler().submit(data)
+
+def add_mission_batch(missions):
+    """Lote da API num só passo: as missões com rover_id vão para as filas
+    desses rovers, as outras para o escalonador. Tudo é validado antes de
+    alguma entrar (ValueError). Devolve {"queued": n, "tickets": [...]}."""
+
+    from missionlink_server import add_pending_missions
+
+    direct = [m for m in missions if m.get("rover_id")]
+    unassigned = [m for m in missions if not m.get("rover_id")]
+    for data in unassigned:
+        QueuedMission.from_request(data)   # Antes de as diretas entrarem na fila
+
+    queued = add_pending_missions(direct) if direct else 0
+    tickets = get_scheduler().submit_many(unassigned) if unassigned else []
+    return {"queued": queued, "tickets": tickets}
+
+def get_scheduler_state():
+    return get_scheduler().state()
@@ -0,0 +1,159 @@
+# navemae/state/journal.py
+"""Journal binário append-only dos eventos de telemetria e missão.
+
+Cada registo é uma mensagem do codec (header + checksum), por isso um fim de
+ficheiro cortado a meio (crash) é detetado e ignorado na leitura. O ficheiro
+começa com um cabeçalho próprio com a geração, que liga o journal ao
+snapshot (rover_state.json) que o precede.
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import glob
+import struct
+import threading
+
+from common.codec import encode_msg, decode_msg, register_schema, HEADER_SIZE
+from common.protocol_constants import PROTOCOL_VERSION_BINARY
+
+MSG_TYPE_JOURNAL = 0x4A   # Só existe em disco, nunca circula na rede
+
+# Tipos de registo
+JR_TELEMETRY = 1
+JR_MISSION   = 2
+JR_HEARTBEAT = 3
+JR_OFFLINE   = 4
+
+register_schema(MSG_TYPE_JOURNAL, JR_TELEMETRY, (
+    ("rover_id", "id"), ("position", "pos"), ("battery", "tenths"),
+    ("speed", "float"), ("status", "status"), ("timestamp", "ts")))
+register_schema(MSG_TYPE_JOURNAL, JR_MISSION, (
+    ("rover_id", "id"), ("mission_id", "id"), ("progress", "tenths"),
+    ("status", "status"), ("position", "pos"), ("timestamp", "ts")), has_extra=True)
+register_schema(MSG_TYPE_JOURNAL, JR_HEARTBEAT, (("rover_id", "id"), ("timestamp", "ts")))
+register_schema(MSG_TYPE_JOURNAL, JR_OFFLINE, (("rover_id", "id"), ("timestamp", "ts")))
+
+_MAGIC = b"RVJ1"
+_FILE_HEADER = struct.Struct("!4sI")   # magic, geração
+
+
+def read_generation(path):
+    """Geração de um ficheiro de journal (None se não for válido)."""
+
+    try:
+        with open(path, "rb") as f:
+            magic, generation = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return generation if magic == _MAGIC else None
+
+
+def iter_records(path):
+    """Gera (action, payload) de um ficheiro de journal, por ordem.
+
+    Pára no primeiro registo incompleto ou corrompido (fim de um crash).
+    """
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return
+
+    if len(data) < _FILE_HEADER.size or data[:4] != _MAGIC:
+        return
+
+    view = memoryview(data)
+    offset = _FILE_HEADER.size
+    while offset + HEADER_SIZE <= len(data):
+        try:
+            msg = decode_msg(view[offset:])
+        except ValueError:
+            break
+        if msg is None:
+            break
+
+        offset += msg["bytes_consumed"]
+        yield msg["action"], msg["payload"]
+
+
+def list_journals(path):
+    """Ficheiros de journal existentes (atual e rodados), por geração."""
+
+    found = []
+    for candidate in [path] + glob.glob(path + ".*"):
+        generation = read_generation(candidate)
+        if generation is not None:
+            found.append((generation, candidate))
+    return sorted(found)
+
+
+class Journal:
+    """Ficheiro de journal aberto para escrita."""
+
+    def __init__(self, path, generation, buffer_size=1 << 20):
+        self.path = path
+        self.generation = generation
+        self._buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._f = None
+        self._open()
+
+    def _open(self):
+        self._f = open(self.path, "wb", buffering=self._buffer_size)
+        self._f.write(_FILE_HEADER.pack(_MAGIC, self.generation))
+        self._size = _FILE_HEADER.size
+
+    def append(self, action, payload):
+        """Acrescenta um registo (fica em buffer até ao próximo flush)."""
+
+        record = encode_msg(PROTOCOL_VERSION_BINARY, MSG_TYPE_JOURNAL, action, 0, payload)
+        with self._lock:
+            self._f.write(record)
+            self._size += len(record)
+
+    def append_many(self, records):
+        """Acrescenta vários registos (action, payload) de uma só vez."""
+
+        data = b"".join(encode_msg(PROTOCOL_VERSION_BINARY, MSG_TYPE_JOURNAL, action, 0, payload)
+                        for action, payload in records)
+        with self._lock:
+            self._f.write(data)
+            self._size += len(data)
+
+    def size(self):
+        """Tamanho atual do journal em bytes."""
+
+        return self._size
+
+    def flush(self, sync=True):
+        """Passa o buffer para o disco."""
+
+        with self._lock:
+            self._f.flush()
+            fd = self._f.fileno()
+
+        if sync:
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass  # O ficheiro pode ter sido rodado entretanto
+
+    def rotate(self):
+        """Fecha o journal atual e começa a geração seguinte.
+
+        O ficheiro antigo fica como '<path>.<geração>' até o snapshot que o
+        cobre estar gravado; devolve esse caminho.
+        """
+
+        with self._lock:
+            self._f.close()
+            old_path = f"{self.path}.{self.generation}"
+            os.replace(self.path, old_path)
+            self.generation += 1
+            self._open()
+        return old_path
+
+    def close(self):
+        with self._lock:
+            self._f.close()
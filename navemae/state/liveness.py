@@ -0,0 +1,80 @@
+# navemae/state/liveness.py
+"""Deteção de rovers silenciosos sem percorrer a frota toda.
+
+Cada rover vivo tem o instante do último sinal num dicionário e no máximo
+uma entrada num min-heap ordenado por esse instante. touch() só atualiza o
+dicionário; expire() só olha para o topo do heap: uma entrada desatualizada
+(o rover deu sinal entretanto) volta ao heap com o valor atual, as outras
+estão mesmo expiradas. Cada tick custa O(expirados · log n), não O(frota).
+"""
+import heapq
+import threading
+
+
+class LivenessTracker:
+    """Prazos de vida dos rovers, por instante do último sinal."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_seen = {}    # rover_id -> último sinal (só rovers vivos)
+        self._heap = []         # (último sinal quando entrou, rover_id)
+        self._queued = set()    # rovers com entrada no heap
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def touch(self, rover_id, ts):
+        """Regista um sinal de vida do rover."""
+
+        if rover_id in self._last_seen:
+            self._last_seen[rover_id] = ts   # Caso comum: sem lock nem heap
+            return
+        self.requeue(rover_id, ts)
+
+    def requeue(self, rover_id, ts):
+        """Volta a seguir um rover que expire() deu como expirado mas afinal
+        deu sinal entretanto (um touch() concorrente pode ter escrito no
+        dicionário depois de o rover sair do heap)."""
+
+        with self._lock:
+            self._last_seen[rover_id] = ts
+            if rover_id not in self._queued:
+                self._queued.add(rover_id)
+                heapq.heappush(self._heap, (ts, rover_id))
+
+    def forget(self, rover_id):
+        """Deixa de seguir o rover (ex.: desligou-se explicitamente)."""
+
+        with self._lock:
+            self._last_seen.pop(rover_id, None)
+
+    def expire(self, now, timeout):
+        """Rovers sem sinal há mais de 'timeout' segundos; deixam de ser seguidos.
+
+        Quem chama deve confirmar cada um (com o lock do rover) e usar
+        requeue() se o rover afinal estiver vivo.
+        """
+
+        cutoff = now - timeout
+        expired = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] < cutoff:
+                _, rover_id = heapq.heappop(heap)
+                last = self._last_seen.get(rover_id)
+
+                if last is None:
+                    self._queued.discard(rover_id)          # Esquecido entretanto
+                elif last >= cutoff:
+                    heapq.heappush(heap, (last, rover_id))  # Deu sinal: novo prazo
+                else:
+                    self._queued.discard(rover_id)
+                    del self._last_seen[rover_id]
+                    expired.append(rover_id)
+        return expired
+
+    def next_deadline(self, timeout):
+        """Instante em que o rover mais antigo expira (None se não houver rovers)."""
+
+        with self._lock:
+            return self._heap[0][0] + timeout if self._heap else None
@@ -0,0 +1,341 @@
+# navemae/state/rover_record.py
+"""Registos compactos dos rovers do estado da Nave-Mãe.
+
+Os campos numéricos de todos os rovers (posição, bateria, velocidade,
+progresso da missão e instantes) ficam em FleetTable, um array('d') por
+campo, e cada RoverRecord guarda só o seu índice na tabela e os campos que
+não são números. Os estados (idle, in_mission, ...) são strings partilhadas
+(intern_status): cada rover guarda uma referência, não uma cópia.
+
+O formato de sempre ({"position": [...], "battery": ..., ...}) só é
+construído na fronteira, em to_dict(): JSON da API e snapshot em disco. As
+vistas para os leitores são RoverSnapshot, cópias imutáveis que se leem
+como um dicionário (r.get("position"), r["status"], dict(r)).
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from common.protocol_constants import STATUS_CODES
+
+_NAN = float("nan")   # "sem valor" nos campos numéricos que podem ser None
+_EMPTY = MappingProxyType({})
+
+MAX_STATUSES = 256    # estados distintos guardados (o resto não é partilhado)
+_statuses = {s: sys.intern(s) for s in STATUS_CODES}
+
+def intern_status(status):
+    """A string partilhada para este estado (None fica None)."""
+
+    if status is None:
+        return None
+    shared = _statuses.get(status)
+    if shared is None:
+        if len(_statuses) >= MAX_STATUSES or not isinstance(status, str):
+            return status
+        shared = _statuses.setdefault(status, sys.intern(status))
+    return shared
+
+def _opt(value):
+    return None if value != value else value   # NaN -> None
+
+def _num(value):
+    return _NAN if value is None else float(value)
+
+
+class FleetTable:
+    """Campos numéricos da frota, um array('d') contíguo por campo.
+
+    Só cresce (os rovers nunca são apagados). allocate() é chamado com a
+    lock global do estado; as escritas nos índices de cada rover são feitas
+    sob a stripe desse rover. Com a GIL, um append que realoca o array não
+    perde as escritas das outras threads (cada operação é atómica).
+    """
+
+    __slots__ = ("pos", "battery", "speed", "progress", "last_telemetry", "last_mission_update")
+
+    def __init__(self):
+        self.pos = array("d")                   # x, y, z seguidos (3 por rover)
+        self.battery = array("d")
+        self.speed = array("d")
+        self.progress = array("d")
+        self.last_telemetry = array("d")        # NaN: ainda sem telemetria
+        self.last_mission_update = array("d")   # NaN: ainda sem missões
+
+    def __len__(self):
+        return len(self.battery)
+
+    def allocate(self):
+        index = len(self.battery)
+        self.pos.extend((0.0, 0.0, 0.0))
+        self.battery.append(100.0)
+        self.speed.append(0.0)
+        self.progress.append(0.0)
+        self.last_telemetry.append(_NAN)
+        self.last_mission_update.append(_NAN)
+        return index
+
+    def copy(self):
+        """Cópia de todos os arrays (para ler a frota fora das locks)."""
+
+        t = FleetTable.__new__(FleetTable)
+        for name in FleetTable.__slots__:
+            setattr(t, name, array("d", getattr(self, name)))
+        return t
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.pos, self.battery, self.speed, self.progress,
+                                                   self.last_telemetry, self.last_mission_update))
+
+
+FLEET = FleetTable()
+
+# Campos guardados na tabela: chave do JSON -> (array, aceita None)
+_NUMERIC = {
+    "battery": ("battery", False),
+    "speed": ("speed", False),
+    "mission_progress": ("progress", False),
+    "last_telemetry": ("last_telemetry", True),
+    "last_mission_update": ("last_mission_update", True),
+}
+
+
+class RoverRecord:
+    """Estado vivo de um rover. Os setters só mexem no que mudou e registam
+    as alterações em 'delta' com as chaves do JSON."""
+
+    __slots__ = ("index", "status", "mission_id", "mission_status", "mission_details", "last_finished")
+
+    def __init__(self):
+        self.index = FLEET.allocate()
+        self.status = "idle"
+        self.mission_id = None
+        self.mission_status = None
+        self.mission_details = None   # None = {}
+        self.last_finished = None     # None = ainda nenhuma missão terminada
+
+    def copy(self):
+        """Cópia dos campos do registo, com o mesmo índice na tabela."""
+
+        r = RoverRecord.__new__(RoverRecord)
+        r.index, r.status, r.mission_id = self.index, self.status, self.mission_id
+        r.mission_status, r.mission_details, r.last_finished = \
+            self.mission_status, self.mission_details, self.last_finished
+        return r
+
+    @classmethod
+    def from_dict(cls, data):
+        """Registo a partir do formato JSON (snapshot em disco)."""
+
+        r = cls()
+        r.set("position", data.get("position"), {})
+        for key in ("battery", "status", "speed", "mission_id", "mission_progress", "mission_status",
+                    "last_mission_update", "mission_details", "last_telemetry", "last_finished"):
+            if key in data:
+                r.set(key, data[key], {})
+        return r
+
+    # -----------------------------------------------------
+    # Leitura
+    # -----------------------------------------------------
+
+    @property
+    def position(self):
+        j = 3 * self.index
+        return FLEET.pos[j:j + 3].tolist()
+
+    @property
+    def battery(self):
+        return FLEET.battery[self.index]
+
+    @property
+    def last_telemetry(self):
+        return _opt(FLEET.last_telemetry[self.index])
+
+    def to_dict(self, table=None):
+        """O rover no formato JSON da API e do snapshot ('table': uma cópia
+        de FLEET tirada ao mesmo tempo que a do registo)."""
+
+        i = self.index
+        t = table if table is not None else FLEET
+        j = 3 * i
+        data = {
+            "position": t.pos[j:j + 3].tolist(),
+            "battery": t.battery[i],
+            "status": self.status,
+            "speed": t.speed[i],
+            "mission_id": self.mission_id,
+            "mission_progress": t.progress[i],
+            "mission_status": self.mission_status,
+            "last_mission_update": _opt(t.last_mission_update[i]),
+            "mission_details": dict(self.mission_details) if self.mission_details else {},
+        }
+        last = t.last_telemetry[i]
+        if last == last:
+            data["last_telemetry"] = last
+        if self.last_finished is not None:
+            data["last_finished"] = dict(self.last_finished)
+        return data
+
+    def snapshot(self):
+        """Cópia imutável do estado atual (chamado com a stripe do rover)."""
+
+        return RoverSnapshot(self)
+
+    # -----------------------------------------------------
+    # Escrita (com a stripe do rover adquirida)
+    # -----------------------------------------------------
+
+    def set_position(self, position, delta):
+        pos = FLEET.pos
+        j = 3 * self.index
+        x, y = float(position[0]), float(position[1])
+        z = float(position[2]) if len(position) > 2 else 0.0
+        if pos[j] != x or pos[j + 1] != y or pos[j + 2] != z:
+            pos[j], pos[j + 1], pos[j + 2] = x, y, z
+            delta["position"] = position
+
+    def set_telemetry(self, position, battery, status, speed, ts, delta):
+        """Caminho rápido de update_telemetry."""
+
+        i = self.index
+        t = FLEET
+        self.set_position(position, delta)
+        if t.battery[i] != battery:
+            t.battery[i] = battery
+            delta["battery"] = battery
+        status = intern_status(status)
+        if self.status != status:
+            self.status = status
+            delta["status"] = status
+        if t.speed[i] != speed:
+            t.speed[i] = speed
+            delta["speed"] = speed
+        if t.last_telemetry[i] != ts:
+            t.last_telemetry[i] = ts
+            delta["last_telemetry"] = ts
+
+    def set_mission(self, mission_id, progress, mission_status, position, ts, delta):
+        """Caminho rápido de update_mission (o fim da missão é tratado à parte)."""
+
+        i = self.index
+        t = FLEET
+        if self.mission_id != mission_id:
+            self.mission_id = mission_id
+            delta["mission_id"] = mission_id
+        if t.progress[i] != progress:
+            t.progress[i] = progress
+            delta["mission_progress"] = progress
+        mission_status = intern_status(mission_status)
+        if self.mission_status != mission_status:
+            self.mission_status = mission_status
+            delta["mission_status"] = mission_status
+        self.set_position(position, delta)
+        if t.last_mission_update[i] != ts:
+            t.last_mission_update[i] = ts
+            delta["last_mission_update"] = ts
+
+    def set(self, key, value, delta):
+        """Altera um campo (pela chave do JSON) só se o valor mudou."""
+
+        numeric = _NUMERIC.get(key)
+        if numeric is not None:
+            name, nullable = numeric
+            column = getattr(FLEET, name)
+            new = _num(value) if nullable else float(value)
+            old = column[self.index]
+            if old != new and not (old != old and new != new):
+                column[self.index] = new
+                delta[key] = value
+        elif key == "position":
+            self.set_position(value if value is not None else (0.0, 0.0, 0.0), delta)
+        elif key == "mission_details":
+            value = value or None
+            if self.mission_details != value:
+                self.mission_details = value
+                delta[key] = value if value is not None else {}
+        elif key in ("status", "mission_status"):
+            value = intern_status(value)
+            if getattr(self, key) != value:
+                setattr(self, key, value)
+                delta[key] = value
+        elif key in ("mission_id", "last_finished"):
+            if getattr(self, key) != value:
+                setattr(self, key, value)
+                delta[key] = value
+        else:
+            raise KeyError(key)
+
+
+class RoverSnapshot(Mapping):
+    """Estado de um rover num instante: imutável, lido como um dicionário."""
+
+    __slots__ = ("position", "battery", "status", "speed", "mission_id", "mission_progress",
+                 "mission_status", "last_mission_update", "mission_details", "last_telemetry",
+                 "last_finished")
+
+    _KEYS = ("position", "battery", "status", "speed", "mission_id", "mission_progress",
+             "mission_status", "last_mission_update", "mission_details")
+    _OPTIONAL = ("last_telemetry", "last_finished")   # só existem depois de terem valor
+
+    def __init__(self, r):
+        i = r.index
+        t = FLEET
+        j = 3 * i
+        set_ = object.__setattr__
+        set_(self, "position", tuple(t.pos[j:j + 3]))
+        set_(self, "battery", t.battery[i])
+        set_(self, "status", r.status)
+        set_(self, "speed", t.speed[i])
+        set_(self, "mission_id", r.mission_id)
+        set_(self, "mission_progress", t.progress[i])
+        set_(self, "mission_status", r.mission_status)
+        set_(self, "last_mission_update", _opt(t.last_mission_update[i]))
+        set_(self, "mission_details", MappingProxyType(dict(r.mission_details)) if r.mission_details else _EMPTY)
+        set_(self, "last_telemetry", _opt(t.last_telemetry[i]))
+        set_(self, "last_finished", MappingProxyType(dict(r.last_finished)) if r.last_finished is not None else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RoverSnapshot é imutável")
+
+    def __getitem__(self, key):
+        if key in self._KEYS:
+            return getattr(self, key)
+        if key in self._OPTIONAL:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield from self._KEYS
+        for key in self._OPTIONAL:
+            if getattr(self, key) is not None:
+                yield key
+
+    def __len__(self):
+        return len(self._KEYS) + sum(getattr(self, k) is not None for k in self._OPTIONAL)
+
+    def __repr__(self):
+        return f"RoverSnapshot({self.to_dict()!r})"
+
+    def to_dict(self):
+        """O rover no formato JSON da API."""
+
+        data = {
+            "position": list(self.position),
+            "battery": self.battery,
+            "status": self.status,
+            "speed": self.speed,
+            "mission_id": self.mission_id,
+            "mission_progress": self.mission_progress,
+            "mission_status": self.mission_status,
+            "last_mission_update": self.last_mission_update,
+            "mission_details": dict(self.mission_details),
+        }
+        if self.last_telemetry is not None:
+            data["last_telemetry"] = self.last_telemetry
+        if self.last_finished is not None:
+            data["last_finished"] = dict(self.last_finished)
+        return data
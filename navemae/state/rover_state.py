@@ -1,127 +1,508 @@
 # navemae/state/rover_state.py
+import atexit
+import itertools
 import json
 import os
 import time
 import threading
+from types import MappingProxyType
+
+from state.subscriptions import SubscriptionHub
+from state.timeseries import TimeSeriesStore
+from state.liveness import LivenessTracker
+from state.rover_record import RoverRecord, FLEET
+from state.journal import (
+    Journal, iter_records, list_journals,
+    JR_TELEMETRY, JR_MISSION, JR_HEARTBEAT, JR_OFFLINE,
+)
+from common.metrics import counter, gauge, histogram, TimedLock
+from common.log import get_logger
+
+log = get_logger("STATE")
 
 STATE_FILE = "rover_state.json"
-_lock = threading.Lock()
-rovers = {}
+JOURNAL_FILE = "rover_state.journal"
+rovers = {}        # rover_id -> RoverRecord (o JSON só é construído para a API e o snapshot)
 GLOBAL_HISTORY = []
 
-def _load_state():
-    global rovers
-    if os.path.exists(STATE_FILE):
-        try:
-            with open(STATE_FILE, "r") as f:
-                rovers = json.load(f)
-        except Exception: rovers = {}
-    else: rovers = {}
-
-def _save_state():
+# Locks:
+#  - _lock protege a estrutura do dicionário 'rovers' (entrada de rovers novos
+#    e listagens); nunca é mantido durante as atualizações
+#  - cada rover é protegido por uma das N_STRIPES locks, escolhida pelo hash
+#    do id, por isso rovers diferentes raramente esperam uns pelos outros
+#  - as esperas (só quando a lock está ocupada) vão para LOCK_WAIT
+N_STRIPES = 64
+LOCK_WAIT = histogram("navemae_state_lock_wait_seconds",
+                      "Tempo à espera das locks do estado quando estavam ocupadas", ("lock",))
+_lock = TimedLock(LOCK_WAIT.labels("global"))
+_stripes = tuple(TimedLock(LOCK_WAIT.labels("stripe")) for _ in range(N_STRIPES))
+_history_lock = threading.Lock()
+
+def _stripe(rover_id):
+    return _stripes[hash(rover_id) % N_STRIPES]
+
+class _AllLocks:
+    # Para o mundo: todas as stripes + _lock (só em snapshots/rotação)
+    def __enter__(self):
+        for l in _stripes: l.acquire()
+        _lock.acquire()
+    def __exit__(self, *exc):
+        _lock.release()
+        for l in reversed(_stripes): l.release()
+
+def _items():
+    # Cópia da lista de rovers, segura para iterar
+    with _lock:
+        return list(rovers.items())
+
+def _get_or_create(rover_id, delta):
+    # Chamado com a stripe do rover adquirida; um rover novo vai todo no delta
+    r = rovers.get(rover_id)
+    if r is None:
+        with _lock:
+            r = rovers.get(rover_id)
+            if r is None:
+                r = rovers[rover_id] = RoverRecord()
+        delta.update(r.to_dict())
+    return r
+
+# Vistas imutáveis (copy-on-write):
+#  - cada alteração invalida a cópia congelada desse rover e sobe _version
+#  - get_state_view() só reconstrói a vista se a versão mudou, e só volta a
+#    congelar os rovers que mudaram; os leitores partilham a mesma vista
+_EPOCH = f"{os.getpid():x}{int(time.time()):x}"   # ETags não colidem entre arranques
+_version_counter = itertools.count(1)
+_version = 0
+_frozen = {}       # rover_id -> RoverSnapshot do último estado
+_fragments = {}    # rover_id -> (vista congelada, '"id":{JSON dessa vista}')
+_view_lock = threading.Lock()
+
+def _to_json(obj):
+    return json.dumps(obj.to_dict(), separators=(",", ":"))
+
+class StateView:
+    """Estado da frota num instante, imutável e partilhado entre leitores."""
+
+    __slots__ = ("version", "rovers", "_body")
+
+    def __init__(self, version, rovers):
+        self.version = version
+        self.rovers = rovers
+        self._body = None
+
+    @property
+    def etag(self):
+        return f"{_EPOCH}-{self.version}"
+
+    def json_body(self):
+        """JSON da vista, calculado uma vez e reaproveitando os rovers que não mudaram."""
+        if self._body is None:
+            parts = []
+            for rid, f in self.rovers.items():
+                cached = _fragments.get(rid)
+                if cached is None or cached[0] is not f:
+                    cached = (f, f"{json.dumps(rid)}:{_to_json(f)}")
+                    _fragments[rid] = cached
+                parts.append(cached[1])
+            self._body = ("{" + ",".join(parts) + "}").encode("utf-8")
+        return self._body
+
+_view = StateView(-1, MappingProxyType({}))
+
+# Subscrições de alterações (push para a Ground Control)
+_hub = SubscriptionHub()
+subscribe = _hub.subscribe
+unsubscribe = _hub.unsubscribe
+
+# Persistência:
+#  - cada alteração é acrescentada ao journal (escrita sequencial e barata)
+#  - o flusher passa o journal para disco a cada FLUSH_INTERVAL
+#  - a cada SNAPSHOT_INTERVAL (ou quando o journal passa COMPACT_BYTES) grava
+#    um snapshot completo em STATE_FILE e o journal recomeça (compactação)
+FLUSH_INTERVAL = 1.0      # segundos entre flushes do journal
+DIRTY_THRESHOLD = 256     # flush mais cedo se houver tantos rovers alterados
+SNAPSHOT_INTERVAL = 60.0  # segundos entre snapshots
+COMPACT_BYTES = 8 << 20   # snapshot antecipado se o journal crescer demasiado
+_dirty = set()
+_flush_event = threading.Event()
+_save_lock = threading.Lock()
+_flusher = None
+_journal = None
+_last_snapshot = 0.0
+
+# Histórico de telemetria (posição, bateria, velocidade) ao longo do tempo
+_series = TimeSeriesStore()
+
+# Prazos de vida: apply_timeouts só vê os rovers cujo prazo acabou
+_liveness = LivenessTracker()
+_liveness_listeners = []
+
+JOURNAL_NAMES = {
+    JR_TELEMETRY: "telemetry", JR_MISSION: "mission",
+    JR_HEARTBEAT: "heartbeat", JR_OFFLINE: "offline",
+}
+
+# =========================================================
+# Aplicação das alterações (sem lock nem journal: usadas
+# pelas funções públicas e pelo replay do journal)
+# =========================================================
+
+def _apply_telemetry(rover_id, position, battery, status, speed, ts):
+    delta = {}
+    r = _get_or_create(rover_id, delta)
+    r.set_telemetry(position, battery, status, speed, ts, delta)
+    return delta
+
+def _apply_mission(rover_id, mission_id, progress, mission_status, position, extra_data, ts):
+    delta = {}
+    r = _get_or_create(rover_id, delta)
+
+    r.set_mission(mission_id, progress, mission_status, position, ts, delta)
+    if extra_data:
+        r.set("mission_details", extra_data, delta)
+
+    if progress >= 100.0 or mission_status in ["completed", "aborted", "incomplete"]:
+
+        # Guardar histórico do último resultado para a Web saber
+        r.set("last_finished", {
+            "id": mission_id,
+            "status": mission_status,
+            "ts": ts # Timestamp para evitar notificações repetidas
+        }, delta)
+
+        history_entry = {
+            "mission_id": mission_id,
+            "rover_id": rover_id,
+            "task": r.mission_id or "???", # O ID ainda está no estado
+            "status": mission_status,
+            "time": time.strftime("%H:%M:%S", time.localtime(ts))
+        }
+        with _history_lock:
+            GLOBAL_HISTORY.insert(0, history_entry) # Adiciona no topo
+            if len(GLOBAL_HISTORY) > 10:
+                GLOBAL_HISTORY.pop() # Remove o mais antigo
+        _hub.publish_history()
+
+        r.set("mission_id", None, delta)
+        r.set("mission_progress", 0.0, delta)
+        r.set("mission_details", {}, delta)
+        # Se completou, volta a idle (se não estiver offline/charging)
+        if r.status == "in_mission":
+            r.set("status", "idle", delta)
+    return delta
+
+def _apply_heartbeat(rover_id, ts):
+    delta = {}
+    if rover_id in rovers:
+        rovers[rover_id].set("last_telemetry", ts, delta)
+    return delta
+
+def _apply_offline(rover_id):
+    delta = {}
+    if rover_id in rovers:
+        rovers[rover_id].set("status", "offline", delta)
+    return delta
+
+def _replay(action, p):
+    if action == JR_TELEMETRY:
+        _apply_telemetry(p["rover_id"], p["position"], p["battery"], p["status"], p["speed"], p["timestamp"])
+    elif action == JR_MISSION:
+        _apply_mission(p["rover_id"], p["mission_id"], p["progress"], p["status"],
+                       p["position"], p.get("extra"), p["timestamp"])
+    elif action == JR_HEARTBEAT:
+        _apply_heartbeat(p["rover_id"], p["timestamp"])
+    elif action == JR_OFFLINE:
+        _apply_offline(p["rover_id"])
+
+# =========================================================
+# Snapshot + journal
+# =========================================================
+
+def _read_snapshot():
+    if not os.path.exists(STATE_FILE): return 0, {}
     try:
-        with open(STATE_FILE, "w") as f:
-            json.dump(rovers, f, indent=2)
-    except Exception: pass
+        with open(STATE_FILE, "r") as f:
+            data = json.load(f)
+    except Exception: return 0, {}
+    if "generation" in data and "rovers" in data:
+        return data["generation"], data["rovers"]
+    return 0, data  # Formato antigo: só o dicionário de rovers
+
+SAVE_SECONDS = histogram("navemae_state_save_seconds", "Duração de cada snapshot completo (_save_state)",
+                         buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+SAVE_FAILURES = counter("navemae_state_save_failures_total", "Snapshots que falharam")
+
+def _save_state(data, generation):
+    # Escrita atómica: ficheiro temporário + rename
+    tmp = STATE_FILE + ".tmp"
+    try:
+        with SAVE_SECONDS.time():
+            with open(tmp, "w") as f:
+                json.dump({"generation": generation, "rovers": data}, f)
+            os.replace(tmp, STATE_FILE)
+        return True
+    except Exception:
+        SAVE_FAILURES.inc()
+        return False
+
+def _remove_old_journals(generation):
+    # Journals rodados já cobertos pelo snapshot da geração indicada
+    for gen, path in list_journals(JOURNAL_FILE):
+        if gen < generation and path != JOURNAL_FILE:
+            try: os.remove(path)
+            except OSError: pass
+
+def _load_state():
+    global rovers, _journal, _last_snapshot
+    generation, data = _read_snapshot()
+    rovers = {rid: RoverRecord.from_dict(r) for rid, r in data.items()}
+
+    # Reaplicar o que ficou no journal depois do último snapshot
+    last_gen = generation
+    for gen, path in list_journals(JOURNAL_FILE):
+        if gen >= generation:
+            for action, payload in iter_records(path):
+                _replay(action, payload)
+        last_gen = max(last_gen, gen)
+        if path == JOURNAL_FILE:
+            os.replace(path, f"{path}.{gen}")  # Não perder até haver snapshot
+
+    for rid, r in rovers.items():
+        if r.status != "offline" and r.last_telemetry:
+            _liveness.touch(rid, r.last_telemetry)
+
+    new_gen = last_gen + 1
+    _journal = Journal(JOURNAL_FILE, new_gen)
+    if _save_state({rid: r.to_dict() for rid, r in rovers.items()}, new_gen):
+        _remove_old_journals(new_gen)
+    _last_snapshot = time.time()
+
+def _take_snapshot():
+    # Snapshot completo + rotação do journal
+    global _last_snapshot
+    with _save_lock:
+        with _AllLocks():
+            # Só cópias baratas com o mundo parado; o JSON é montado depois
+            _dirty.clear()
+            table = FLEET.copy()
+            records = [(rid, r.copy()) for rid, r in rovers.items()]
+            _journal.rotate()
+            generation = _journal.generation
+        data = {rid: r.to_dict(table) for rid, r in records}
+        if _save_state(data, generation):
+            _remove_old_journals(generation)
+        _last_snapshot = time.time()
+
+def flush_state():
+    """Grava já o estado: journal para disco e snapshot se houver alterações."""
+    _journal.flush()
+    _series.flush()
+    if _dirty: _take_snapshot()
+
+def _flusher_loop():
+    while True:
+        _flush_event.wait(FLUSH_INTERVAL)
+        _flush_event.clear()
+        _journal.flush()
+        if _dirty and (time.time() - _last_snapshot >= SNAPSHOT_INTERVAL
+                       or _journal.size() >= COMPACT_BYTES):
+            _take_snapshot()
+
+def _mark_dirty(rover_id, delta=None):
+    # Chamado com a stripe do rover adquirida (set.add é atómico no CPython)
+    global _flusher, _version
+    if delta and _hub: _hub.publish(rover_id, delta)
+    _frozen.pop(rover_id, None)
+    _version = next(_version_counter)
+    _dirty.add(rover_id)
+    if len(_dirty) >= DIRTY_THRESHOLD: _flush_event.set()
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flusher_loop, name="rover-state-flusher", daemon=True)
+                _flusher.start()
+
+def configure_persistence(interval=None, dirty_threshold=None, snapshot_interval=None, compact_bytes=None,
+                          telemetry_retention=None, telemetry_raw=None, telemetry_memory=None):
+    """Ajusta os intervalos de gravação, snapshot e compactação e o histórico
+    de telemetria: idade máxima em disco (horas), amostras em bruto em
+    memória por rover e janela (minutos) das médias em memória."""
+    global FLUSH_INTERVAL, DIRTY_THRESHOLD, SNAPSHOT_INTERVAL, COMPACT_BYTES
+    if interval is not None: FLUSH_INTERVAL = float(interval)
+    if dirty_threshold is not None: DIRTY_THRESHOLD = int(dirty_threshold)
+    if snapshot_interval is not None: SNAPSHOT_INTERVAL = float(snapshot_interval)
+    if compact_bytes is not None: COMPACT_BYTES = int(compact_bytes)
+    if telemetry_retention is not None: _series.retention = float(telemetry_retention) * 3600
+    if telemetry_raw is not None: _series.raw_capacity = int(telemetry_raw)
+    if telemetry_memory is not None: _series.memory = float(telemetry_memory) * 60
+    _flush_event.set()
 
 _load_state()
+atexit.register(flush_state)
+
+gauge("navemae_state_rovers", "Rovers conhecidos pelo estado").set_function(lambda: len(rovers))
+gauge("navemae_state_table_bytes", "Memória dos campos numéricos da frota (FleetTable)").set_function(FLEET.nbytes)
+gauge("navemae_state_dirty_rovers", "Rovers alterados desde o último snapshot").set_function(lambda: len(_dirty))
+gauge("navemae_state_journal_bytes", "Tamanho do journal atual").set_function(lambda: _journal.size())
+
+def get_journal_records(rover_id=None, since=None):
+    """Eventos ainda no journal (desde o último snapshot), do mais antigo para o mais recente."""
+    _journal.flush(sync=False)
+    records = []
+    for _, path in list_journals(JOURNAL_FILE):
+        for action, p in iter_records(path):
+            if rover_id is not None and p.get("rover_id") != rover_id: continue
+            if since is not None and p.get("timestamp", 0) < since: continue
+            records.append({"type": JOURNAL_NAMES.get(action, action), **p})
+    return records
+
+# =========================================================
+# API pública
+# =========================================================
+
+def get_state_view():
+    """Vista imutável atual; sem alterações devolve a mesma vista, sem copiar nada."""
+    global _view
+    view = _view
+    if view.version == _version: return view
+
+    with _view_lock:
+        version = _version
+        if _view.version == version: return _view
+
+        frozen = {}
+        for rid, r in _items():
+            f = _frozen.get(rid)
+            if f is None:
+                # Congelado sob a stripe, para não guardar em cache um estado
+                # que um escritor já invalidou
+                with _stripe(rid):
+                    f = _frozen.get(rid)
+                    if f is None: f = _frozen[rid] = r.snapshot()
+            frozen[rid] = f
+
+        _view = StateView(version, MappingProxyType(frozen))
+        return _view
 
 def get_snapshot():
-    with _lock:
-        return json.loads(json.dumps(rovers))
+    # Mapeamento só de leitura: rover_id -> estado do rover
+    return get_state_view().rovers
+
+def on_liveness_change(fn):
+    """Regista fn(rover_id, online, ts), chamada quando um rover fica offline ou volta."""
+    _liveness_listeners.append(fn)
+
+def _notify_liveness(rover_id, online, ts):
+    for fn in _liveness_listeners:
+        try: fn(rover_id, online, ts)
+        except Exception as e: log.error("Erro num listener de liveness: %s", e)
 
 def update_telemetry(rover_id, position, battery, status, speed):
-    with _lock:
-        r = rovers.setdefault(rover_id, {
-            "position": [0.0, 0.0, 0.0], "battery": 100.0, "status": "idle",
-            "speed": 0.0, "mission_id": None, "mission_progress": 0.0,
-            "mission_status": None, "last_mission_update": None, "mission_details": {}
+    ts = time.time()
+    with _stripe(rover_id):
+        r = rovers.get(rover_id)
+        came_back = r is None or r.status == "offline"
+        delta = _apply_telemetry(rover_id, position, battery, status, speed, ts)
+        _liveness.touch(rover_id, ts)
+        _journal.append(JR_TELEMETRY, {
+            "rover_id": rover_id, "position": position, "battery": battery,
+            "speed": speed, "status": status, "timestamp": ts,
         })
-        r["position"] = position
-        r["battery"] = battery
-        r["status"] = status
-        r["speed"] = speed
-        r["last_telemetry"] = time.time()
-        _save_state()
+        _mark_dirty(rover_id, delta)
+    _series.record(rover_id, ts, position, battery, speed)
+    if came_back and status != "offline": _notify_liveness(rover_id, True, ts)
 
 def update_mission(rover_id, mission_id, progress, mission_status, position, extra_data=None):
-    with _lock:
-        r = rovers.setdefault(rover_id, {
-            "position": [0.0, 0.0, 0.0], "battery": 100.0, "status": "idle",
-            "speed": 0.0, "mission_id": None, "mission_progress": 0.0,
-            "mission_status": None, "mission_details": {}
-        })
+    ts = time.time()
+    with _stripe(rover_id):
+        delta = _apply_mission(rover_id, mission_id, progress, mission_status, position, extra_data, ts)
+        record = {
+            "rover_id": rover_id, "mission_id": mission_id, "progress": progress,
+            "status": mission_status, "position": position, "timestamp": ts,
+        }
+        if extra_data: record["extra"] = extra_data
+        _journal.append(JR_MISSION, record)
+        _mark_dirty(rover_id, delta)
 
-        r["mission_id"] = mission_id
-        r["mission_progress"] = progress
-        r["mission_status"] = mission_status
-        r["position"] = position
-        r["last_mission_update"] = time.time()
-        if extra_data:
-            r["mission_details"] = extra_data
-    
-        if progress >= 100.0 or mission_status in ["completed", "aborted", "incomplete"]:
-            
-            # Guardar histórico do último resultado para a Web saber
-            r["last_finished"] = {
-                "id": mission_id,
-                "status": mission_status,
-                "ts": time.time() # Timestamp para evitar notificações repetidas
-            }
-            
-            history_entry = {
-                "mission_id": mission_id,
-                "rover_id": rover_id,
-                "task": r.get("mission_id", "???"), # O ID ainda está no estado
-                "status": mission_status,
-                "time": time.strftime("%H:%M:%S")
-            }
-            GLOBAL_HISTORY.insert(0, history_entry) # Adiciona no topo
-            if len(GLOBAL_HISTORY) > 10:
-                GLOBAL_HISTORY.pop() # Remove o mais antigo
-            
-            r["mission_id"] = None
-            r["mission_progress"] = 0.0
-            r["mission_details"] = {}
-            # Se completou, volta a idle (se não estiver offline/charging)
-            if r["status"] == "in_mission": 
-                r["status"] = "idle"
+def update_missions(updates):
+    """Aplica de uma vez vários update_mission (rover_id, mission_id, progress,
+    mission_status, position, extra_data): cada stripe é adquirida uma só vez
+    e os registos dessa stripe vão juntos para o journal."""
+    ts = time.time()
+    by_stripe = {}
+    for u in updates:
+        by_stripe.setdefault(hash(u[0]) % N_STRIPES, []).append(u)
 
-        _save_state()
+    for index, group in by_stripe.items():
+        records = []
+        with _stripes[index]:
+            for rover_id, mission_id, progress, mission_status, position, extra_data in group:
+                delta = _apply_mission(rover_id, mission_id, progress, mission_status, position, extra_data, ts)
+                record = {
+                    "rover_id": rover_id, "mission_id": mission_id, "progress": progress,
+                    "status": mission_status, "position": position, "timestamp": ts,
+                }
+                if extra_data: record["extra"] = extra_data
+                records.append((JR_MISSION, record))
+                _mark_dirty(rover_id, delta)
+            _journal.append_many(records)
 
 def touch_heartbeat(rover_id):
-    with _lock:
+    ts = time.time()
+    with _stripe(rover_id):
         if rover_id in rovers:
-            rovers[rover_id]["last_telemetry"] = time.time()
-            _save_state()
+            delta = _apply_heartbeat(rover_id, ts)
+            _liveness.touch(rover_id, ts)
+            _journal.append(JR_HEARTBEAT, {"rover_id": rover_id, "timestamp": ts})
+            _mark_dirty(rover_id, delta)
 
 def apply_timeouts(timeout_sec=15):
+    # Só os rovers cujo prazo expirou; confirmados sob a stripe de cada um
     now = time.time()
-    offline = []
-    with _lock:
-        for rid, r in rovers.items():
-            last = r.get("last_telemetry")
-            if last and now - last > timeout_sec:
-                r["status"] = "offline"
-                offline.append(rid)
-        if offline: _save_state()
+    went_offline = []
+    for rid in _liveness.expire(now, timeout_sec):
+        with _stripe(rid):
+            r = rovers.get(rid)
+            if r is None or r.status == "offline": continue
+            last = r.last_telemetry or 0
+            if now - last <= timeout_sec:
+                _liveness.requeue(rid, last)   # Deu sinal entretanto
+                continue
+            delta = _apply_offline(rid)
+            _journal.append(JR_OFFLINE, {"rover_id": rid, "timestamp": now})
+            _mark_dirty(rid, delta)
+            went_offline.append(rid)
+    for rid in went_offline: _notify_liveness(rid, False, now)
 
 def mark_disconnected(rover_id):
-    with _lock:
+    ts = time.time()
+    with _stripe(rover_id):
+        was_online = rover_id in rovers and rovers[rover_id].status != "offline"
         if rover_id in rovers:
-            rovers[rover_id]["status"] = "offline"
-            _save_state()
+            delta = _apply_offline(rover_id)
+            _journal.append(JR_OFFLINE, {"rover_id": rover_id, "timestamp": ts})
+            _mark_dirty(rover_id, delta)
+        _liveness.forget(rover_id)
+    if was_online: _notify_liveness(rover_id, False, ts)
 
 def is_rover_alive(rover_id):
-    with _lock:
-        if rover_id not in rovers: return False
-        return rovers[rover_id].get("status") != "offline"
+    with _stripe(rover_id):
+        r = rovers.get(rover_id)
+        if r is None: return False
+        return r.status != "offline"
 
 def get_last_known_state(rover_id):
-    with _lock:
-        if rover_id not in rovers: return [0.0, 0.0, 0.0], 100.0
-        return rovers[rover_id].get("position", [0.0, 0.0, 0.0]), rovers[rover_id].get("battery", 100.0)
-    
+    with _stripe(rover_id):
+        r = rovers.get(rover_id)
+        if r is None: return [0.0, 0.0, 0.0], 100.0
+        return r.position, r.battery
+
+def get_telemetry_history(rover_id, t0=None, t1=None, step=None):
+    """Telemetria de um rover entre t0 e t1 (por omissão, a última hora)."""
+    if t1 is None: t1 = time.time()
+    if t0 is None: t0 = t1 - 3600
+    return _series.query(rover_id, t0, t1, step)
+
 def get_history_snapshot():
-    with _lock:
-        return list(GLOBAL_HISTORY)
\ No newline at end of file
+    with _history_lock:
+        return list(GLOBAL_HISTORY)
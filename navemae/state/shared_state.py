@@ -0,0 +1,314 @@
+# navemae/state/shared_state.py
+"""Partilha do estado entre o processo de ingestão e processos da API.
+
+O processo de ingestão (navemae/main.py --api shared) publica a vista do
+estado já serializada num segmento de memória partilhada, protegido por um
+seqlock, e aceita comandos (ex.: agendar missões) por um socket local
+autenticado. Os workers da API só leem a memória partilhada e enviam
+comandos; nunca importam rover_state.
+
+A chave do socket de comandos (que recebe objetos pickle, por isso quem a
+tiver corre código na ingestão) vem de NAVEMAE_IPC_KEY ou, sem ela, é
+gerada em cada arranque da ingestão e escrita em IPC_KEY_FILE só com
+permissões para o dono (0600), de onde a API a lê.
+"""
+import os
+import json
+import secrets
+import struct
+import threading
+import time
+from multiprocessing import shared_memory, resource_tracker, AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from common.log import get_logger
+
+SHM_NAME = "navemae_state"
+SHM_SIZE = 16 << 20          # 16 MiB chegam para dezenas de milhares de rovers
+PUBLISH_INTERVAL = 0.1       # segundos entre verificações de alterações
+
+IPC_ADDR = ("127.0.0.1", 8010)
+IPC_KEY_FILE = os.environ.get("NAVEMAE_IPC_KEY_FILE",
+                              os.path.join(os.path.expanduser("~"), ".navemae_ipc_key"))
+
+log = get_logger("API")
+
+# seq (ímpar = escrita a decorrer), tamanho da ETag, do estado e do histórico;
+# depois o pid do processo que publica e os dados
+_HEADER = struct.Struct("!QIII")
+_SEQ = struct.Struct("!Q")
+_OWNER = struct.Struct("!I")
+_DATA = _HEADER.size + _OWNER.size
+
+# =========================================================
+# Chave do socket de comandos
+# =========================================================
+
+def create_ipc_key(path=None):
+    """Chave para o CommandServer (lado da ingestão): NAVEMAE_IPC_KEY se
+    existir; senão uma chave aleatória nova, escrita em 'path' com modo 0600."""
+
+    key = os.environ.get("NAVEMAE_IPC_KEY")
+    if key:
+        return key.encode()
+
+    path = path or IPC_KEY_FILE
+    key = secrets.token_hex(32)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    os.replace(tmp, path)
+    return key.encode()
+
+def load_ipc_key(path=None):
+    """Chave para o CommandClient (lado da API): NAVEMAE_IPC_KEY ou a que a
+    ingestão escreveu em IPC_KEY_FILE."""
+
+    key = os.environ.get("NAVEMAE_IPC_KEY")
+    if key:
+        return key.encode()
+
+    path = path or IPC_KEY_FILE
+    try:
+        with open(path) as f:
+            key = f.read().strip()
+    except FileNotFoundError:
+        key = ""
+    if not key:
+        raise RuntimeError(f"Sem chave IPC: defina NAVEMAE_IPC_KEY ou arranque primeiro a "
+                           f"Nave-Mãe com --api shared (escreve {path})")
+    return key.encode()
+
+
+def _owner_alive(pid):
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True   # Existe, mas é de outro utilizador
+    return True
+
+# =========================================================
+# Memória partilhada
+# =========================================================
+
+class StatePublisher:
+    """Publica a vista do estado na memória partilhada (lado da ingestão)."""
+
+    def __init__(self, get_view, get_history, name=SHM_NAME, size=SHM_SIZE, interval=PUBLISH_INTERVAL):
+        self._get_view = get_view
+        self._get_history = get_history
+        self._interval = interval
+        self._seq = 0
+        self._last_version = None
+        self._last_history = None
+
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Só se apaga um segmento deixado por um arranque que já morreu
+            old = shared_memory.SharedMemory(name=name)
+            owner = _OWNER.unpack_from(old.buf, _HEADER.size)[0] if old.size >= _DATA else 0
+            if _owner_alive(owner):
+                old.close()
+                raise RuntimeError(f"A memória partilhada '{name}' está a ser usada por outra "
+                                   f"Nave-Mãe (pid {owner}); termine-a primeiro")
+            log.warning("A apagar a memória partilhada '%s' deixada pelo pid %s", name, owner)
+            old.close()
+            old.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        _HEADER.pack_into(self._shm.buf, 0, 0, 0, 0, 0)
+        _OWNER.pack_into(self._shm.buf, _HEADER.size, os.getpid())
+
+    def publish_once(self):
+        """Escreve a vista atual se tiver mudado desde a última publicação."""
+
+        view = self._get_view()
+        history = json.dumps(self._get_history()).encode("utf-8")
+        if view.version == self._last_version and history == self._last_history:
+            return False
+
+        etag = view.etag.encode("ascii")
+        body = view.json_body()
+        total = _DATA + len(etag) + len(body) + len(history)
+        if total > self._shm.size:
+            log.error("Estado (%s bytes) não cabe na memória partilhada (%s)", total, self._shm.size,
+                      extra={"event": "api.shm_full"})
+            return False
+
+        buf = self._shm.buf
+        self._seq += 1
+        _SEQ.pack_into(buf, 0, self._seq)            # ímpar: leitores esperam
+
+        offset = _DATA
+        for part in (etag, body, history):
+            buf[offset:offset + len(part)] = part
+            offset += len(part)
+
+        self._seq += 1
+        _HEADER.pack_into(buf, 0, self._seq, len(etag), len(body), len(history))
+
+        self._last_version = view.version
+        self._last_history = history
+        return True
+
+    def _loop(self):
+        while True:
+            try:
+                self.publish_once()
+            except Exception as e:
+                log.error("Falha a publicar o estado: %s", e)
+            time.sleep(self._interval)
+
+    def start(self):
+        threading.Thread(target=self._loop, name="state-publisher", daemon=True).start()
+        return self
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedStateReader:
+    """Lê a vista publicada pelo processo de ingestão (lado da API)."""
+
+    def __init__(self, name=SHM_NAME):
+        self._name = name
+        self._shm = None
+        self._seq = 0
+        self._cached = None
+        self._lock = threading.Lock()
+
+    def _attach(self):
+        self._shm = shared_memory.SharedMemory(name=self._name)
+        # Quem liga a um segmento não o deve apagar ao sair (bpo-39959)
+        try:
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        except Exception:
+            pass
+
+    def read(self):
+        """Devolve (etag, estado JSON, histórico JSON), ou None se ainda não há nada.
+
+        Se nada mudou desde a última leitura, devolve o mesmo tuplo sem copiar.
+        """
+
+        with self._lock:
+            if self._shm is None:
+                self._attach()
+            buf = self._shm.buf
+
+            for _ in range(10000):
+                seq = _SEQ.unpack_from(buf, 0)[0]
+                if seq == 0:
+                    return None
+                if seq & 1:
+                    time.sleep(0)      # Escrita a decorrer
+                    continue
+                if seq == self._seq:
+                    return self._cached
+
+                _, etag_len, body_len, hist_len = _HEADER.unpack_from(buf, 0)
+                offset = _DATA
+                etag = bytes(buf[offset:offset + etag_len]).decode("ascii")
+                offset += etag_len
+                body = bytes(buf[offset:offset + body_len])
+                offset += body_len
+                history = bytes(buf[offset:offset + hist_len])
+
+                if _SEQ.unpack_from(buf, 0)[0] == seq:
+                    self._seq = seq
+                    self._cached = (etag, body, history)
+                    return self._cached
+
+            # Escritor parado a meio (morreu?): fica a última versão lida
+            return self._cached
+
+# =========================================================
+# Comandos (API -> ingestão)
+# =========================================================
+
+COMMANDS = {}
+
+def register_command(name, fn):
+    """Torna uma função do processo de ingestão invocável pela API."""
+
+    COMMANDS[name] = fn
+
+
+class CommandServer:
+    """Recebe comandos dos processos da API (lado da ingestão)."""
+
+    def __init__(self, address=IPC_ADDR, authkey=None):
+        self._listener = Listener(address, authkey=authkey or create_ipc_key())
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    name, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                fn = COMMANDS.get(name)
+                try:
+                    if fn is None:
+                        raise KeyError(f"Comando desconhecido: {name}")
+                    conn.send(("ok", fn(*args, **kwargs)))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                log.warning("Ligação de comandos recusada: %s", e)
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, name="command-server", daemon=True).start()
+        return self
+
+
+class CommandClient:
+    """Envia comandos ao processo de ingestão (uma ligação por thread)."""
+
+    def __init__(self, address=IPC_ADDR, authkey=None):
+        self._address = address
+        self._authkey = authkey
+        self._fixed_key = authkey is not None   # senão é lida de IPC_KEY_FILE ao ligar
+        self._local = threading.local()
+
+    def call(self, name, *args, **kwargs):
+        for attempt in (1, 2):
+            conn = getattr(self._local, "conn", None)
+            try:
+                if conn is None:
+                    if self._authkey is None:
+                        self._authkey = load_ipc_key()
+                    conn = self._local.conn = Client(self._address, authkey=self._authkey)
+                conn.send((name, args, kwargs))
+                status, result = conn.recv()
+                break
+            except AuthenticationError:
+                # Ingestão reiniciou com outra chave: voltar a lê-la uma vez
+                self._local.conn = None
+                if attempt == 2 or self._fixed_key:
+                    raise
+                self._authkey = None
+            except (EOFError, OSError):
+                # Ingestão reiniciou: voltar a ligar uma vez
+                self._local.conn = None
+                if attempt == 2:
+                    raise
+
+        if status == "error":
+            raise RuntimeError(result)
+        return result
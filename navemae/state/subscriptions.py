@@ -0,0 +1,67 @@
+# navemae/state/subscriptions.py
+import threading
+
+class Subscription:
+    """Alterações pendentes para um cliente, juntas por rover.
+
+    Várias alterações ao mesmo rover antes de o cliente ler ficam num só
+    delta (o valor mais recente de cada campo).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._pending = {}
+        self._history = False
+
+    def _push(self, rover_id, delta):
+        with self._lock:
+            pending = self._pending.get(rover_id)
+            if pending is None: self._pending[rover_id] = dict(delta)
+            else: pending.update(delta)
+        self._event.set()
+
+    def _push_history(self):
+        with self._lock:
+            self._history = True
+        self._event.set()
+
+    def wait(self, timeout=None):
+        """Espera por alterações; devolve False se o tempo acabou sem nenhuma."""
+        return self._event.wait(timeout)
+
+    def drain(self):
+        """Devolve (deltas por rover, se o histórico mudou) e limpa o pendente."""
+        with self._lock:
+            self._event.clear()
+            deltas, self._pending = self._pending, {}
+            history, self._history = self._history, False
+        return deltas, history
+
+class SubscriptionHub:
+    """Conjunto de subscrições que recebem as mesmas alterações."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        sub = Subscription()
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, rover_id, delta):
+        for sub in tuple(self._subscribers):
+            sub._push(rover_id, delta)
+
+    def publish_history(self):
+        for sub in tuple(self._subscribers):
+            sub._push_history()
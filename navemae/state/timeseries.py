@@ -0,0 +1,352 @@
+# navemae/state/timeseries.py
+"""Histórico de telemetria por rover, guardado em colunas.
+
+Cada rover tem buffers circulares em memória (um array('d') por campo) com
+as últimas amostras em bruto e com dois níveis de agregação (médias de 10 s
+e de 1 min) que cobrem só a janela pedida por omissão na API (a última
+hora). As amostras em bruto são também gravadas em segmentos no disco
+(TELEMETRY_DIR/<rover>/<início>.seg, uma hora por ficheiro), de onde vêm os
+pedidos mais antigos do que a memória. As amostras vão para o disco numa
+thread própria, de DISK_FLUSH_INTERVAL em DISK_FLUSH_INTERVAL segundos (um
+open/append/close por rover e não por volta do flusher do estado); os
+segmentos com mais de 'retention' segundos são apagados por flush(), no
+máximo uma vez por EXPIRE_INTERVAL.
+
+As consultas fazem pesquisa binária sobre a coluna de timestamps e copiam
+fatias dos arrays; nunca percorrem dicionários.
+"""
+import os
+import bisect
+import math
+import threading
+import time
+from array import array
+from urllib.parse import quote
+
+from common.log import get_logger
+
+log = get_logger("STATE")
+
+FIELDS = ("timestamp", "x", "y", "z", "battery", "speed")
+N_FIELDS = len(FIELDS)
+
+TELEMETRY_DIR = "telemetry_segments"
+SEGMENT_SECONDS = 3600            # Um ficheiro de segmento por hora
+RETENTION_HOURS = 72              # Idade máxima dos segmentos em disco
+EXPIRE_INTERVAL = 60.0            # Segundos entre procuras de segmentos expirados
+DISK_FLUSH_INTERVAL = 10.0        # Segundos entre gravações das amostras pendentes
+FLUSH_ROWS = 256                  # Linhas pendentes de um rover que antecipam a gravação
+RAW_CAPACITY = 300                # Amostras em bruto em memória por rover
+MEMORY_SECONDS = 3600             # Janela dos níveis de agregação em memória
+ROLLUP_WIDTHS = (10.0, 60.0)      # Largura dos buckets de cada nível (segundos)
+
+# =========================================================
+# Buffers em memória
+# =========================================================
+
+class _Ring:
+    """Buffer circular colunar; as linhas estão por ordem de timestamp."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.cols = [array("d") for _ in FIELDS]
+        self.start = 0   # Índice físico da linha mais antiga
+
+    def __len__(self):
+        return len(self.cols[0])
+
+    def append(self, row):
+        cols = self.cols
+        if len(cols[0]) < self.capacity:
+            # Ainda a crescer: rovers com pouco histórico gastam pouca memória
+            for col, v in zip(cols, row): col.append(v)
+        else:
+            i = self.start
+            for col, v in zip(cols, row): col[i] = v
+            self.start = (i + 1) % self.capacity
+
+    def oldest(self):
+        return self.cols[0][self.start] if len(self) else None
+
+    def _bisect(self, t, right=False):
+        # Primeira posição lógica com timestamp >= t (> t se right)
+        ts, n, start = self.cols[0], len(self), self.start
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            v = ts[(start + mid) % n]
+            if v < t or (right and v == t): lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def range(self, t0, t1):
+        """Colunas (arrays) com as linhas de timestamp em [t0, t1]."""
+
+        n = len(self)
+        a = self.start + self._bisect(t0)
+        b = self.start + self._bisect(t1, right=True)
+        if b <= n: return [col[a:b] for col in self.cols]
+        if a >= n: return [col[a - n:b - n] for col in self.cols]
+        return [col[a:] + col[:b - n] for col in self.cols]
+
+
+class _Rollup:
+    """Médias por bucket de largura fixa (um nível de agregação)."""
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.ring = _Ring(capacity)
+        self.bucket = None
+        self.sums = [0.0] * (N_FIELDS - 1)
+        self.n = 0
+
+    def _current(self):
+        return (self.bucket, *(s / self.n for s in self.sums))
+
+    def add(self, row):
+        bucket = row[0] - row[0] % self.width
+        if bucket != self.bucket:
+            if self.n: self.ring.append(self._current())
+            self.bucket, self.sums, self.n = bucket, [0.0] * (N_FIELDS - 1), 0
+        sums = self.sums
+        for i in range(N_FIELDS - 1): sums[i] += row[i + 1]
+        self.n += 1
+
+    def oldest(self):
+        oldest = self.ring.oldest()
+        return self.bucket if oldest is None else oldest
+
+    def range(self, t0, t1):
+        cols = self.ring.range(t0, t1)
+        # O bucket ainda aberto também conta, para os dados mais recentes
+        if self.n and t0 <= self.bucket <= t1:
+            for col, v in zip(cols, self._current()): col.append(v)
+        return cols
+
+
+def _downsample(cols, step):
+    """Médias por buckets de 'step' segundos sobre colunas já ordenadas."""
+
+    out = [array("d") for _ in FIELDS]
+    ts = cols[0]
+    i, n = 0, len(ts)
+    while i < n:
+        bucket = ts[i] - ts[i] % step
+        j = bisect.bisect_left(ts, bucket + step, i)
+        out[0].append(bucket)
+        for k in range(1, N_FIELDS):
+            out[k].append(sum(cols[k][i:j]) / (j - i))
+        i = j
+    return out
+
+# =========================================================
+# Histórico por rover
+# =========================================================
+
+class _Series:
+    def __init__(self, raw_capacity, resolutions):
+        self.lock = threading.Lock()
+        self.raw = _Ring(raw_capacity)
+        self.rollups = [_Rollup(w, c) for w, c in resolutions]
+        self.pending = array("d")   # Linhas ainda não gravadas (linha a linha)
+        self.last_ts = 0.0
+
+
+class TimeSeriesStore:
+    """Histórico de telemetria de toda a frota."""
+
+    def __init__(self, directory=TELEMETRY_DIR, retention=RETENTION_HOURS * 3600,
+                 raw_capacity=RAW_CAPACITY, memory=MEMORY_SECONDS):
+        self.directory = directory
+        self.retention = retention      # Segundos (None: nunca apagar)
+        self.raw_capacity = raw_capacity   # Só para os rovers que aparecerem depois
+        self.memory = memory
+        self._series = {}
+        self._lock = threading.Lock()   # Só protege a estrutura do dicionário
+        self._disk_lock = threading.Lock()   # Escrita e limpeza dos segmentos
+        self._expired_at = 0.0
+        self._wake = threading.Event()
+        self._flusher = None
+
+    def _resolutions(self):
+        """(largura, nº de buckets) de cada nível, para cobrir 'memory' segundos."""
+
+        return tuple((w, max(1, math.ceil(self.memory / w))) for w in ROLLUP_WIDTHS)
+
+    def _dir(self, rover_id):
+        return os.path.join(self.directory, quote(rover_id, safe=""))
+
+    def record(self, rover_id, ts, position, battery, speed):
+        """Acrescenta uma amostra de telemetria."""
+
+        series = self._series.get(rover_id)
+        if series is None:
+            with self._lock:
+                series = self._series.get(rover_id)
+                if series is None:
+                    series = self._series[rover_id] = _Series(self.raw_capacity, self._resolutions())
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flusher_loop, name="telemetry-flusher",
+                                                     daemon=True)
+                    self._flusher.start()
+
+        x, y, z = (list(position) + [0.0, 0.0, 0.0])[:3]
+        with series.lock:
+            # Timestamps sempre crescentes por rover (o relógio pode recuar)
+            ts = max(float(ts), series.last_ts)
+            series.last_ts = ts
+            row = (ts, float(x), float(y), float(z), float(battery), float(speed))
+            series.raw.append(row)
+            for rollup in series.rollups: rollup.add(row)
+            series.pending.extend(row)
+            if len(series.pending) >= FLUSH_ROWS * N_FIELDS: self._wake.set()
+
+    def _flusher_loop(self):
+        while True:
+            self._wake.wait(DISK_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.exception("Falha ao gravar o histórico de telemetria: %s", e)
+
+    def flush(self):
+        """Grava nos segmentos do disco as amostras ainda pendentes e apaga
+        os segmentos expirados."""
+
+        with self._lock:
+            items = list(self._series.items())
+
+        for rover_id, series in items:
+            with series.lock:
+                if not series.pending: continue
+                pending, series.pending = series.pending, array("d")
+
+            directory = self._dir(rover_id)
+            with self._disk_lock:
+                os.makedirs(directory, exist_ok=True)
+
+                # Partir por segmento (as linhas vêm por ordem de timestamp)
+                i, n = 0, len(pending)
+                while i < n:
+                    segment = int(pending[i] // SEGMENT_SECONDS) * SEGMENT_SECONDS
+                    j = i
+                    while j < n and pending[j] < segment + SEGMENT_SECONDS: j += N_FIELDS
+                    with open(os.path.join(directory, f"{segment}.seg"), "ab") as f:
+                        pending[i:j].tofile(f)
+                    i = j
+
+        now = time.time()
+        if self.retention is not None and now - self._expired_at >= EXPIRE_INTERVAL:
+            self._expired_at = now
+            self.expire(now)
+
+    def expire(self, now=None):
+        """Apaga os segmentos que acabaram há mais de 'retention' segundos
+        (e as pastas de rovers que ficam vazias). Devolve quantos apagou."""
+
+        if self.retention is None:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.retention
+
+        removed = 0
+        with self._disk_lock:
+            try:
+                rovers = os.listdir(self.directory)
+            except OSError:
+                return 0
+
+            for name in rovers:
+                directory = os.path.join(self.directory, name)
+                try:
+                    segments = os.listdir(directory)
+                except OSError:
+                    continue
+
+                left = len(segments)
+                for seg in segments:
+                    try:
+                        start = int(seg[:-4]) if seg.endswith(".seg") else None
+                    except ValueError:
+                        start = None
+                    if start is None or start + SEGMENT_SECONDS > cutoff: continue
+                    try:
+                        os.remove(os.path.join(directory, seg))
+                        removed += 1
+                        left -= 1
+                    except OSError:
+                        pass
+
+                if not left:
+                    try: os.rmdir(directory)
+                    except OSError: pass
+        return removed
+
+    def _read_disk(self, rover_id, t0, t1):
+        """Amostras em bruto do disco com timestamp em [t0, t1)."""
+
+        cols = [array("d") for _ in FIELDS]
+        directory = self._dir(rover_id)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return cols
+
+        starts = sorted(int(name[:-4]) for name in names if name.endswith(".seg"))
+        for start in starts:
+            if start + SEGMENT_SECONDS <= t0 or start >= t1: continue
+
+            data = array("d")
+            with open(os.path.join(directory, f"{start}.seg"), "rb") as f:
+                data.frombytes(f.read())
+            del data[len(data) - len(data) % N_FIELDS:]   # Linha cortada por um crash
+
+            ts = data[0::N_FIELDS]
+            lo, hi = bisect.bisect_left(ts, t0), bisect.bisect_left(ts, t1)
+            for k, col in enumerate(cols):
+                col.extend(data[k::N_FIELDS][lo:hi])
+        return cols
+
+    def query(self, rover_id, t0, t1, step=None):
+        """Telemetria de um rover entre t0 e t1 (epoch, segundos).
+
+        Sem 'step' devolve as amostras em bruto; com 'step' usa o nível de
+        agregação mais grosso que não passe de 'step' e, se preciso, volta a
+        agregar até 'step'. Devolve None se o rover não tiver histórico.
+        """
+
+        series = self._series.get(rover_id)
+        if series is None and not os.path.isdir(self._dir(rover_id)):
+            return None
+
+        source, resolution, width = None, "raw", None
+        if series is not None:
+            with series.lock:
+                source = series.raw
+                if step:
+                    for rollup in series.rollups:
+                        if rollup.width <= step:
+                            source, resolution, width = rollup, f"{int(rollup.width)}s", rollup.width
+                oldest = source.oldest()
+                memory = source.range(max(t0, oldest), t1) if oldest is not None else None
+        else:
+            oldest = memory = None
+
+        # O que a memória já não tem vem dos segmentos em disco ([t0, t1]
+        # como na memória); junta-se tudo antes de agregar, senão o bucket
+        # que atravessa 'oldest' aparecia duas vezes
+        if oldest is None or t0 < oldest:
+            end = oldest if oldest is not None and oldest <= t1 else math.nextafter(t1, math.inf)
+            disk = self._read_disk(rover_id, t0, end)
+            if width: disk = _downsample(disk, width)   # Ao nível das médias em memória
+            if memory is None: memory = [array("d") for _ in FIELDS]
+            cols = [d + m for d, m in zip(disk, memory)]
+        else:
+            cols = memory
+        if step and step != width: cols = _downsample(cols, step)
+
+        result = {"rover_id": rover_id, "from": t0, "to": t1, "step": step,
+                  "resolution": resolution if not step or step == width else f"{step:g}s"}
+        for name, col in zip(FIELDS, cols):
+            result[name] = col.tolist()
+        return result
@@ -2,15 +2,20 @@ import sys, os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import abc
+import asyncio
 import socket
 import threading
-import struct
 import time
 
-from common.codec import decode_msg, HEADER_SIZE, encode_msg
-from common.protocol_constants import TS_ERROR
+from common.codec import StreamFramer, encode_msg
+from common.protocol_constants import TS_ERROR, TS_DELTA
+from common.metrics import gauge
+from common.log import get_logger, set_rate_limit
+from instrumentation import LINK_TS, count_frame, count_decode_error
 from state.rover_state import (
     update_telemetry,
+    get_last_known_state,
     mark_disconnected,
     touch_heartbeat,
 )
@@ -18,163 +23,323 @@ from state.rover_state import (
 HOST = "0.0.0.0"
 PORT = 6000
 
+log = get_logger("TS")
+
+# Cada rover manda várias mensagens por segundo: em DEBUG, no máximo uma
+# linha por segundo de cada tipo, por rover
+for _event in ("ts.update", "ts.delta", "ts.heartbeat"):
+    set_rate_limit(_event, 1.0, 1)
+
+# Modos de execução do servidor
+MODE_THREAD  = "thread"    # Uma thread por rover (bloqueante)
+MODE_ASYNCIO = "asyncio"   # Um único event loop para todos os rovers
+DEFAULT_MODE = MODE_ASYNCIO
+
 _active_conns_lock = threading.Lock()
 
 _ACTIVE_CONNECTIONS = {}
 
+gauge("navemae_ts_connections", "Rovers com sessão TelemetryStream ativa").set_function(
+    lambda: len(_ACTIVE_CONNECTIONS))
+
+
+class _Session(abc.ABC):
+    """Ligação de um rover, seja qual for o modo do servidor."""
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.rover_id = None
+        self.telemetry = None   # Último estado completo (base para os TS_DELTA)
+
+    @abc.abstractmethod
+    def send(self, pkt):
+        """Envia um frame já codificado ao rover."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Fecha a ligação."""
+
+
+class _SocketSession(_Session):
+    """Sessão sobre um socket bloqueante (modo thread)."""
+
+    def __init__(self, conn, addr):
+        super().__init__(addr)
+        self.conn = conn
+
+    def send(self, pkt):
+        self.conn.sendall(pkt)
+
+    def close(self):
+        self.conn.close()
+
+
+class _TransportSession(_Session):
+    """Sessão sobre um transport asyncio (modo asyncio)."""
+
+    def __init__(self, transport, addr):
+        super().__init__(addr)
+        self.transport = transport
+
+    def send(self, pkt):
+        self.transport.write(pkt)
+
+    def close(self):
+        self.transport.close()
+
+
+def _handle_message(session, msg):
+    """Processa uma mensagem TS. Devolve False quando a sessão deve terminar."""
+
+    action = msg["action"]
+    payload = msg["payload"]
+    count_frame(LINK_TS, action, payload.get("rover_id") or session.rover_id)
+
+    #  1  CONNECT
+
+    if action == 1:
+
+        rover_id = payload["rover_id"]
+        session.rover_id = rover_id
+        log.info("%s a tentar conectar.", rover_id, extra={"event": "ts.connect", "rover_id": rover_id})
+
+        # LÓGICA DE CONCORRÊNCIA
+        with _active_conns_lock:
+
+            old_session = _ACTIVE_CONNECTIONS.get(rover_id)
+
+            if old_session is not None and old_session is not session:
+
+                log.info("A expulsar sessão antiga de %s.", rover_id, extra={"rover_id": rover_id})
+                try:
+                    # Tentar enviar TS_ERROR = 6
+                    err_pkt = encode_msg(msg["version"], 2, TS_ERROR, 0, {"error": "new_session"})
+                    old_session.send(err_pkt)
+
+                except Exception:
+
+                    pass # Sessão antiga pode já estar morta
+
+                old_session.close()
+
+            _ACTIVE_CONNECTIONS[rover_id] = session # Guardar nova conexão
+
+        session.telemetry = {
+            "position": payload.get("position", [0.0, 0.0, 0.0]), # Adiciona default
+            "battery": payload.get("battery", 100.0),      # Adiciona default
+            "status": "idle",
+            "speed": 0.0,
+        }
+        update_telemetry(rover_id=rover_id, **session.telemetry)
+        return True
+
+    #  2  TELEMETRY UPDATE
+
+    if action == 2: # TS_UPDATE
+
+        rover_id = payload["rover_id"]
+        session.rover_id = rover_id
+
+        session.telemetry = {
+            "position": payload["position"],
+            "battery": payload["battery"],
+            "status": payload["status"],
+            "speed": payload["speed"],
+        }
+        update_telemetry(rover_id=rover_id, **session.telemetry)
+
+        log.debug("%s → pos=%s | batt=%s%% | status=%s | speed=%s", rover_id, payload["position"],
+                  payload["battery"], payload["status"], payload["speed"],
+                  extra={"event": "ts.update", "rover_id": rover_id})
+        return True
+
+    #  7  TELEMETRY DELTA (só os campos que mudaram)
+
+    if action == TS_DELTA:
+
+        rover_id = payload["rover_id"]
+        session.rover_id = rover_id
+
+        if session.telemetry is None:
+            # Delta sem TS_UPDATE antes nesta sessão: completar com o último estado conhecido
+            pos, batt = get_last_known_state(rover_id)
+            session.telemetry = {"position": pos, "battery": batt, "status": "idle", "speed": 0.0}
+
+        changed = {k: payload[k] for k in ("position", "battery", "status", "speed") if k in payload}
+        session.telemetry.update(changed)
+        update_telemetry(rover_id=rover_id, **session.telemetry)
+
+        log.debug("%s Δ %s", rover_id, changed, extra={"event": "ts.delta", "rover_id": rover_id})
+        return True
+
+    #  4  HEARTBEAT
+
+    if action == 4: # TS_HEARTBEAT
+        rover_id = payload["rover_id"]
+        session.rover_id = rover_id
+        touch_heartbeat(rover_id)
+        log.debug("Heartbeat de %s", rover_id, extra={"event": "ts.heartbeat", "rover_id": rover_id})
+        return True
+
+    #  5 → DISCONNECT
+
+    if action == 5: # TS_DISCONNECT
+        session.rover_id = payload["rover_id"]
+        log.info("%s → Disconnect (%s)", session.rover_id, payload.get("reason", ""),
+                 extra={"event": "ts.disconnect", "rover_id": session.rover_id})
+        return False
+
+    return True
+
+
+def _end_session(session):
+    """Marca o rover como desligado e liberta o seu lugar."""
+
+    rover_id = session.rover_id
+    if rover_id:
+
+        mark_disconnected(rover_id)
+
+        # Libertar o "lugar"
+        with _active_conns_lock:
+            # Só apaga se esta for a conexão ativa (evita race conditions)
+            if _ACTIVE_CONNECTIONS.get(rover_id) is session:
+
+                del _ACTIVE_CONNECTIONS[rover_id]
+
+
+# =========================================================
+# Modo thread: uma thread por ligação
+# =========================================================
+
+def _bad_frame(addr):
+    """Callback do framer para uma mensagem inválida: é contada e saltada."""
+
+    def on_error(e):
+        count_decode_error(LINK_TS, e)
+        log.warning("Mensagem inválida de %s (ignorada): %s", addr, e, extra={"event": "ts.decode_error"})
+    return on_error
+
+
 def handle_client(conn, addr):
     """Lida com a ligação de um cliente (rover)."""
-    
-    rover_id = None
-    print(f"[TS] Ligação de {addr}")
+
+    session = _SocketSession(conn, addr)
+    log.debug("Ligação de %s", addr)
+
+    framer = StreamFramer()
+    on_error = _bad_frame(addr)
+    closing = False
 
     try:
-        while True:
+        while not closing:
             # =========================================================
-            # Ler o cabeçalho de 8 bytes primeiro
+            # Ler diretamente para o buffer do framer; cada leitura pode
+            # trazer meia mensagem ou várias mensagens juntas
             # =========================================================
-            header_data = conn.recv(HEADER_SIZE)
-            
-            if not header_data:
-                break
-            
-            # Descobrir o tamanho do payload a partir do cabeçalho
-            # O 'length' está no formato '!BBB(HH)B', por isso está nos bytes 5 e 6
-            # Vamos assumir que o decode_msg trata de tudo se lhe dermos o pacote completo
-            
-            # Obter o 'length' do payload (bytes 5 e 6 do header, formato 'H')
-            msg_len = struct.unpack("!H", header_data[5:7])[0]
-
-            # Agora, ler o resto da mensagem (o payload)
-            data = conn.recv(msg_len)
-            
-            if not data:
+            if framer.recv_into(conn) == 0:
                 break
 
-            # Reconstruir o pacote completo e decodificar
-            full_packet = header_data + data
-            msg = decode_msg(full_packet) # Usar o codec
-
-            if msg is None:
-                
-                print(f"[TS] ERRO a decodificar {addr}: Checksum inválido")
-                continue
-
-            action = msg["action"] 
-            payload = msg["payload"]
-
-            
-            #  1  CONNECT
-            
-            if action == 1:
-                
-                rover_id = payload["rover_id"]
-                print(f"[TS] {rover_id} a tentar conectar.")
-
-                # LÓGICA DE CONCORRÊNCIA
-                with _active_conns_lock:
-                    
-                    if rover_id in _ACTIVE_CONNECTIONS:
-                        
-                        old_conn = _ACTIVE_CONNECTIONS[rover_id]
-                        print(f"[TS] A expulsar sessão antiga de {rover_id}.")
-                        try:
-                            # Tentar enviar TS_ERROR = 6
-                            err_pkt = encode_msg(1, 2, TS_ERROR, 0, {"error": "new_session"})
-                            old_conn.sendall(err_pkt)
-                            
-                        except Exception:
-                            
-                            pass # Sessão antiga pode já estar morta
-                        
-                        old_conn.close()
-                    
-                    
-                    _ACTIVE_CONNECTIONS[rover_id] = conn # Guardar nova conexão
-                    
-                update_telemetry(
-                    rover_id=rover_id,
-                    position=payload.get("position", [0.0, 0.0, 0.0]), # Adiciona default
-                    battery=payload.get("battery", 100.0),      # Adiciona default
-                    status="idle",
-                    speed=0.0,
-                )
-                continue
-
-            
-            #  2  TELEMETRY UPDATE
-            
-            if action == 2: # TS_UPDATE
-                
-                rover_id = payload["rover_id"]
-
-                update_telemetry(
-                    rover_id=rover_id,
-                    position=payload["position"],
-                    battery=payload["battery"],
-                    status=payload["status"],
-                    speed=payload["speed"],
-                )
-
-                print(f"[TS] {rover_id} → pos={payload['position']} | "
-                      f"batt={payload['battery']}% | status={payload['status']} | speed={payload['speed']}")
-                continue
-
-            
-            #  4  HEARTBEAT
-            
-            if action == 4: # TS_HEARTBEAT
-                rover_id = payload["rover_id"]
-                touch_heartbeat(rover_id)
-                print(f"[TS] Heartbeat de {rover_id}")
-                continue
-
-           
-            #  5 → DISCONNECT
-           
-            if action == 5: # TS_DISCONNECT
-                rover_id = payload["rover_id"]
-                print(f"[TS] {rover_id} → Disconnect ({payload.get('reason', '')})")
-                break
+            for msg in framer.frames(on_error):
+                if not _handle_message(session, msg):
+                    closing = True
+                    break
 
     except ConnectionResetError:
-        
-        print(f"[TS] Ligação perdida com {addr}")
-        
-    except ValueError as e: 
-        print(f"[TS] Erro de protocolo (Value) {addr}: {e}")
-        
+
+        log.info("Ligação perdida com %s", addr)
+
+    except ValueError as e:
+        count_decode_error(LINK_TS, e)
+        log.warning("Erro de protocolo (Value) %s: %s", addr, e)
+
     except Exception as e:
-        print(f"[TS] Erro na ligação {addr}: {e}")
+        log.error("Erro na ligação %s: %s", addr, e)
 
     finally:
-        if rover_id:
-            
-            mark_disconnected(rover_id)
-            
-            # Libertar o "lugar"
-            with _active_conns_lock:
-                # Só apaga se esta for a conexão ativa (evita race conditions)
-                if _ACTIVE_CONNECTIONS.get(rover_id) == conn:
-                    
-                    del _ACTIVE_CONNECTIONS[rover_id]
-        
+        _end_session(session)
+
         conn.close()
-        
-        print(f"[TS] Ligação encerrada: {addr}")
-        
 
-def start_telemetry_server():
-    """Inicia o servidor de telemetria."""
-    
+        log.debug("Ligação encerrada: %s", addr)
+
+
+def _serve_threads(host, port):
+    """Aceita ligações e cria uma thread por rover."""
+
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    srv.bind((HOST, PORT))
+    srv.bind((host, port))
     srv.listen()
 
-    print(f"[TS] Servidor ativo em {HOST}:{PORT}")
+    log.info("Servidor ativo em %s:%s (thread por ligação)", host, port)
 
     while True:
-        
+
         conn, addr = srv.accept()
         threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+
+
+# =========================================================
+# Modo asyncio: todas as ligações num só event loop
+# =========================================================
+
+class TelemetryProtocol(asyncio.Protocol):
+    """Ligação de um rover no servidor asyncio."""
+
+    def connection_made(self, transport):
+        self.addr = transport.get_extra_info("peername")
+        self.session = _TransportSession(transport, self.addr)
+        self.framer = StreamFramer()
+        self.on_error = _bad_frame(self.addr)
+        log.debug("Ligação de %s", self.addr)
+
+    def data_received(self, data):
+        try:
+            for msg in self.framer.feed(data, self.on_error):
+                if not _handle_message(self.session, msg):
+                    self.session.close()
+                    return
+
+        except ValueError as e:
+            count_decode_error(LINK_TS, e)
+            log.warning("Erro de protocolo (Value) %s: %s", self.addr, e)
+            self.session.close()
+
+        except Exception as e:
+            log.error("Erro na ligação %s: %s", self.addr, e)
+            self.session.close()
+
+    def connection_lost(self, exc):
+        if isinstance(exc, ConnectionResetError):
+            log.info("Ligação perdida com %s", self.addr)
+
+        _end_session(self.session)
+
+        log.debug("Ligação encerrada: %s", self.addr)
+
+
+async def _serve_asyncio(host, port):
+    """Servidor asyncio: não cria threads por ligação."""
+
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(TelemetryProtocol, host, port,
+                                      reuse_address=True, backlog=1024)
+
+    log.info("Servidor ativo em %s:%s (asyncio)", host, port)
+
+    async with server:
+        await server.serve_forever()
+
+
+def start_telemetry_server(mode=DEFAULT_MODE, host=HOST, port=PORT):
+    """Inicia o servidor de telemetria no modo indicado ('thread' ou 'asyncio')."""
+
+    if mode == MODE_ASYNCIO:
+        asyncio.run(_serve_asyncio(host, port))
+
+    elif mode == MODE_THREAD:
+        _serve_threads(host, port)
+
+    else:
+        raise ValueError(f"Modo de telemetria desconhecido: {mode}")
@@ -0,0 +1,507 @@
+"""Simulador de frota sem interface: milhares de rovers virtuais num só processo.
+
+Cada rover virtual liga-se à Nave-Mãe como um rover real: TelemetryStream
+por TCP (porta 6000) e MissionLink por UDP (porta 5000). Reaproveita o que
+o rover usa: bateria (common/energy.py), envio adaptativo de telemetria
+(TelemetryReporter), trajetos (planning.py) e entrega fiável do COMPLETE
+(common/reliability.py). As tarefas são simplificadas: o rover segue o
+trajeto planeado e, em collect_sample, recolhe no fim do percurso.
+
+  --accel     o tempo simulado corre N vezes mais depressa (missões,
+              bateria e intervalos de envio); a rede e os timeouts da
+              Nave-Mãe continuam em tempo real
+  --loss      fração de datagramas MissionLink perdidos (em cada sentido)
+  --latency   atraso de cada mensagem (+ --jitter aleatório, só em UDP)
+  --mission-rate  missões por minuto simulado submetidas à API (sem
+              rover_id: é o escalonador que escolhe)
+
+    python rover/fleet_simulator.py --rovers 2000 --accel 10 --loss 0.02 --latency 0.02
+    python rover/fleet_simulator.py --rovers 500 --mission-rate 60 --seconds 120
+"""
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import resource
+import time
+import urllib.request
+
+from common.codec import encode_msg, decode_msg
+from common.energy import compute_battery, CHARGE_START_IDLE, CHARGE_START_MISSION
+from common.reliability import ReliableSender, DuplicateFilter
+from common.protocol_constants import (
+    PROTOCOL_VERSION, TS_CONNECT, TS_DISCONNECT,
+    ML_REQUEST, ML_ACK, ML_UPDATE, ML_COMPLETE, ML_NEW_MISSION, ML_CANCEL,
+)
+from common.log import get_logger, setup_logging, add_logging_args
+from telemetry_client import TelemetryReporter, HEARTBEAT_INTERVAL
+from missionlink_client import SPEED
+import planning
+
+MAP_SIZE = 200.0          # os rovers começam espalhados por [0, MAP_SIZE]²
+CONNECT_CONCURRENCY = 200 # ligações TCP abertas em simultâneo no arranque
+REQUEST_INTERVAL = 3.0    # segundos simulados entre ML_REQUEST de um rover parado
+CHARGING_POLL = 2.0
+RETRANSMIT_TICK = 0.02    # segundos reais
+REPORT_INTERVAL = 5.0     # segundos reais entre linhas de estatística
+TASKS = ("scan_area", "collect_sample", "analyze_environment")
+
+log = get_logger("SIM")
+
+
+class SimClock:
+    """Tempo simulado: corre 'accel' vezes mais depressa que o real."""
+
+    def __init__(self, accel):
+        self.accel = accel
+        self._real0 = time.monotonic()
+        self._sim0 = time.time()
+
+    def now(self):
+        return self._sim0 + (time.monotonic() - self._real0) * self.accel
+
+    async def sleep(self, sim_seconds):
+        await asyncio.sleep(max(0.0, sim_seconds) / self.accel)
+
+
+class Network:
+    """Perdas e atrasos injetados nas mensagens."""
+
+    def __init__(self, loop, loss, latency, jitter, rng):
+        self.loop = loop
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = rng
+        self.dropped = 0
+
+    def datagram(self, fn, *args):
+        """Entrega (ou perde) um datagrama, com atraso e jitter."""
+
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            self.loop.call_later(delay, fn, *args)
+        else:
+            fn(*args)
+
+    def stream(self, fn, *args):
+        """TCP: nada se perde e a ordem mantém-se (atraso fixo, sem jitter)."""
+
+        if self.latency > 0:
+            self.loop.call_later(self.latency, fn, *args)
+        else:
+            fn(*args)
+
+
+class Fleet:
+    """Estado partilhado pelos rovers virtuais."""
+
+    def __init__(self, args, loop):
+        self.args = args
+        self.loop = loop
+        self.clock = SimClock(args.accel)
+        self.rng = random.Random(args.seed)
+        self.net = Network(loop, args.loss, args.latency, args.jitter, self.rng)
+        self.dedup = DuplicateFilter()
+        self.reliable = ReliableSender(self._send_reliable)
+        self.rovers = {}
+        self.stats = dict.fromkeys((
+            "connected", "ts_frames", "ts_bytes", "ml_sent", "ml_received",
+            "missions", "completed", "incomplete", "aborted", "submitted", "api_errors",
+        ), 0)
+
+    def _send_reliable(self, rid, pkt):
+        self.rovers[rid].send_ml_raw(pkt)
+
+    async def retransmit_loop(self):
+        while True:
+            await asyncio.sleep(RETRANSMIT_TICK)
+            self.reliable.poll()
+
+
+class _MissionLinkEndpoint(asyncio.DatagramProtocol):
+    def __init__(self, rover):
+        self.rover = rover
+
+    def datagram_received(self, data, addr):
+        self.rover.fleet.net.datagram(self.rover.on_datagram, data)
+
+    def error_received(self, exc):
+        pass   # Nave-Mãe em baixo: os pedidos repetem-se
+
+
+class SimRover:
+    """Um rover virtual: telemetria, pedidos de missão e execução."""
+
+    def __init__(self, fleet, rid):
+        self.fleet = fleet
+        self.rid = rid
+        rng = fleet.rng
+        self.position = [rng.uniform(0, MAP_SIZE), rng.uniform(0, MAP_SIZE), 0.0]
+        self.battery = rng.uniform(50, 100)
+        self.status = "idle"
+        self.mission = None
+        self.cancel_requested = None
+        self.mission_event = asyncio.Event()
+        self.seq = 0
+        self.writer = None
+        self.transport = None
+
+    def _next_seq(self):
+        self.seq = self.seq % 65535 + 1
+        return self.seq
+
+    # ---------------------------------------------------------
+    # Envio
+    # ---------------------------------------------------------
+
+    def send_ts(self, action, payload):
+        pkt = encode_msg(PROTOCOL_VERSION, 2, action, self._next_seq(), payload)
+        self.fleet.stats["ts_frames"] += 1
+        self.fleet.stats["ts_bytes"] += len(pkt)
+        self.fleet.net.stream(self._write, pkt)
+
+    def _write(self, pkt):
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(pkt)
+
+    def send_ml(self, action, payload, seq=None):
+        self.send_ml_raw(encode_msg(PROTOCOL_VERSION, 1, action, self._next_seq() if seq is None else seq, payload))
+
+    def send_ml_raw(self, pkt):
+        self.fleet.stats["ml_sent"] += 1
+        self.fleet.net.datagram(self._sendto, pkt)
+
+    def _sendto(self, pkt):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.sendto(pkt)
+
+    # ---------------------------------------------------------
+    # Receção (MissionLink)
+    # ---------------------------------------------------------
+
+    def on_datagram(self, data):
+        try:
+            msg = decode_msg(data)
+        except ValueError:
+            return
+        if msg is None:
+            return
+
+        self.fleet.stats["ml_received"] += 1
+        action, payload = msg["action"], msg["payload"]
+
+        if action == ML_NEW_MISSION:
+            self.send_ml(ML_ACK, {"rover_id": self.rid, "mission_id": payload["mission_id"]}, seq=msg["seq"])
+            if self.fleet.dedup.seen(self.rid, payload["mission_id"]):
+                return
+            self.mission = payload
+            if self.status != "charging":   # Como set_status() no rover: a carregar, aborta logo
+                self.status = "in_mission"
+            self.mission_event.set()
+
+        elif action == ML_CANCEL:
+            self.send_ml(ML_ACK, {"rover_id": self.rid, "mission_id": payload["mission_id"]}, seq=msg["seq"])
+            if self.mission and self.mission["mission_id"] == payload["mission_id"]:
+                self.cancel_requested = payload["mission_id"]
+
+        elif action == ML_ACK:
+            self.fleet.reliable.ack(self.rid, msg["seq"])
+
+    # ---------------------------------------------------------
+    # Ciclo de vida
+    # ---------------------------------------------------------
+
+    async def connect(self):
+        args = self.fleet.args
+        loop = self.fleet.loop
+
+        _, self.writer = await asyncio.open_connection(args.host, args.ts_port)
+        self.send_ts(TS_CONNECT, {"rover_id": self.rid, "timestamp": time.time()})
+
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _MissionLinkEndpoint(self), remote_addr=(args.host, args.ml_port))
+        self.fleet.stats["connected"] += 1
+
+    async def close(self):
+        if self.writer is not None:
+            self._write(encode_msg(PROTOCOL_VERSION, 2, TS_DISCONNECT, 0,
+                                   {"rover_id": self.rid, "reason": "simulator_exit"}))
+            self.writer.close()
+        if self.transport is not None:
+            self.transport.close()
+
+    async def telemetry_loop(self):
+        clock = self.fleet.clock
+        # O heartbeat tem de chegar em tempo real antes do timeout da Nave-Mãe
+        reporter = TelemetryReporter(self.rid, heartbeat_interval=HEARTBEAT_INTERVAL * min(1.0, clock.accel))
+        last = clock.now()
+
+        while True:
+            now = clock.now()
+            dt, last = now - last, now
+
+            task = self.mission.get("task") if self.mission else None
+            self.battery = compute_battery(self.battery, self.status, task, dt)
+            batt = round(self.battery, 1)
+
+            if batt < CHARGE_START_IDLE and self.status == "idle":
+                self.status = "charging"
+            elif batt < CHARGE_START_MISSION and self.status == "in_mission":
+                self.status = "charging"
+            elif batt >= 100 and self.status == "charging":
+                self.status = "idle"
+
+            speed = 1.0 if self.status == "in_mission" else 0.0
+            message = reporter.report(now, self.position, batt, speed, self.status)
+            if message is not None:
+                self.send_ts(*message)
+
+            await clock.sleep(reporter.interval(self.status))
+
+    async def mission_loop(self):
+        clock = self.fleet.clock
+
+        while True:
+            if self.mission is not None:
+                await self.run_mission()
+
+            elif self.status == "idle":
+                self.send_ml(ML_REQUEST, {"rover_id": self.rid})
+                try:
+                    await asyncio.wait_for(self.mission_event.wait(), REQUEST_INTERVAL / clock.accel)
+                except asyncio.TimeoutError:
+                    pass
+                self.mission_event.clear()
+
+            else:
+                await clock.sleep(CHARGING_POLL)
+
+    def _interrupted(self, mid):
+        return self.status == "charging" or self.cancel_requested == mid
+
+    async def run_mission(self):
+        fleet = self.fleet
+        clock = fleet.clock
+        m = self.mission
+        mid = m["mission_id"]
+        task = m.get("task")
+        duration = float(m.get("duration", 60))
+        interval = float(m.get("update_interval", 5))
+        fleet.stats["missions"] += 1
+
+        # Trajeto planeado como no rover real
+        if task == "scan_area":
+            waypoints = planning.lawnmower(m.get("area", [[0, 0], [10, 10]]), float(m.get("resolution", 1.0)))
+        elif task == "collect_sample":
+            waypoints = m.get("points", [])
+            if m.get("optimize_route", True):
+                waypoints = planning.order_points(self.position, waypoints)
+        else:
+            waypoints = []
+        trajectory = planning.plan_trajectory(self.position, waypoints, SPEED, interval) if waypoints else None
+        travel = trajectory.duration if trajectory else 0.0
+
+        if task == "scan_area":
+            finish, reachable = min(travel, duration), travel <= duration
+        else:
+            finish, reachable = duration, travel <= duration
+
+        start = clock.now()
+        interrupted = False
+        while True:
+            await clock.sleep(interval)
+            if self._interrupted(mid):
+                interrupted = True
+                break
+
+            elapsed = min(clock.now() - start, finish)
+            if trajectory is not None:
+                self.position[0], self.position[1] = trajectory.position_at(elapsed)
+            elif task == "analyze_environment":
+                angle = fleet.rng.uniform(0, 2 * math.pi)
+                self.position[0] += math.cos(angle) * SPEED * interval
+                self.position[1] += math.sin(angle) * SPEED * interval
+
+            if elapsed >= finish:
+                break
+
+            moving = trajectory is not None and elapsed < travel
+            status = "moving" if task == "collect_sample" and moving else (
+                "collecting" if task == "collect_sample" else "in_progress")
+            self.send_ml(ML_UPDATE, {
+                "rover_id": self.rid, "mission_id": mid,
+                "progress": round(min(99.0, elapsed / duration * 100), 1), "status": status,
+                "position": list(self.position), "extra": {"display": f"sim {task}"},
+            })
+
+        success = reachable and not interrupted
+        final_status = "completed" if success else ("aborted" if interrupted else "incomplete")
+        fleet.stats[final_status] += 1
+
+        seq = self._next_seq()
+        fleet.reliable.send(self.rid, seq, encode_msg(PROTOCOL_VERSION, 1, ML_COMPLETE, seq, {
+            "rover_id": self.rid, "mission_id": mid, "progress": 100 if success else 0,
+            "status": final_status, "position": list(self.position),
+        }))
+
+        if self.status != "charging":
+            self.status = "idle"
+        self.mission = None
+        self.cancel_requested = None
+
+
+# =========================================================
+# Missões submetidas à API (opcional)
+# =========================================================
+
+def random_mission(rng):
+    task = rng.choice(TASKS)
+    x, y = rng.uniform(0, MAP_SIZE), rng.uniform(0, MAP_SIZE)
+    mission = {"task": task, "duration": rng.randint(60, 180), "update_interval": 5}
+    if task == "scan_area":
+        mission["area"] = [[x, y], [x + 10, y + 10]]
+    elif task == "collect_sample":
+        mission["points"] = [[x, y], [x + 5, y + 5]]
+    else:
+        mission["sensors"] = ["temperature"]
+    return mission
+
+def _post_json(url, data):
+    req = urllib.request.Request(url, data=json.dumps(data).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return json.loads(resp.read())
+
+async def mission_feeder(fleet):
+    """Submete missões a --mission-rate por minuto simulado, uma vez por segundo."""
+
+    args = fleet.args
+    rate = args.mission_rate * args.accel / 60.0   # missões por segundo real
+    url = args.api.rstrip("/") + "/api/missions/batch"
+    loop = fleet.loop
+    due = 0.0
+
+    while True:
+        await asyncio.sleep(1.0)
+        due += rate
+        n = int(due)
+        due -= n
+        if n == 0:
+            continue
+        batch = [random_mission(fleet.rng) for _ in range(n)]
+        try:
+            await loop.run_in_executor(None, _post_json, url, batch)
+            fleet.stats["submitted"] += n
+        except Exception:
+            fleet.stats["api_errors"] += 1
+
+
+# =========================================================
+# Arranque e estatísticas
+# =========================================================
+
+def _raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = min(hard, max(soft, needed))
+    if want > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+    return want
+
+async def report_loop(fleet):
+    stats = fleet.stats
+    last = dict(stats)
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        rate = {k: (stats[k] - last[k]) / REPORT_INTERVAL for k in stats}
+        last = dict(stats)
+        busy = sum(1 for r in fleet.rovers.values() if r.mission is not None)
+        log.info("ligados=%d em missão=%d | TS %.0f/s (%.1f KiB/s) | "
+                 "ML %.0f/s enviados, %.0f/s recebidos | "
+                 "concluídas=%d incompletas=%d abortadas=%d | "
+                 "perdidos=%d retrans=%d sem ACK=%d",
+                 stats["connected"], busy, rate["ts_frames"], rate["ts_bytes"] / 1024,
+                 rate["ml_sent"], rate["ml_received"],
+                 stats["completed"], stats["incomplete"], stats["aborted"],
+                 fleet.net.dropped, fleet.reliable.retransmissions, fleet.reliable.give_ups,
+                 extra={"event": "sim.report"})
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    fleet = Fleet(args, loop)
+    _raise_fd_limit(2 * args.rovers + 256)
+
+    log.info("%d rovers → TS %s:%d, ML %s:%d (x%s, perda %.0f%%, latência %.0f±%.0f ms)",
+             args.rovers, args.host, args.ts_port, args.host, args.ml_port,
+             args.accel, args.loss * 100, args.latency * 1000, args.jitter * 1000)
+
+    limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def start_rover(i):
+        rover = SimRover(fleet, f"{args.prefix}{i:05d}")
+        async with limit:
+            await rover.connect()
+        fleet.rovers[rover.rid] = rover
+        return [loop.create_task(rover.telemetry_loop()), loop.create_task(rover.mission_loop())]
+
+    tasks = [loop.create_task(fleet.retransmit_loop()), loop.create_task(report_loop(fleet))]
+    for started in await asyncio.gather(*(start_rover(i) for i in range(args.rovers))):
+        tasks.extend(started)
+    if args.mission_rate > 0:
+        tasks.append(loop.create_task(mission_feeder(fleet)))
+
+    try:
+        if args.seconds:
+            await asyncio.sleep(args.seconds)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        for t in tasks:
+            t.cancel()
+        for rover in fleet.rovers.values():
+            await rover.close()
+
+    s = fleet.stats
+    log.info("Fim: missões=%d concluídas=%d incompletas=%d abortadas=%d submetidas=%d | "
+             "TS %d frames, ML %d enviados / %d recebidos, %d perdidos",
+             s["missions"], s["completed"], s["incomplete"], s["aborted"], s["submitted"],
+             s["ts_frames"], s["ml_sent"], s["ml_received"], fleet.net.dropped,
+             extra={"event": "sim.summary"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rovers", type=int, default=1000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ts-port", type=int, default=6000)
+    parser.add_argument("--ml-port", type=int, default=5000)
+    parser.add_argument("--accel", type=float, default=1.0, help="aceleração do tempo simulado")
+    parser.add_argument("--loss", type=float, default=0.0, help="fração de datagramas perdidos")
+    parser.add_argument("--latency", type=float, default=0.0, help="atraso (s) de cada mensagem")
+    parser.add_argument("--jitter", type=float, default=0.0, help="atraso extra aleatório (s), só UDP")
+    parser.add_argument("--mission-rate", type=float, default=0.0, help="missões por minuto simulado")
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--prefix", default="S", help="prefixo dos ids (cabem 8 caracteres)")
+    parser.add_argument("--seconds", type=float, default=0.0, help="duração (s reais); 0 = até Ctrl-C")
+    parser.add_argument("--seed", type=int, default=1)
+    add_logging_args(parser)
+    args = parser.parse_args()
+
+    if args.accel <= 0:
+        parser.error("--accel tem de ser positivo")
+    setup_logging(args.log_level, args.log_json, rate=args.log_rate)
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        log.info("Encerrado manualmente.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
+import argparse
 import threading
 import rover_identity
 from rover_identity import choose_rover_id
 
 from missionlink_client import start_missionlink, get_status, get_current_task
 from telemetry_client import start_telemetry
+from common.log import get_logger, setup_logging, add_logging_args
+
+log = get_logger("ROVER")
 
 def main():
     
-    print(">>> main iniciou")
+    parser = argparse.ArgumentParser(description="Rover")
+    add_logging_args(parser)
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.log_json, rate=args.log_rate)
+
+    log.debug(">>> main iniciou")
     choose_rover_id()
 
     def get_pos(): return rover_identity.POSITION
@@ -29,7 +38,7 @@ def main():
         start_missionlink()
     except KeyboardInterrupt:
         
-        print(f"[{rover_identity.ROVER_ID}] MissionLink encerrado manualmente.")
+        log.info("%s MissionLink encerrado manualmente.", rover_identity.ROVER_ID)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,14 +7,32 @@ import time
 import math
 import random
 import rover_identity
-from common.codec import encode_msg, decode_msg
-from common.protocol_constants import ML_REQUEST, ML_ACK, ML_UPDATE, ML_COMPLETE, ML_NEW_MISSION
+import planning
+from common.codec import encode_msg, decode_msg, encode_batch, encode_batch_record, HEADER_SIZE
+from common.reliability import ReliableSender, DuplicateFilter
+from common.log import get_logger
+from common.protocol_constants import (
+    ML_REQUEST, ML_ACK, ML_UPDATE, ML_COMPLETE, ML_NEW_MISSION, ML_CANCEL, ML_BATCH, PROTOCOL_VERSION,
+)
 
 ML_SERVER =("10.0.3.20",5000) #IP DA NAVE-MÃE NO CORE
 #ML_SERVER = ("127.0.0.1", 5000) no pc
 
+log = get_logger("ML")
+
 SEQ = 1
+RETRANSMIT_TICK = 0.05
+_reliable = None             # Mensagens por confirmar (criado em start_missionlink)
+_batcher = None              # ML_UPDATE à espera de sair em lote (criado em start_missionlink)
+
+# Lotes de ML_UPDATE: vários updates num datagrama, até caber no MTU
+BATCH_UPDATES = True         # False: um datagrama por update (servidores antigos)
+BATCH_MAX_BYTES = 1472       # MTU Ethernet (1500) - IP (20) - UDP (8)
+BATCH_MAX_LATENCY = 1.0      # segundos que um update pode esperar pelo lote
+_seen_missions = DuplicateFilter()
 _current_mission = None
+_cancel_requested = None     # mission_id que a Nave-Mãe mandou cancelar
+_mission_event = threading.Event()
 _status_lock = threading.Lock()
 _rover_status = "idle"
 SPEED = 1.0 
@@ -31,6 +49,13 @@ def set_status(s):
         if _rover_status == "charging" and s != "idle" and s != "charging": return 
         _rover_status = s
 
+def _interrupted():
+    """True se a missão atual deve parar (bateria ou cancelamento pela Nave-Mãe)."""
+
+    if get_status() == "charging": return True
+    m = _current_mission
+    return m is not None and m["mission_id"] == _cancel_requested
+
 def get_current_task():
     """Devolve a tarefa atual do rover (ou None)."""
     
@@ -38,18 +63,103 @@ def get_current_task():
     
     return _current_mission.get("task")
 
-def send(sock, action, payload):
-    """Envia uma mensagem codificada para o servidor MissionLink."""
-    
+def _next_seq():
     global SEQ
-    pkt = encode_msg(1, 1, action, SEQ, payload)
+    seq = SEQ
+    SEQ = SEQ % 65535 + 1    # O 0 fica reservado para "sem seq"
+    return seq
+
+def send(sock, action, payload, seq=None):
+    """Envia uma mensagem codificada para o servidor MissionLink.
+
+    'seq' só se indica nos ACKs, que repetem o seq da mensagem confirmada.
+    """
+    
+    if seq is None: seq = _next_seq()
+    pkt = encode_msg(PROTOCOL_VERSION, 1, action, seq, payload)
     sock.sendto(pkt, ML_SERVER)
-    SEQ = (SEQ + 1) % 65536
+
+def send_reliable(action, payload):
+    """Envia uma mensagem que a Nave-Mãe confirma com ML_ACK (retransmitida até lá)."""
+
+    seq = _next_seq()
+    _reliable.send("navemae", seq, encode_msg(PROTOCOL_VERSION, 1, action, seq, payload))
+
+class UpdateBatcher:
+    """Junta ML_UPDATE num só datagrama ML_BATCH.
+
+    Cada update é codificado logo em add() (a posição é uma lista que
+    continua a mudar). O lote sai quando o próximo update já não cabe em
+    max_bytes, quando o mais antigo esperou max_latency segundos (poll()),
+    ou em flush(). Um lote com um só update sai como ML_UPDATE normal.
+    """
+
+    def __init__(self, send_fn, max_bytes=BATCH_MAX_BYTES, max_latency=BATCH_MAX_LATENCY):
+        self._send_fn = send_fn       # send_fn(pkt)
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self._lock = threading.Lock()
+        self._records = []
+        self._first = None            # payload do primeiro (se o lote só tiver esse)
+        self._size = HEADER_SIZE + 1  # header + byte de formato
+        self._since = None
+
+        self.updates = 0
+        self.datagrams = 0
+
+    def add(self, payload):
+        record = encode_batch_record(1, ML_BATCH, payload)
+        with self._lock:
+            if self._records and self._size + len(record) > self.max_bytes:
+                self._flush_locked()
+            if not self._records:
+                self._since = time.monotonic()
+                self._first = dict(payload, position=list(payload["position"]))
+            self._records.append(record)
+            self._size += len(record)
+            self.updates += 1
+
+    def poll(self):
+        with self._lock:
+            if self._records and time.monotonic() - self._since >= self.max_latency:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            if self._records:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if len(self._records) == 1:
+            pkt = encode_msg(PROTOCOL_VERSION, 1, ML_UPDATE, _next_seq(), self._first)
+        else:
+            pkt = encode_batch(1, ML_BATCH, _next_seq(), self._records)
+        self._records = []
+        self._first = None
+        self._size = HEADER_SIZE + 1
+        self.datagrams += 1
+        self._send_fn(pkt)
+
+def send_update(sock, payload):
+    """Envia um ML_UPDATE, em lote se BATCH_UPDATES estiver ativo."""
+
+    if _batcher is None:
+        send(sock, ML_UPDATE, payload)
+    else:
+        _batcher.add(payload)
+
+def _retransmit_loop():
+    """Thread que retransmite as mensagens cujo RTO expirou (e despacha os lotes)."""
+
+    while True:
+        time.sleep(RETRANSMIT_TICK)
+        _reliable.poll()
+        if _batcher is not None: _batcher.poll()
 
 def handle_server_messages(sock):
     """Thread que lida com mensagens recebidas do servidor MissionLink."""
     
-    global _current_mission
+    global _current_mission, _cancel_requested
     
     while True:
         
@@ -59,68 +169,79 @@ def handle_server_messages(sock):
             msg = decode_msg(data)
             if msg["action"] == ML_NEW_MISSION:
                 
-                _current_mission = msg["payload"]
-                print(f"[ML] Nova Missão: {msg['payload']['mission_id']}")
-                send(sock, ML_ACK, {"rover_id": rover_identity.ROVER_ID, "mission_id": msg["payload"]["mission_id"]})
+                mission = msg["payload"]
+                # Confirmar sempre: uma retransmissão quer dizer que o ACK se perdeu
+                send(sock, ML_ACK, {"rover_id": rover_identity.ROVER_ID, "mission_id": mission["mission_id"]},
+                     seq=msg["seq"])
+                if _seen_missions.seen("navemae", mission["mission_id"]): continue   # Duplicado
+
+                _current_mission = mission
+                log.info("Nova Missão: %s", mission["mission_id"], extra={"mission_id": mission["mission_id"]})
                 set_status("in_mission")
+                _mission_event.set()
+
+            elif msg["action"] == ML_CANCEL:
+
+                mid = msg["payload"]["mission_id"]
+                send(sock, ML_ACK, {"rover_id": rover_identity.ROVER_ID, "mission_id": mid}, seq=msg["seq"])
+                if _current_mission and _current_mission["mission_id"] == mid:
+                    log.info("Missão %s cancelada pela Nave-Mãe.", mid, extra={"mission_id": mid})
+                    _cancel_requested = mid
+
+            elif msg["action"] == ML_ACK:
+                _reliable.ack("navemae", msg["seq"])
         except: continue
 
 
-def navigate_waypoints(sock, m_id, waypoints, duration, interval, desc="A mover"):
-    """Navega por uma série de waypoints em dado tempo, enviando updates."""
-    
-    start_time = time.time()
-    
-    # Garante que curr_pos tem sempre 3 coordenadas
+def follow_trajectory(sock, m_id, trajectory, mission_start, duration, message,
+                      status="in_progress", check_timeout=True):
+    """Percorre um trajeto pré-calculado (planning.plan_trajectory), uma
+    amostra por tick, enviando updates. message(target) dá o texto para a Web.
+
+    Devolve False se a missão foi interrompida ou acabou o tempo.
+    """
+
     curr_pos = list(rover_identity.POSITION)
     while len(curr_pos) < 3: curr_pos.append(0.0)
 
-    if not waypoints: return True
+    leg_start = time.time()
+    for t, point, target in zip(trajectory.times[1:], trajectory.points[1:], trajectory.targets[1:]):
 
-    for target in waypoints:
-        
-        while True:
-            
-            if get_status() == "charging": return False
-            
-            if time.time() - start_time > duration:
-                print(f"⚠️ TIMEOUT na missão {m_id}!")
-                return False
+        # Esperar até ao instante da amostra (sem acumular atrasos)
+        delay = leg_start + t - time.time()
+        if delay > 0: time.sleep(delay)
 
-            dx = target[0] - curr_pos[0]
-            dy = target[1] - curr_pos[1]
-            dist = math.sqrt(dx**2 + dy**2)
+        if _interrupted(): return False
 
-            if dist < 0.1:
-                curr_pos[0] = target[0]
-                curr_pos[1] = target[1]
-                break 
+        elapsed = time.time() - mission_start
+        if check_timeout and elapsed > duration:
+            log.warning("⚠️ TIMEOUT na missão %s!", m_id, extra={"mission_id": m_id})
+            return False
+
+        curr_pos[0], curr_pos[1] = point
+        rover_identity.POSITION = list(curr_pos)
+
+        send_update(sock, {
+            "rover_id": rover_identity.ROVER_ID, "mission_id": m_id,
+            "progress": round(min(99.0, (elapsed / duration) * 100), 1), "status": status,
+            "position": curr_pos,
+            "extra": {"display": message(trajectory.waypoints[target])}
+        })
 
-            step = SPEED * interval 
-            if step > dist: step = dist
-            
-            curr_pos[0] += dx * (step/dist)
-            curr_pos[1] += dy * (step/dist)
-            
-            rover_identity.POSITION = list(curr_pos)
-            
-            elapsed = time.time() - start_time
-            progress = min(99.0, (elapsed / duration) * 100)
-
-            # MENSAGEM VISUAL PARA A WEB
-            display_msg = f"{desc} -> [{target[0]:.1f}, {target[1]:.1f}]"
-
-            send(sock, ML_UPDATE, {
-                "rover_id": rover_identity.ROVER_ID, "mission_id": m_id,
-                "progress": round(progress, 1), "status": "in_progress", 
-                "position": curr_pos, 
-                "extra": {"display": display_msg} 
-            })
-            
-            time.sleep(interval)
-            
     return True
 
+def navigate_waypoints(sock, m_id, waypoints, duration, interval, desc="A mover"):
+    """Navega por uma série de waypoints em dado tempo, enviando updates."""
+    
+    if not waypoints: return True
+
+    trajectory = planning.plan_trajectory(rover_identity.POSITION, waypoints, SPEED, interval)
+
+    # MENSAGEM VISUAL PARA A WEB
+    def message(target): return f"{desc} -> [{target[0]:.1f}, {target[1]:.1f}]"
+
+    return follow_trajectory(sock, m_id, trajectory, time.time(), duration, message)
+
 def run_mission(sock):
     """Executa a missão atualmente atribuída ao rover."""
     
@@ -133,7 +254,7 @@ def run_mission(sock):
     duration = float(m.get("duration", 60))
     interval = float(m.get("update_interval", 5))
     
-    print(f">>> INICIAR {task} ({duration}s)")
+    log.info(">>> INICIAR %s (%ss)", task, duration)
     
     success = False
     start_time = time.time()
@@ -145,25 +266,7 @@ def run_mission(sock):
             
             area = m.get("area", [[0,0],[10,10]])
             res = float(m.get("resolution", 1.0))
-            waypoints = []
-            min_x, min_y = area[0]
-            max_x, max_y = area[1]
-            
-            # Ponto inicial
-            waypoints.append([min_x, min_y])
-            
-            lines = int((max_y - min_y) / res) + 1
-            d = 1
-            cy = min_y
-            
-            for _ in range(lines):
-                
-                tx = max_x if d==1 else min_x
-                waypoints.append([tx, cy])
-                if cy < max_y: 
-                    cy = min(max_y, cy + res)
-                    waypoints.append([tx, cy])
-                d *= -1
+            waypoints = planning.lawnmower(area, res)
             
             # Usa a navegação genérica com mensagem personalizada
             success = navigate_waypoints(sock, m_id, waypoints, duration, interval, "Mapeando")
@@ -179,17 +282,12 @@ def run_mission(sock):
             curr_pos = list(rover_identity.POSITION)
             while len(curr_pos) < 3: curr_pos.append(0.0)
 
-            # 1. Calcular tempo necessário de viagem (Total Distance)
-            
-            total_dist = 0
-            temp_p = list(curr_pos)
-            
-            for p in points:
-                d = math.sqrt((p[0]-temp_p[0])**2 + (p[1]-temp_p[1])**2)
-                total_dist += d
-                temp_p = list(p)
-            
-            travel_time = total_dist / SPEED
+            # 1. Ordem de visita mais curta (a não ser que a missão a imponha)
+            if m.get("optimize_route", True):
+                points = planning.order_points(curr_pos, points)
+
+            # Tempo necessário de viagem (Total Distance)
+            travel_time = planning.path_length(points, curr_pos) / SPEED
             
             # 2. O tempo que sobra é dividido para "trabalhar" em cada ponto
             
@@ -197,43 +295,19 @@ def run_mission(sock):
             
             time_per_point = work_time / len(points) if points else 0
             
-            print(f"[INFO] Viagem: {travel_time:.1f}s | Recolha/ponto: {time_per_point:.1f}s")
+            log.info("Viagem: %.1fs | Recolha/ponto: %.1fs", travel_time, time_per_point)
 
             for i, target in enumerate(points):
                 
-                if get_status() == "charging": break
+                if _interrupted(): break
                 if (time.time() - start_time) > duration: break
 
                 # FASE A: Viajar até ao ponto
-                while True:
-                    
-                    dx = target[0] - curr_pos[0]
-                    dy = target[1] - curr_pos[1]
-                    dist = math.sqrt(dx**2 + dy**2)
-                    if dist < 0.1: 
-                        curr_pos[0], curr_pos[1] = target[0], target[1]
-                        break 
-                    
-                    step = SPEED * interval
-                    if step > dist: step = dist
-                    
-                    curr_pos[0] += dx * (step/dist)
-                    curr_pos[1] += dy * (step/dist)
-                    
-                    rover_identity.POSITION = list(curr_pos)
-                    
-                    elapsed = time.time() - start_time
-                    progress = min(99.0, (elapsed / duration) * 100)
-                    
-                    # Mensagem: "A ir para Ponto X"
-                    
-                    send(sock, ML_UPDATE, {
-                        "rover_id": rover_identity.ROVER_ID, "mission_id": m_id,
-                        "progress": round(progress, 1), "status": "moving", "position": curr_pos,
-                        "extra": {"display": f"A ir para Ponto {i+1}..."} 
-                    })
-                    
-                    time.sleep(interval)
+                leg = planning.plan_trajectory(curr_pos, [target], SPEED, interval)
+                if not follow_trajectory(sock, m_id, leg, start_time, duration,
+                                         lambda _, i=i: f"A ir para Ponto {i+1}...",
+                                         "moving", check_timeout=False): break
+                curr_pos = list(rover_identity.POSITION)
 
                 # FASE B: Recolher (Gastar o tempo extra aqui)
                 
@@ -241,14 +315,14 @@ def run_mission(sock):
                 
                 while (time.time() - collect_start) < time_per_point:
                     
-                    if get_status() == "charging": break
+                    if _interrupted(): break
                     if (time.time() - start_time) > duration: break
                     
                     elapsed = time.time() - start_time
                     progress = min(99.0, (elapsed / duration) * 100)
                     
                     # Mensagem: "A recolher [Tipo]..."
-                    send(sock, ML_UPDATE, {
+                    send_update(sock, {
                         "rover_id": rover_identity.ROVER_ID, "mission_id": m_id,
                         "progress": round(progress, 1), "status": "collecting", "position": curr_pos,
                         "extra": {"display": f"A recolher {stype}...", "sample": stype}
@@ -257,7 +331,7 @@ def run_mission(sock):
                     remaining_work = time_per_point - (time.time() - collect_start)
                     time.sleep(min(interval, remaining_work))
 
-            if (time.time() - start_time) <= (duration + 5) and get_status() != "charging":
+            if (time.time() - start_time) <= (duration + 5) and not _interrupted():
                 success = True
 
         
@@ -270,7 +344,7 @@ def run_mission(sock):
             
             while (time.time() - start_t) < duration:
                 
-                if get_status() == "charging": success=False; break
+                if _interrupted(): success=False; break
                 
                 # A. Movimento Constante (Trigonometria)
                 # Garante velocidade = 1.0 m/s em qualquer direção
@@ -317,16 +391,16 @@ def run_mission(sock):
                 if not msg_parts: msg_parts.append("Analisando...")
                 extra_data["display"] = " | ".join(msg_parts)
 
-                send(sock, ML_UPDATE, {
+                send_update(sock, {
                     "rover_id": rover_identity.ROVER_ID, "mission_id": m_id,
                     "progress": round(progress, 1), "status": "in_progress", 
                     "position": rover_identity.POSITION, "extra": extra_data
                 })
                 time.sleep(interval)
             
-            if get_status() != "charging": success = True
+            if not _interrupted(): success = True
 
-    except Exception as e: print(f"Erro: {e}")
+    except Exception as e: log.exception("Erro na missão: %s", e)
 
 
     final_status = "completed" if success else "incomplete"
@@ -334,21 +408,31 @@ def run_mission(sock):
     if not success and get_status() == "charging":
         
         final_status = "aborted"
-        print(f"[{rover_identity.ROVER_ID}] Missão ABORTADA (Bateria).")
+        log.warning("%s Missão ABORTADA (Bateria).", rover_identity.ROVER_ID, extra={"mission_id": m_id})
+
+    elif not success and _cancel_requested == m_id:
+
+        final_status = "aborted"
+        log.info("%s Missão CANCELADA (substituída por outra mais prioritária).", rover_identity.ROVER_ID,
+                 extra={"mission_id": m_id})
     
     # Garante 3D no envio final
     pos_final = list(rover_identity.POSITION)
     
     while len(pos_final) < 3: pos_final.append(0.0)
 
-    send(sock, ML_COMPLETE, {
+    # Os updates em lote têm de chegar antes do COMPLETE
+    if _batcher is not None: _batcher.flush()
+
+    send_reliable(ML_COMPLETE, {
         "rover_id": rover_identity.ROVER_ID, "mission_id": m_id,
         "progress": 100 if success else 0, 
         "status": final_status,
         "position": pos_final
     })
     
-    print(f"\n[{rover_identity.ROVER_ID}] 🏁 MISSÃO {m_id} CONCLUÍDA ({final_status.upper()}).\n")
+    log.info("%s 🏁 MISSÃO %s CONCLUÍDA (%s).", rover_identity.ROVER_ID, m_id, final_status.upper(),
+             extra={"mission_id": m_id})
     
     rover_identity.save_state()
     
@@ -358,12 +442,22 @@ def run_mission(sock):
 def start_missionlink():
     """Inicia o cliente MissionLink."""
     
+    global _reliable, _batcher
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.settimeout(2.0)
+
+    def give_up(_, seq):
+        log.warning("Sem confirmação da Nave-Mãe (seq=%s).", seq)
+
+    _reliable = ReliableSender(lambda _, pkt: sock.sendto(pkt, ML_SERVER), on_give_up=give_up)
+    if BATCH_UPDATES:
+        _batcher = UpdateBatcher(lambda pkt: sock.sendto(pkt, ML_SERVER))
     
     threading.Thread(target=handle_server_messages, args=(sock,), daemon=True).start()
+    threading.Thread(target=_retransmit_loop, daemon=True).start()
     
-    print("[ML] Cliente iniciado. À espera de missões...")
+    log.info("Cliente iniciado. À espera de missões...")
 
     while True:
         
@@ -373,7 +467,9 @@ def start_missionlink():
             
             elif get_status() == "idle":
                 send(sock, ML_REQUEST, {"rover_id": rover_identity.ROVER_ID})
-                time.sleep(3)
+                # A Nave-Mãe envia a missão assim que a tiver; não esperar os 3 s
+                _mission_event.wait(3)
+                _mission_event.clear()
             elif get_status() == "charging": time.sleep(2)
             
         except: break
\ No newline at end of file
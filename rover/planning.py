@@ -0,0 +1,182 @@
+# rover/planning.py
+"""Planeamento de trajetos das missões do rover.
+
+  - lawnmower(): percurso em ziguezague (boustrophedon) que cobre uma área;
+  - order_points(): ordem de visita dos pontos de recolha (vizinho mais
+    próximo seguido de 2-opt), para encurtar a viagem;
+  - plan_trajectory(): o trajeto todo amostrado de antemão, um ponto por
+    tick, com o instante em que o rover lá está. O loop da missão só tem
+    de percorrer as amostras.
+"""
+import bisect
+import math
+
+
+def _xy(p):
+    return (float(p[0]), float(p[1]))
+
+def path_length(points, start=None):
+    """Comprimento do percurso (a partir de 'start', se indicado)."""
+
+    pts = ([_xy(start)] if start is not None else []) + [_xy(p) for p in points]
+    return sum(math.dist(a, b) for a, b in zip(pts, pts[1:]))
+
+
+def lawnmower(area, resolution=1.0):
+    """Waypoints que varrem 'area' ([[min_x, min_y], [max_x, max_y]]) em linhas
+    horizontais separadas de 'resolution', alternando o sentido."""
+
+    (min_x, min_y), (max_x, max_y) = _xy(area[0]), _xy(area[1])
+    resolution = float(resolution)
+    if resolution <= 0:
+        raise ValueError("resolution tem de ser positiva")
+
+    lines = int((max_y - min_y) / resolution) + 1
+    ys = [min(max_y, min_y + i * resolution) for i in range(lines)]
+    if ys[-1] < max_y:
+        ys.append(max_y)   # A última linha fica sempre no limite da área
+
+    waypoints = [[min_x, min_y]]
+    for i, y in enumerate(ys):
+        start, end = (min_x, max_x) if i % 2 == 0 else (max_x, min_x)
+        if waypoints[-1] != [start, y]:
+            waypoints.append([start, y])
+        waypoints.append([end, y])
+    return waypoints
+
+
+# =========================================================
+# Ordem de visita dos pontos (TSP aberto a partir do rover)
+# =========================================================
+
+TWO_OPT_PASSES = 20   # voltas do 2-opt, no máximo (para quando já não melhora)
+
+def _nearest_neighbour(start, points):
+    left = list(range(len(points)))
+    order = []
+    here = start
+    while left:
+        best = min(left, key=lambda i: math.dist(here, points[i]))
+        left.remove(best)
+        order.append(best)
+        here = points[best]
+    return order
+
+def _two_opt(start, points, order):
+    # Percurso aberto: inverter route[i..j] troca as arestas (i-1, i) e (j, j+1);
+    # se j for o último ponto, a aresta (j, j+1) não existe
+    nodes = [start] + points
+    route = [0] + [i + 1 for i in order]
+    n = len(route)
+
+    for _ in range(TWO_OPT_PASSES):
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                a, b, c = nodes[route[i - 1]], nodes[route[i]], nodes[route[j]]
+                before = math.dist(a, b)
+                after = math.dist(a, c)
+                if j + 1 < n:
+                    d = nodes[route[j + 1]]
+                    before += math.dist(c, d)
+                    after += math.dist(b, d)
+                if after < before - 1e-9:
+                    route[i:j + 1] = route[i:j + 1][::-1]
+                    improved = True
+        if not improved:
+            break
+    return [k - 1 for k in route[1:]]
+
+def order_points(start, points):
+    """Pontos de 'points' pela ordem em que devem ser visitados a partir de
+    'start' (vizinho mais próximo + 2-opt). Devolve uma lista nova."""
+
+    if len(points) < 2:
+        return list(points)
+
+    xy = [_xy(p) for p in points]
+    order = _two_opt(_xy(start), xy, _nearest_neighbour(_xy(start), xy))
+    return [points[i] for i in order]
+
+
+# =========================================================
+# Trajeto pré-calculado
+# =========================================================
+
+class Trajectory:
+    """Amostras do trajeto: instante (s desde o início), posição [x, y] e
+    índice do waypoint para onde o rover se dirige."""
+
+    __slots__ = ("times", "points", "targets", "waypoints")
+
+    def __init__(self, times, points, targets, waypoints):
+        self.times = times
+        self.points = points
+        self.targets = targets
+        self.waypoints = waypoints
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def duration(self):
+        return self.times[-1] if self.times else 0.0
+
+    def position_at(self, t):
+        """Posição interpolada no instante t (presa aos extremos)."""
+
+        times = self.times
+        if not times:
+            return None
+        i = bisect.bisect_right(times, t)
+        if i == 0:
+            return list(self.points[0])
+        if i >= len(times):
+            return list(self.points[-1])
+        t0, t1 = times[i - 1], times[i]
+        (x0, y0), (x1, y1) = self.points[i - 1], self.points[i]
+        f = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+        return [x0 + (x1 - x0) * f, y0 + (y1 - y0) * f]
+
+
+def plan_trajectory(start, waypoints, speed, dt):
+    """Trajeto de 'start' pelos waypoints, a 'speed' m/s, amostrado de dt em dt
+    segundos. A primeira amostra é 'start' (t = 0) e a última o destino
+    final, no instante em que lá chega."""
+
+    if speed <= 0 or dt <= 0:
+        raise ValueError("speed e dt têm de ser positivos")
+
+    here = _xy(start)
+    times, points, targets = [0.0], [list(here)], [0]
+
+    # Segmentos com a distância acumulada no fim de cada um
+    segments = []
+    total = 0.0
+    for index, wp in enumerate(waypoints):
+        wp = _xy(wp)
+        length = math.dist(here, wp)
+        if length > 0:
+            segments.append((here, wp, total, total + length, index))
+            total += length
+        here = wp
+
+    step = speed * dt
+    k = 1
+    seg = 0
+    while segments and k * step < total:
+        s = k * step
+        while segments[seg][3] < s:
+            seg += 1
+        (x0, y0), (x1, y1), d0, d1, index = segments[seg]
+        f = (s - d0) / (d1 - d0)
+        times.append(k * dt)
+        points.append([x0 + (x1 - x0) * f, y0 + (y1 - y0) * f])
+        targets.append(index)
+        k += 1
+
+    if segments:
+        times.append(total / speed)
+        points.append(list(segments[-1][1]))
+        targets.append(segments[-1][4])
+    return Trajectory(times, points, targets, [list(_xy(w)) for w in waypoints])
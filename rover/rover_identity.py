@@ -1,5 +1,6 @@
 import os
 import json
+import logging
 
 from typing import Optional
 ROVER_ID: Optional[str] = None #no core
@@ -14,6 +15,8 @@ SPEED = 0.0                  # m/s (aprox.)
 
 STATE_DIR = "rover_data"
 
+log = logging.getLogger("ROVER")   # o mesmo que common.log.get_logger("ROVER")
+
 
 def _state_file():
     """Devolve o caminho do ficheiro de estado deste rover."""
@@ -88,4 +91,4 @@ def choose_rover_id():
     ROVER_ID = rid
     load_state()
     
-    print(f"[{ROVER_ID}] Estado inicial: pos={POSITION} | batt={BATTERY:.1f}%")
+    log.info("%s Estado inicial: pos=%s | batt=%.1f%%", ROVER_ID, POSITION, BATTERY)
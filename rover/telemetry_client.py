@@ -1,10 +1,13 @@
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import math
 import socket
 import time
-import random
 from common.codec import encode_msg
+from common.protocol_constants import PROTOCOL_VERSION, TS_UPDATE, TS_HEARTBEAT, TS_DELTA
+from common.energy import CHARGE_START_IDLE, CHARGE_START_MISSION, compute_battery
+from common.log import get_logger
 from missionlink_client import set_status
 import rover_identity
 
@@ -12,13 +15,27 @@ import rover_identity
 SERVER = ("10.0.3.20",6000)  # IP DA NAVE-MÃE NO CORE
 SEQ = 1
 
+log = get_logger("TS")
+
+# Envio adaptativo: só vai o que mudou para lá das zonas mortas; se nada
+# mudou, um heartbeat de tempos a tempos para a Nave-Mãe não dar o rover
+# como offline (timeout de 15 s)
+DELTA_TELEMETRY = True      # False: TS_UPDATE completo quando algo muda (servidores antigos)
+POSITION_DEADBAND = 0.5     # metros
+BATTERY_DEADBAND = 1.0      # pontos percentuais
+INTERVAL_MISSION = 1.0      # segundos entre amostras durante uma missão
+INTERVAL_IDLE = 2.0         # segundos entre amostras parado ou a carregar
+HEARTBEAT_INTERVAL = 10.0   # silêncio máximo (com a amostragem, fica abaixo dos 15 s)
+FULL_REFRESH = 60.0         # TS_UPDATE completo de tempos a tempos (ressincroniza)
+SAVE_INTERVAL = 20.0        # segundos entre gravações do estado do rover
+
 def send(sock, action, payload):
     """Envia uma mensagem codificada para o servidor."""
     
     global SEQ
     
     pkt = encode_msg(
-        version=1,
+        version=PROTOCOL_VERSION,
         msg_type=2,    # TelemetryStream
         action=action,
         seq=SEQ,
@@ -28,35 +45,64 @@ def send(sock, action, payload):
     sock.sendall(pkt)
     SEQ = (SEQ + 1) % 65536
 
-#bateria consumo por segundo
-CONSUMPTION = {
-    "idle": 0.10,
-    "in_mission": 0.10,
-    "scan_area": 0.15,
-    "collect_sample": 0.20,
-    "analyze_environment": 0.12,
-}
-
-def compute_battery(batt, status, task, dt):
-    """Calcula o novo nível de bateria com base no estado e tarefa atuais."""
-    
-    # Regra 1: Se o estado for "charging", carrega
-    if status == "charging":
-        
-        return min(100.0, batt + (1.0 * dt))  # carrega 1%/s
-
-    if batt <= 0:
-        
-        return 0.0
-
-    # Regra 2: Se não estiver a carregar, consome
-    base = CONSUMPTION.get(status, 0.10)
-    extra = CONSUMPTION.get(task, 0.0)
-
-    drain = (base + extra) * dt
-    batt = max(0.0, batt - drain)
-    
-    return batt
+class TelemetryReporter:
+    """Decide o que enviar em cada amostra: TS_UPDATE completo, TS_DELTA com
+    os campos que mudaram, TS_HEARTBEAT, ou nada.
+
+    As zonas mortas comparam com o último valor enviado (não com a amostra
+    anterior), por isso uma deriva lenta acaba sempre por ser reportada.
+    """
+
+    def __init__(self, rover_id, position_deadband=POSITION_DEADBAND, battery_deadband=BATTERY_DEADBAND,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, full_refresh=FULL_REFRESH, delta=DELTA_TELEMETRY):
+        self.rover_id = rover_id
+        self.position_deadband = position_deadband
+        self.battery_deadband = battery_deadband
+        self.heartbeat_interval = heartbeat_interval
+        self.full_refresh = full_refresh
+        self.delta = delta
+
+        self._sent = None        # último estado enviado
+        self._last_send = 0.0
+        self._last_full = 0.0
+
+    @staticmethod
+    def interval(status):
+        """Segundos até à próxima amostra (mais curto durante missões)."""
+
+        return INTERVAL_MISSION if status == "in_mission" else INTERVAL_IDLE
+
+    def report(self, now, position, battery, speed, status):
+        """Devolve (action, payload) a enviar agora, ou None."""
+
+        current = {"position": list(position), "battery": battery, "speed": speed, "status": status}
+        sent = self._sent
+
+        changed = {}
+        if sent is not None:
+            if math.dist(position, sent["position"]) >= self.position_deadband:
+                changed["position"] = current["position"]
+            if abs(battery - sent["battery"]) >= self.battery_deadband:
+                changed["battery"] = battery
+            if speed != sent["speed"]:
+                changed["speed"] = speed
+            if status != sent["status"]:
+                changed["status"] = status
+
+        if sent is None or now - self._last_full >= self.full_refresh or (changed and not self.delta):
+            self._sent = current
+            self._last_send = self._last_full = now
+            return TS_UPDATE, {"rover_id": self.rover_id, **current, "timestamp": now}
+
+        if changed:
+            sent.update(changed)
+            self._last_send = now
+            return TS_DELTA, {"rover_id": self.rover_id, "timestamp": now, **changed}
+
+        if now - self._last_send >= self.heartbeat_interval:
+            self._last_send = now
+            return TS_HEARTBEAT, {"rover_id": self.rover_id, "timestamp": now}
+        return None
 
 
 def telemetry_loop(sock, get_current_position, get_current_status, get_current_task, battery_ref):
@@ -64,9 +110,10 @@ def telemetry_loop(sock, get_current_position, get_current_status, get_current_t
     
     last = time.time()
     set_status_fn = set_status 
-    
-    # Adicionar um contador para evitar guardar em disco a cada 2s
-    save_counter = 0
+    reporter = TelemetryReporter(rover_identity.ROVER_ID)
+
+    # Guardar em disco só de SAVE_INTERVAL em SAVE_INTERVAL segundos
+    last_save = last
 
     try:
         
@@ -85,11 +132,11 @@ def telemetry_loop(sock, get_current_position, get_current_status, get_current_t
             batt = round(battery_ref.BATTERY, 1)
 
             # LÓGICA DE ESTADO DA BATERIA
-            if batt < 20 and status_antes == "idle":
+            if batt < CHARGE_START_IDLE and status_antes == "idle":
                 
                 set_status_fn("charging")
                 
-            elif batt < 5 and status_antes == "in_mission":
+            elif batt < CHARGE_START_MISSION and status_antes == "in_mission":
                 
                 set_status_fn("charging")
                 
@@ -98,37 +145,22 @@ def telemetry_loop(sock, get_current_position, get_current_status, get_current_t
                 
             
             status_final = get_current_status()
+            speed = 1.0 if status_final == "in_mission" else 0.0
 
-            payload = {
-                "rover_id": rover_identity.ROVER_ID,
-                "position": pos,
-                "battery": batt,
-                "speed": 1.0 if status_final == "in_mission" else 0.0,
-                "status": status_final,
-                "timestamp": now,
-            }
-            
-            send(sock, 2, payload) # action=2 → telemetry update
+            message = reporter.report(now, pos, batt, speed, status_final)
+            if message is not None:
+                send(sock, *message)
 
-            # Salva o estado para o disco a cada 10 ciclos (a cada 20 segundos)
-            save_counter += 1
-            
-            if save_counter >= 10: 
+            if now - last_save >= SAVE_INTERVAL:
                 
                 rover_identity.save_state()
-                save_counter = 0
-            
-
-            # Heartbeat ocasional
-            
-            if random.random() < 0.15:
-                send(sock, 4, {"rover_id": rover_identity.ROVER_ID, "timestamp": now})
+                last_save = now
 
-            time.sleep(2)
+            time.sleep(reporter.interval(status_final))
 
     except KeyboardInterrupt:
         
-        print(f"[{rover_identity.ROVER_ID}] TS encerrado manualmente.")
+        log.info("%s TS encerrado manualmente.", rover_identity.ROVER_ID)
         
         try:
             
@@ -137,7 +169,7 @@ def telemetry_loop(sock, get_current_position, get_current_status, get_current_t
             pass
         
     except (BrokenPipeError, ConnectionResetError):
-        print(f"[{rover_identity.ROVER_ID}] Ligação TS perdida.")
+        log.warning("%s Ligação TS perdida.", rover_identity.ROVER_ID)
         
     finally:
         # SALVA O ESTADO UMA ÚLTIMA VEZ NO FINAL
@@ -155,7 +187,7 @@ def start_telemetry(get_pos, get_status, get_task, battery_ref):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect(SERVER)
 
-    print(f"[{rover_identity.ROVER_ID}] Ligado ao TelemetryStream.")
+    log.info("%s Ligado ao TelemetryStream.", rover_identity.ROVER_ID)
 
     send(sock, 1, {"rover_id": rover_identity.ROVER_ID, "timestamp": time.time()})  # CONNECT
 